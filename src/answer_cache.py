@@ -0,0 +1,157 @@
+"""Module providing a bounded cache of answers looked up by query similarity."""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional
+
+import numpy as np
+
+class SemanticAnswerCache: # pylint: disable=R0902
+    """Thread-safe cache of answers keyed by the embedding of the question they answer.
+
+    A lookup returns the stored answer whose question embedding is most similar to
+    the query embedding, if that cosine similarity reaches `threshold`, so
+    paraphrases of an answered question reuse its answer. Answers are only shared
+    within the same collection and `context` (for example the number of sources and
+    the prompt), and every answer for a collection is dropped as soon as a lookup
+    or store sees a newer collection version. At most `max_size` answers are kept,
+    evicting the least recently used; a `max_size` of 0 disables the cache.
+    """
+
+    def __init__(self, max_size: int, threshold: float, ttl_seconds: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._vectors = None
+        self._entries = OrderedDict()
+        self._by_scope = {}
+        self._versions = {}
+        self._free = list(range(max_size - 1, -1, -1))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, collection: str, version: int, context: Hashable,
+            vector: List[float]) -> Any:
+        """Return the answer stored for the most similar past question, if similar enough.
+
+        Args:
+            collection: The collection the answer was generated from.
+            version: The current version of the collection.
+            context: Everything besides the question that the answer depends on.
+            vector: The embedding of the question.
+
+        Returns:
+            The cached answer, or None if no stored question is similar enough.
+        """
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            self._check_version(collection, version)
+            slots = self._by_scope.get((collection, context))
+            if slots:
+                rows = np.fromiter(slots, dtype=np.intp, count=len(slots))
+                scores = self._vectors[rows] @ self._unit(vector)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    slot = int(rows[best])
+                    _, stored_at, answer = self._entries[slot]
+                    if self.ttl_seconds is None or self._clock() - stored_at < self.ttl_seconds:
+                        self._entries.move_to_end(slot)
+                        self.hits += 1
+                        return answer
+                    self._remove(slot)
+                    self.evictions += 1
+            self.misses += 1
+            return None
+
+    def put(self, collection: str, version: int, context: Hashable, # pylint: disable=R0913
+            vector: List[float], answer: Any):
+        """Store the answer to a question, evicting the least recently used answer if full.
+
+        Args:
+            collection: The collection the answer was generated from.
+            version: The version of the collection the answer was generated from.
+            context: Everything besides the question that the answer depends on.
+            vector: The embedding of the question.
+            answer: The answer to store.
+        """
+        if self.max_size <= 0:
+            return
+        unit = self._unit(vector)
+        with self._lock:
+            self._check_version(collection, version)
+            if self._versions[collection] != version:
+                return
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_size, unit.shape[0]), dtype=np.float32)
+            if not self._free:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            slot = self._free.pop()
+            scope = (collection, context)
+            self._vectors[slot] = unit
+            self._entries[slot] = (scope, self._clock(), answer)
+            self._by_scope.setdefault(scope, set()).add(slot)
+
+    def clear(self):
+        """Remove every answer and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._by_scope.clear()
+            self._versions.clear()
+            self._free = list(range(self.max_size - 1, -1, -1))
+            self.hits = self.misses = self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Report how many answers are cached and how often they were reused.
+
+        Returns:
+            A dictionary with the cache size, hits, misses, evictions, capacity and
+            similarity threshold.
+        """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "max_size": self.max_size,
+                "threshold": self.threshold,
+            }
+
+    @staticmethod
+    def _unit(vector: List[float]) -> np.ndarray:
+        """Return the vector scaled to unit length, so dot products are cosine similarities."""
+        unit = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(unit)
+        return unit / norm if norm else unit
+
+    def _check_version(self, collection: str, version: int):
+        """Drop a collection's answers once a newer collection version is seen."""
+        known = self._versions.get(collection)
+        if known is not None and version <= known:
+            return
+        self._versions[collection] = version
+        if known is None:
+            return
+        for slot, (scope, _, _) in list(self._entries.items()):
+            if scope[0] == collection:
+                self._remove(slot)
+                self.evictions += 1
+
+    def _remove(self, slot: int):
+        """Free a slot and forget the answer stored in it."""
+        scope, _, _ = self._entries.pop(slot)
+        slots = self._by_scope[scope]
+        slots.discard(slot)
+        if not slots:
+            del self._by_scope[scope]
+        self._free.append(slot)
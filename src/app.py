@@ -1,15 +1,26 @@
 """Deep Thought Application"""
 
+import asyncio
 import json
+import signal
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-
-
-from src.config import Config
-from src.logging_setup import setup_logger
-from src.v1.endpoints import router as v1_router
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+
+from src.config import Config, ConfigWatcher, get_settings
+from src.embeddings import EmbeddingSource, embedding_model_name, model_registry
+from src.embeddings import query_embedding_cache, retrieval_cache
+from src.hosted_client import close_async_client
+from src.logging_setup import dropped_records, setup_logger
+from src.metrics import CONTENT_TYPE, MetricsMiddleware, metrics_registry
+from src.providers import provider_registry
+from src.request_trace import ServerTimingMiddleware
+from src.vector_store import vector_store_registry
+from src.v1.endpoints import answer_cache, request_flights, router as v1_router, spend_ledger
 from src.v2.endpoints import router as v2_router
 
 config = Config()
@@ -25,6 +36,41 @@ def custom_openapi():
     return app.openapi_schema
 
 DISABLE_SWAGGER = config.get("DISABLE_SWAGGER", "false").lower() == "true"
+EMBEDDING_WARMUP = config.get("EMBEDDING_WARMUP", "true").lower() == "true"
+
+def reload_configuration():
+    """Reload the configuration, logging a failure instead of raising it."""
+    try:
+        provider_registry.reload()
+    except Exception as err: # pylint: disable=W0703
+        logger.error("Configuration reload failed: %s", err)
+
+def schedule_reload():
+    """Run a SIGHUP reload in a worker thread, so the event loop keeps serving requests."""
+    asyncio.get_running_loop().run_in_executor(None, reload_configuration)
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Load and warm up shared resources before the app starts accepting requests."""
+    if EMBEDDING_WARMUP:
+        load_seconds = await run_in_threadpool(model_registry.warm_up, embedding_model_name)
+        logger.info("Embedding model cold start took %.3fs", load_seconds)
+    try:
+        await run_in_threadpool(EmbeddingSource().get_database)
+    except Exception as err: # pylint: disable=W0703
+        logger.warning("Vector store setup failed, retrying on first request: %s", err)
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGHUP, schedule_reload)
+    except (AttributeError, NotImplementedError, RuntimeError):
+        logger.info("SIGHUP configuration reload is not available on this platform")
+    config_watcher = ConfigWatcher(provider_registry.reload,
+                                   get_settings().config_watch_interval)
+    config_watcher.start()
+    yield
+    config_watcher.stop()
+    await close_async_client()
+    vector_store_registry.dispose()
 
 # Note: Include a FastAPI app for each version currently supported and mount accordingly...
 
@@ -44,10 +90,84 @@ app_v2 = FastAPI(docs_url=None if DISABLE_SWAGGER else "/",
 )
 app_v2.include_router(v2_router)
 
-app = FastAPI(docs_url=None)
+app = FastAPI(docs_url=None, lifespan=lifespan)
 app.mount("/v1", app_v1)
 app.mount("/v2", app_v2)
 
+@app.get("/ready")
+def readiness():
+    """Readiness probe: report ready once the embedding model is warmed up.
+
+    Returns:
+        dict: The readiness status and the cold-start cost of loaded models.
+    """
+    ready = not EMBEDDING_WARMUP or model_registry.is_ready(embedding_model_name)
+    content = {
+        "status": "ready" if ready else "starting",
+        "embedding_models": model_registry.load_times(),
+    }
+    return JSONResponse(status_code=200 if ready else 503, content=content)
+
+@app.get("/stats")
+def stats():
+    """Report resource usage of the shared models, pools and caches.
+
+    Returns:
+        dict: Model load times, connection pool and cache statistics, and the
+            configuration of every built language model chain.
+    """
+    return {
+        "embedding_models": model_registry.load_times(),
+        "embedding_batches": model_registry.batch_stats(),
+        "vector_store_pools": vector_store_registry.stats(),
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "retrieval_cache": retrieval_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "coalesced_requests": request_flights.stats(),
+        "language_models": provider_registry.loaded(),
+    }
+
+def collect_component_metrics():
+    """Export the counters the caches, request coalescing, spend ledger and logging keep.
+
+    Returns:
+        (name, kind, documentation, samples) metric families.
+    """
+    caches = {"query_embedding": query_embedding_cache, "retrieval": retrieval_cache,
+              "answer": answer_cache}
+    cache_stats = {name: cache.stats() for name, cache in caches.items()}
+    flights = request_flights.stats()
+    return [
+        ("deep_thought_cache_hits_total", "counter", "Cache lookups that found an entry.",
+         [("deep_thought_cache_hits_total", {"cache": name}, stats["hits"])
+          for name, stats in cache_stats.items()]),
+        ("deep_thought_cache_misses_total", "counter", "Cache lookups that found no entry.",
+         [("deep_thought_cache_misses_total", {"cache": name}, stats["misses"])
+          for name, stats in cache_stats.items()]),
+        ("deep_thought_cache_entries", "gauge", "Entries held by each cache.",
+         [("deep_thought_cache_entries", {"cache": name}, stats["size"])
+          for name, stats in cache_stats.items()]),
+        ("deep_thought_coalesced_requests_total", "counter",
+         "Requests served by an identical request already in flight.",
+         [("deep_thought_coalesced_requests_total", {}, flights["coalesced"])]),
+        ("deep_thought_spend_ledger_dollars", "gauge",
+         "Total spend recorded in the spend ledger, in dollars.",
+         [("deep_thought_spend_ledger_dollars", {}, spend_ledger.total())]),
+        ("deep_thought_log_records_dropped_total", "counter",
+         "Log records dropped because the logging queue was full.",
+         [("deep_thought_log_records_dropped_total", {}, dropped_records())]),
+    ]
+
+metrics_registry.add_collector(collect_component_metrics)
+
+@app.get("/metrics")
+def metrics():
+    """Expose latency histograms and counters in the Prometheus text format.
+
+    Returns:
+        PlainTextResponse: The metrics exposition.
+    """
+    return PlainTextResponse(metrics_registry.render(), media_type=CONTENT_TYPE)
 
 cors_origins = config.get("CORS_ORIGINS", "UNDEFINED")
 origins = [origin.strip() for origin in cors_origins.split(",")]
@@ -58,6 +178,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ServerTimingMiddleware, path_prefix="/v1/")
 
 @app.exception_handler(Exception)
 def handle_exception(exc):
@@ -1,18 +1,42 @@
 """Module to handle configuration and secrets."""
 
+import dataclasses
+import logging
 import os
+import threading
+from typing import Callable, Optional
+
 from dotenv import load_dotenv
 
-CONFIG_FILE = "src/.env.config"
-SECRETS_FILE = "src/.env.secrets"
+# The files can be swapped, e.g. for a benchmark, with variables of the same name.
+CONFIG_FILE = os.environ.get("CONFIG_FILE", "src/.env.config")
+SECRETS_FILE = os.environ.get("SECRETS_FILE", "src/.env.secrets")
 
 class Config:
-    """Class to manage application configuration and secrets."""
+    """Class to manage application configuration and secrets.
+
+    The configuration and secrets files are loaded into the environment by the
+    first instance only; every module creates its own instance, and `reload`
+    re-reads the files explicitly.
+    """
+
+    _loaded = set()
+    _loaded_lock = threading.Lock()
 
     def __init__(self, config_file=CONFIG_FILE, secrets_file=SECRETS_FILE):
         """Initialize configuration by loading environment files."""
-        load_dotenv(dotenv_path=config_file, override=True)
-        load_dotenv(dotenv_path=secrets_file, override=True)
+        self.config_file = config_file
+        self.secrets_file = secrets_file
+        with Config._loaded_lock:
+            if (config_file, secrets_file) in Config._loaded:
+                return
+            Config._loaded.add((config_file, secrets_file))
+        self.reload()
+
+    def reload(self):
+        """Re-read the configuration and secrets files into the environment."""
+        load_dotenv(dotenv_path=self.config_file, override=True)
+        load_dotenv(dotenv_path=self.secrets_file, override=True)
 
     def get(self, key, default=None):
         """Retrieve a configuration value by key.
@@ -39,3 +63,236 @@ class Config:
         """
         secret_value = os.getenv(key, default)
         return secret_value if not mask else "*****"
+
+def parse_bool(value: str) -> bool:
+    """Parse a boolean setting.
+
+    Args:
+        value: "true", "false", "1", "0", "yes", "no", "on" or "off".
+
+    Returns:
+        The boolean value.
+    """
+    value = value.strip().lower()
+    if value in ("true", "1", "yes", "on"):
+        return True
+    if value in ("false", "0", "no", "off"):
+        return False
+    raise ValueError(f"not a boolean: {value!r}")
+
+SETTING_PARSERS = {str: str.strip, Optional[str]: str.strip, int: int, float: float,
+                   bool: parse_bool}
+
+SETTING_CHOICES = {
+    "hosted_model_transport": ("post", "get"),
+    "hosted_model_compression": ("gzip", "none"),
+    "vector_store_backend": ("pgvector", "mmap"),
+    "vector_index_type": ("hnsw", "ivfflat", "none"),
+    "embedding_backend": ("sentence-transformers", "onnx"),
+}
+
+@dataclasses.dataclass(frozen=True)
+class Settings: # pylint: disable=R0902
+    """Typed, validated snapshot of the app's settings.
+
+    Each field is read from the environment variable of the same name in upper
+    case. The snapshot is immutable and replaced as a whole on reload, so a
+    request never sees a mix of old and new values. Settings used to create a
+    connection pool, vector store or embedding model apply to the ones created
+    after a reload; `config_watch_interval` is only read at startup.
+    """
+
+    model_provider: str = "UNDEFINED"
+    model_temperature: float = 0.0
+    openai_model_name: str = "gpt-3.5-turbo"
+    openai_model_price: float = 0.000006
+    vertex_model_name: str = "text-bison"
+    hosted_model_name: str = "Llama2-Hosted"
+    hosted_model_uri: Optional[str] = None
+    hosted_model_transport: str = "post"
+    hosted_model_compression: str = "gzip"
+    hosted_model_batch: bool = False
+    spend_limit: float = 0.001
+    spending_warning_pct: float = 0.8
+    max_batch_queries: int = 1000
+    request_trace_enabled: bool = True
+    collection_name: str = "sample_collection"
+    vector_store_backend: str = "pgvector"
+    mmap_index_dir: str = "indexes"
+    vector_index_ef_search: int = 40
+    vector_index_probes: int = 1
+    vector_index_type: str = "hnsw"
+    vector_index_hnsw_m: int = 16
+    vector_index_hnsw_ef_construction: int = 64
+    vector_index_ivfflat_lists: int = 0
+    retrieval_cache_version_poll: float = 5.0
+    pg_pool_size: int = 5
+    pg_max_overflow: int = 10
+    pg_pool_timeout: float = 30.0
+    pg_pool_recycle: int = 1800
+    pg_pool_pre_ping: bool = True
+    embedding_backend: str = "sentence-transformers"
+    embedding_onnx_dir: str = "onnx_models"
+    embedding_onnx_quantized: bool = False
+    embedding_onnx_threads: int = 0
+    config_watch_interval: float = 5.0
+
+    @classmethod
+    def from_environment(cls, environ=None) -> "Settings":
+        """Parse and validate the settings from environment variables.
+
+        Args:
+            environ: The variables to read; defaults to `os.environ`.
+
+        Returns:
+            The settings.
+
+        Raises:
+            ValueError: If any value does not parse or is out of range, listing
+                every invalid variable.
+        """
+        environ = os.environ if environ is None else environ
+        values = {}
+        errors = []
+        for field in dataclasses.fields(cls):
+            name = field.name.upper()
+            raw = environ.get(name)
+            if raw is None:
+                continue
+            try:
+                values[field.name] = SETTING_PARSERS[field.type](raw)
+            except ValueError:
+                errors.append(f"{name}={raw!r} is not a valid {field.type.__name__}")
+        settings = cls(**values)
+        errors.extend(settings.validation_errors())
+        if errors:
+            raise ValueError(f"Invalid settings: {'; '.join(errors)}")
+        return settings
+
+    def validation_errors(self):
+        """Check the parsed values are in range.
+
+        Returns:
+            A description of every invalid value.
+        """
+        errors = [f"{name.upper()}={getattr(self, name)!r} is not one of {', '.join(choices)}"
+                  for name, choices in SETTING_CHOICES.items()
+                  if getattr(self, name) not in choices]
+        for name in ("model_temperature", "openai_model_price", "spend_limit",
+                     "spending_warning_pct", "vector_index_ivfflat_lists",
+                     "retrieval_cache_version_poll", "pg_pool_size", "pg_pool_timeout",
+                     "embedding_onnx_threads", "config_watch_interval"):
+            if getattr(self, name) < 0:
+                errors.append(f"{name.upper()}={getattr(self, name)!r} is negative")
+        for name in ("max_batch_queries", "vector_index_ef_search", "vector_index_probes"):
+            if getattr(self, name) < 1:
+                errors.append(f"{name.upper()}={getattr(self, name)!r} is less than 1")
+        # -1 means no limit on overflow connections and never recycling a connection.
+        for name in ("pg_max_overflow", "pg_pool_recycle"):
+            if getattr(self, name) < -1:
+                errors.append(f"{name.upper()}={getattr(self, name)!r} is less than -1")
+        # The ranges pgvector accepts when building an HNSW index.
+        if not 2 <= self.vector_index_hnsw_m <= 100:
+            errors.append(f"VECTOR_INDEX_HNSW_M={self.vector_index_hnsw_m!r} "
+                          f"is not between 2 and 100")
+        if not 2 * self.vector_index_hnsw_m <= self.vector_index_hnsw_ef_construction <= 1000:
+            errors.append(f"VECTOR_INDEX_HNSW_EF_CONSTRUCTION="
+                          f"{self.vector_index_hnsw_ef_construction!r} is not between "
+                          f"2 * VECTOR_INDEX_HNSW_M and 1000")
+        return errors
+
+_settings: Optional[Settings] = None # pylint: disable=C0103
+_settings_lock = threading.Lock()
+
+def get_settings() -> Settings:
+    """Return the current settings snapshot, parsing it on first use.
+
+    Returns:
+        The settings shared by every module.
+    """
+    global _settings # pylint: disable=W0603
+    settings = _settings
+    if settings is None:
+        Config()
+        with _settings_lock:
+            if _settings is None:
+                _settings = Settings.from_environment()
+            settings = _settings
+    return settings
+
+def reload_settings() -> Settings:
+    """Re-read the configuration files and atomically replace the settings snapshot.
+
+    Returns:
+        The new settings.
+
+    Raises:
+        ValueError: If the new settings are invalid; the previous snapshot is kept.
+    """
+    global _settings # pylint: disable=W0603
+    with _settings_lock:
+        Config().reload()
+        settings = Settings.from_environment()
+        _settings = settings
+    return settings
+
+class ConfigWatcher:
+    """Background thread calling a function when the configuration files change.
+
+    The files' modification times are polled, since the files may be replaced
+    by a mounted volume update rather than written in place.
+    """
+
+    def __init__(self, on_change: Callable[[], None], interval: float,
+                 paths=(CONFIG_FILE, SECRETS_FILE)):
+        self.on_change = on_change
+        self.interval = interval
+        self.paths = tuple(paths)
+        self._stop = threading.Event()
+        self._thread = None
+        self._mtimes = self._modification_times()
+
+    def _modification_times(self) -> tuple:
+        """Return the files' modification times, None for missing files."""
+        mtimes = []
+        for path in self.paths:
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def check(self) -> bool:
+        """Call the function if any file changed since the last check.
+
+        Returns:
+            Whether a change was found.
+        """
+        mtimes = self._modification_times()
+        if mtimes == self._mtimes:
+            return False
+        self._mtimes = mtimes
+        try:
+            self.on_change()
+        except Exception as err: # pylint: disable=W0703
+            logging.getLogger().error("Configuration reload failed: %s", err)
+        return True
+
+    def _run(self):
+        """Poll until stopped."""
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self):
+        """Start polling, unless the interval is zero."""
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="config-watcher",
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop polling."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
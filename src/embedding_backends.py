@@ -0,0 +1,285 @@
+"""Module for the runtimes that embedding models are run with."""
+
+import inspect
+import json
+import os
+import time
+from typing import List, Optional
+
+import numpy as np
+from langchain.schema.embeddings import Embeddings
+
+from src.config import get_settings
+from src.logging_setup import setup_logger
+
+logger = setup_logger()
+
+ONNX_SETTINGS_FILE = "embedding.json"
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_QUANTIZED_MODEL_FILE = "model.int8.onnx"
+
+PARITY_TEXTS = [
+    "What is the answer to life, the universe and everything?",
+    "How do I reset my password?",
+    "Deep Thought computed the answer over seven and a half million years.",
+    "warm up",
+    "A much longer passage that spans several sentences, so that padding and truncation "
+    "are exercised. It mentions databases, vector indexes, embeddings and language models, "
+    "and keeps going for a while to be clearly longer than the other examples in the batch.",
+]
+
+def import_onnxruntime():
+    """Import onnxruntime, which is only needed by the ONNX backend."""
+    try:
+        import onnxruntime # pylint: disable=C0415
+    except ImportError as err:
+        raise ImportError(
+            "Could not import onnxruntime python package, which EMBEDDING_BACKEND=onnx "
+            "requires. Please install it with `poetry install --extras onnx`.") from err
+    return onnxruntime
+
+def embedding_backend() -> str:
+    """Return the configured embedding backend.
+
+    Returns:
+        "sentence-transformers" or "onnx".
+    """
+    return get_settings().embedding_backend
+
+def onnx_quantized() -> bool:
+    """Return whether the ONNX backend runs the dynamically quantized model."""
+    return get_settings().embedding_onnx_quantized
+
+def onnx_model_dir(model_name: str) -> str:
+    """Return the directory an embedding model is exported to for the ONNX backend.
+
+    Args:
+        model_name: The name of the embedding model.
+
+    Returns:
+        The export directory.
+    """
+    return os.path.join(get_settings().embedding_onnx_dir, model_name.lstrip("/"))
+
+def embedding_model_key(model_name: str) -> str:
+    """Return the name under which a model's document embeddings are cached.
+
+    The full precision ONNX graph reproduces the sentence-transformers vectors, so
+    both share their cached embeddings; the quantized graph's differ slightly.
+
+    Args:
+        model_name: The name of the embedding model.
+
+    Returns:
+        The cache key for the model as configured.
+    """
+    if embedding_backend() == "onnx" and onnx_quantized():
+        return f"{model_name}+onnx-int8"
+    return model_name
+
+def load_embedding_model(model_name: str) -> Embeddings:
+    """Load an embedding model with the configured backend.
+
+    Args:
+        model_name: The name of the embedding model.
+
+    Returns:
+        The embedding model.
+    """
+    if embedding_backend() == "onnx":
+        return OnnxEmbeddings(onnx_model_dir(model_name), quantized=onnx_quantized(),
+                              threads=get_settings().embedding_onnx_threads)
+    # langchain.embeddings imports every integration it ships, so it is only
+    # imported when the sentence-transformers backend is used.
+    from langchain.embeddings import HuggingFaceEmbeddings # pylint: disable=C0415
+    return HuggingFaceEmbeddings(model_name=model_name)
+
+class OnnxEmbeddings(Embeddings):
+    """Sentence embeddings computed by an exported ONNX graph on ONNX Runtime's CPU provider.
+
+    The graph only runs the transformer; tokenization, pooling and normalization
+    follow the settings the sentence-transformers model was exported with, so the
+    vectors match the ones `HuggingFaceEmbeddings` stores in existing collections.
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = False, threads: int = 0,
+                 batch_size: int = 32):
+        onnxruntime = import_onnxruntime()
+        from transformers import AutoTokenizer # pylint: disable=C0415
+        with open(os.path.join(model_dir, ONNX_SETTINGS_FILE), "r", encoding="utf-8") as file:
+            self.settings = json.load(file)
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        model_file = ONNX_QUANTIZED_MODEL_FILE if quantized else ONNX_MODEL_FILE
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        logger.info("Loaded ONNX embedding model %s from %s", self.settings["model_name"],
+                    os.path.join(model_dir, model_file))
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts in batches of similar length, returning vectors in input order."""
+        texts = [text.replace("\n", " ") for text in texts]
+        if self.settings.get("do_lower_case"):
+            texts = [text.lower() for text in texts]
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        vectors = np.empty((len(texts), self.settings["dimensions"]), dtype=np.float32)
+        for start in range(0, len(texts), self.batch_size):
+            rows = order[start:start + self.batch_size]
+            encoded = self.tokenizer([texts[row] for row in rows], padding=True, truncation=True,
+                                     max_length=self.settings["max_seq_length"],
+                                     return_tensors="np")
+            hidden = self.session.run(None, {name: encoded[name].astype(np.int64)
+                                             for name in self.input_names})[0]
+            if self.settings["pooling"] == "cls":
+                pooled = hidden[:, 0]
+            else:
+                mask = encoded["attention_mask"][:, :, None].astype(np.float32)
+                pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if self.settings["normalize"]:
+                pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            vectors[rows] = pooled
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents.
+
+        Args:
+            texts: The texts to embed.
+
+        Returns:
+            One embedding per text.
+        """
+        if not texts:
+            return []
+        return self._embed(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query.
+
+        Args:
+            text: The text to embed.
+
+        Returns:
+            The embedding.
+        """
+        return self._embed([text])[0].tolist()
+
+def _export_transformer(transformer, path: str):
+    """Export a sentence-transformers Transformer module's token embeddings as an ONNX graph."""
+    import torch # pylint: disable=C0415
+
+    sample = transformer.tokenizer(["warm up"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids")
+                   if name in sample]
+
+    class LastHiddenState(torch.nn.Module): # pylint: disable=R0903
+        """Maps positional graph inputs to the transformer's keyword arguments."""
+
+        def __init__(self):
+            super().__init__()
+            self.model = transformer.auto_model
+
+        def forward(self, *inputs):
+            """Return the token embeddings."""
+            return self.model(**dict(zip(input_names, inputs)))[0]
+
+    # Newer torch releases default to an exporter with extra dependencies.
+    options = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        options["dynamo"] = False
+    with torch.no_grad():
+        torch.onnx.export(LastHiddenState().eval(), tuple(sample[name] for name in input_names),
+                          path, input_names=input_names, output_names=["last_hidden_state"],
+                          dynamic_axes={name: {0: "batch", 1: "sequence"}
+                                        for name in input_names + ["last_hidden_state"]},
+                          opset_version=14, **options)
+
+def export_onnx_model(model_name: str, output_dir: str, quantize: bool = True) -> str:
+    """Export a sentence-transformers model for the ONNX backend.
+
+    Writes the transformer as an ONNX graph with dynamic batch and sequence axes,
+    its tokenizer, the pooling settings and, optionally, a copy of the graph with
+    dynamically quantized int8 weights.
+
+    Args:
+        model_name: The name of the embedding model.
+        output_dir: The export directory.
+        quantize: Whether to also write the quantized graph.
+
+    Returns:
+        The export directory.
+    """
+    from sentence_transformers import SentenceTransformer, models # pylint: disable=C0415
+
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0]
+    pooling = next(module for module in model if isinstance(module, models.Pooling))
+    if not (pooling.pooling_mode_cls_token or pooling.pooling_mode_mean_tokens):
+        raise ValueError(f"Unsupported pooling for the ONNX backend: "
+                         f"{pooling.get_pooling_mode_str()}")
+    os.makedirs(output_dir, exist_ok=True)
+    _export_transformer(transformer, os.path.join(output_dir, ONNX_MODEL_FILE))
+    transformer.tokenizer.save_pretrained(output_dir)
+    settings = {
+        "model_name": model_name,
+        "dimensions": model.get_sentence_embedding_dimension(),
+        "max_seq_length": transformer.max_seq_length,
+        "do_lower_case": transformer.do_lower_case,
+        "pooling": "cls" if pooling.pooling_mode_cls_token else "mean",
+        "normalize": any(isinstance(module, models.Normalize) for module in model),
+    }
+    with open(os.path.join(output_dir, ONNX_SETTINGS_FILE), "w", encoding="utf-8") as file:
+        json.dump(settings, file, indent=2)
+    if quantize:
+        import_onnxruntime()
+        from onnxruntime.quantization import QuantType, quantize_dynamic # pylint: disable=C0415
+        quantize_dynamic(os.path.join(output_dir, ONNX_MODEL_FILE),
+                         os.path.join(output_dir, ONNX_QUANTIZED_MODEL_FILE),
+                         weight_type=QuantType.QInt8)
+    logger.info("Exported embedding model %s to %s", model_name, output_dir)
+    return output_dir
+
+def compare_backends(reference: Embeddings, candidate: Embeddings,
+                     texts: Optional[List[str]] = None, repeats: int = 20) -> dict:
+    """Check that two embedding models agree, and compare their latency.
+
+    Args:
+        reference: The model whose vectors are stored in existing collections.
+        candidate: The model to compare with it.
+        texts: The texts to embed; defaults to a small built-in sample.
+        repeats: Single-query embeddings timed per text.
+
+    Returns:
+        A dictionary with the lowest and mean cosine similarity and the largest
+        absolute difference between the two models' vectors, and each model's
+        mean milliseconds per query and per document in a batch.
+    """
+    texts = texts or PARITY_TEXTS
+    expected = np.asarray(reference.embed_documents(texts), dtype=np.float32)
+    found = np.asarray(candidate.embed_documents(texts), dtype=np.float32)
+    similarity = (expected * found).sum(axis=1) / np.maximum(
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(found, axis=1), 1e-12)
+    report = {
+        "texts": len(texts),
+        "min_cosine_similarity": float(similarity.min()),
+        "mean_cosine_similarity": float(similarity.mean()),
+        "max_abs_difference": float(np.abs(expected - found).max()),
+    }
+    for name, model in (("reference", reference), ("candidate", candidate)):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for text in texts:
+                model.embed_query(text)
+        report[f"{name}_ms_per_query"] = ((time.perf_counter() - start) * 1000
+                                          / (repeats * len(texts)))
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model.embed_documents(texts)
+        report[f"{name}_ms_per_document"] = ((time.perf_counter() - start) * 1000
+                                             / (repeats * len(texts)))
+    return report
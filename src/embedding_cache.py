@@ -0,0 +1,102 @@
+"""Module providing a persistent cache of embeddings keyed by content hash and model."""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+# Keeps each lookup under SQLite's limit on bound parameters.
+MAX_HASHES_PER_QUERY = 500
+
+def content_hash(text: str) -> str:
+    """Return the SHA-256 hex digest of a text.
+
+    Args:
+        text: The text to hash.
+
+    Returns:
+        The hex digest.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """On-disk cache of float32 embeddings keyed by (content hash, model name).
+
+    Embeddings are stored in a SQLite database, so they survive across runs and
+    are reused by any collection embedded with the same model: rebuilding an
+    index or migrating documents to a new collection only embeds new content.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (model TEXT NOT NULL, hash TEXT NOT NULL, "
+            "vector BLOB NOT NULL, PRIMARY KEY (model, hash)) WITHOUT ROWID")
+        self._connection.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """Look up the cached embeddings of several texts.
+
+        Args:
+            model: The embedding model name.
+            hashes: The content hashes of the texts.
+
+        Returns:
+            The cached embeddings by content hash; texts without one are left out.
+        """
+        unique = list(dict.fromkeys(hashes))
+        found = {}
+        with self._lock:
+            for start in range(0, len(unique), MAX_HASHES_PER_QUERY):
+                chunk = unique[start:start + MAX_HASHES_PER_QUERY]
+                rows = self._connection.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN "
+                    f"({','.join('?' * len(chunk))})", [model, *chunk])
+                for digest, vector in rows:
+                    found[digest] = np.frombuffer(vector, dtype=np.float32)
+            self.hits += len(found)
+            self.misses += len(unique) - len(found)
+        return found
+
+    def put_many(self, model: str, items: Iterable[Tuple[str, np.ndarray]]):
+        """Store the embeddings of several texts.
+
+        Args:
+            model: The embedding model name.
+            items: (content hash, embedding) pairs.
+        """
+        rows = [(model, digest, np.asarray(vector, dtype=np.float32).tobytes())
+                for digest, vector in items]
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)", rows)
+            self._connection.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> dict:
+        """Report how many lookups were served from the cache.
+
+        Returns:
+            A dictionary with the cache hits and misses.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._connection.close()
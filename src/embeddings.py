@@ -1,61 +1,531 @@
 """Module for handling embeddings."""
 
-from typing import List, Union
+import os
+import queue
+import threading
+import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Dict, List, Union
 from fastapi import HTTPException
 
-from langchain.vectorstores.pgvector import PGVector
-from langchain.embeddings import HuggingFaceEmbeddings
+import numpy as np
+from langchain.schema.embeddings import Embeddings
 
-from src.config import Config
+from src.cache import LRUCache
+from src.config import Config, get_settings
+from src.embedding_backends import load_embedding_model
 from src.logging_setup import setup_logger
+from src.request_trace import time_stage
+from src.mmap_index import MmapVectorIndex, mmap_index_registry
+from src.vector_store import PooledPGVector, SearchParams, get_collection_store
 
 config = Config()
 logger = setup_logger()
 
 embedding_model_name = config.get('EMBEDDING_MODEL_NAME', "all-MiniLM-L6-v2")
 
+WARMUP_TEXT = "warm up"
+
+EMBEDDING_BATCH_SIZE = int(config.get('EMBEDDING_BATCH_SIZE', "32"))
+EMBEDDING_BATCH_WAIT_MS = float(config.get('EMBEDDING_BATCH_WAIT_MS', "2"))
+
+def normalize_query(query: str) -> str:
+    """Normalize query text so trivially different spellings share a cache entry.
+
+    Only Unicode form and whitespace are normalized, neither of which changes the
+    tokens the embedding model sees.
+
+    Args:
+        query: The query text.
+
+    Returns:
+        The normalized query text.
+    """
+    return ' '.join(unicodedata.normalize('NFKC', query).split())
+
+class EmbeddingBatcher: # pylint: disable=R0902
+    """Collects concurrent query embeddings into batched forward passes.
+
+    Each caller blocks while a background thread gathers the queued texts for up to
+    `max_wait_seconds` after the oldest one arrived, or until `max_batch_size` texts
+    are queued, embeds them with one model call and hands every caller its own
+    vector. A `max_batch_size` of 1 embeds each text directly in the calling thread.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch_size: int, max_wait_seconds: float):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self._queue = queue.SimpleQueue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._total_delay = 0.0
+        self._max_delay = 0.0
+
+    def embed(self, text: str) -> List[float]:
+        """Embed one query text as part of the next batch.
+
+        Args:
+            text: The query text.
+
+        Returns:
+            The query embedding.
+        """
+        if self.max_batch_size <= 1:
+            return self.embeddings.embed_query(text)
+        future = Future()
+        self._queue.put((text, time.perf_counter(), future))
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher",
+                                                daemon=True)
+                self._worker.start()
+        return future.result()
+
+    def _run(self):
+        """Gather queued texts into batches and embed them until closed."""
+        closed = False
+        while not closed:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = item[1] + self.max_wait_seconds
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    if remaining > 0:
+                        item = self._queue.get(timeout=remaining)
+                    else:
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    closed = True
+                    break
+                batch.append(item)
+            self._embed_batch(batch)
+
+    def _embed_batch(self, batch: list):
+        """Embed a batch of queued texts and hand each caller its vector."""
+        started = time.perf_counter()
+        texts = [text for text, _, _ in batch]
+        try:
+            if len(texts) == 1:
+                vectors = [self.embeddings.embed_query(texts[0])]
+            else:
+                vectors = self.embeddings.embed_documents(texts)
+        except Exception as err: # pylint: disable=W0703
+            for _, _, future in batch:
+                future.set_exception(err)
+            return
+        delays = [started - queued_at for _, queued_at, _ in batch]
+        with self._lock:
+            self._batch_sizes[len(batch)] += 1
+            self._total_delay += sum(delays)
+            self._max_delay = max(self._max_delay, *delays)
+        for (_, _, future), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+    def stats(self) -> dict:
+        """Report batch sizes and how long texts waited to be batched.
+
+        Returns:
+            A dictionary with the batch and text counts, the batch size histogram and
+            the average and maximum queue delay in seconds.
+        """
+        with self._lock:
+            batches = sum(self._batch_sizes.values())
+            texts = sum(size * count for size, count in self._batch_sizes.items())
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_seconds": self.max_wait_seconds,
+                "batches": batches,
+                "texts": texts,
+                "batch_size_avg": texts / batches if batches else 0.0,
+                "batch_size_counts": dict(sorted(self._batch_sizes.items())),
+                "queue_delay_avg_seconds": self._total_delay / texts if texts else 0.0,
+                "queue_delay_max_seconds": self._max_delay,
+            }
+
+    def close(self):
+        """Stop the background thread once the queued texts are embedded."""
+        with self._lock:
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            self._queue.put(None)
+            worker.join()
+
+class EmbeddingModelRegistry:
+    """Process-wide, thread-safe registry of loaded embedding models.
+
+    Each model is loaded from disk at most once per process and shared by every
+    request, instead of being rebuilt for each `EmbeddingSource`.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._batchers = {}
+        self._load_seconds = {}
+        self._warmup_seconds = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str) -> Embeddings:
+        """Return the shared model for `model_name`, loading it on first use.
+
+        Args:
+            model_name: The name of the embedding model.
+
+        Returns:
+            The loaded embedding model.
+        """
+        model = self._models.get(model_name)
+        if model is not None:
+            return model
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is None:
+                start = time.perf_counter()
+                model = load_embedding_model(model_name)
+                self._load_seconds[model_name] = time.perf_counter() - start
+                self._models[model_name] = model
+                logger.info("Loaded embedding model %s in %.3fs",
+                            model_name, self._load_seconds[model_name])
+        return model
+
+    def register(self, model_name: str, model: Embeddings):
+        """Serve `model_name` with an already loaded model instead of loading it.
+
+        Args:
+            model_name: The name of the embedding model.
+            model: The model to use.
+        """
+        with self._lock:
+            self._models[model_name] = model
+            self._load_seconds[model_name] = 0.0
+
+    def batcher(self, model_name: str) -> EmbeddingBatcher:
+        """Return the shared query batcher for `model_name`, loading the model on first use.
+
+        Args:
+            model_name: The name of the embedding model.
+
+        Returns:
+            The model's query embedding batcher.
+        """
+        batcher = self._batchers.get(model_name)
+        if batcher is not None:
+            return batcher
+        model = self.get(model_name)
+        with self._lock:
+            batcher = self._batchers.get(model_name)
+            if batcher is None:
+                batcher = EmbeddingBatcher(model, max_batch_size=EMBEDDING_BATCH_SIZE,
+                                           max_wait_seconds=EMBEDDING_BATCH_WAIT_MS / 1000)
+                self._batchers[model_name] = batcher
+        return batcher
+
+    def batch_stats(self) -> Dict[str, dict]:
+        """Report the batch sizes and queue delays of every model's query batcher.
+
+        Returns:
+            A dictionary mapping model names to batcher statistics.
+        """
+        with self._lock:
+            batchers = dict(self._batchers)
+        return {name: batcher.stats() for name, batcher in batchers.items()}
+
+    def warm_up(self, model_name: str) -> float:
+        """Load a model and run a throwaway encode so the first query is not slow.
+
+        Args:
+            model_name: The name of the embedding model.
+
+        Returns:
+            The total load and warm-up time in seconds.
+        """
+        model = self.get(model_name)
+        start = time.perf_counter()
+        model.embed_query(WARMUP_TEXT)
+        with self._lock:
+            self._warmup_seconds[model_name] = time.perf_counter() - start
+        logger.info("Warmed up embedding model %s in %.3fs",
+                    model_name, self._warmup_seconds[model_name])
+        return self._load_seconds[model_name] + self._warmup_seconds[model_name]
+
+    def is_ready(self, model_name: str) -> bool:
+        """Check whether a model has been loaded and warmed up.
+
+        Args:
+            model_name: The name of the embedding model.
+
+        Returns:
+            True if the model is ready to serve queries, False otherwise.
+        """
+        return model_name in self._warmup_seconds
+
+    def load_times(self) -> Dict[str, dict]:
+        """Report the cold-start cost of every loaded model.
+
+        Returns:
+            A dictionary mapping model names to their load and warm-up times in seconds.
+        """
+        with self._lock:
+            return {
+                name: {
+                    "load_seconds": self._load_seconds[name],
+                    "warmup_seconds": self._warmup_seconds.get(name),
+                }
+                for name in self._models
+            }
+
+    def clear(self):
+        """Drop every loaded model so the next request reloads it."""
+        with self._lock:
+            batchers = list(self._batchers.values())
+            self._batchers.clear()
+        for batcher in batchers:
+            batcher.close()
+        with self._lock:
+            self._models.clear()
+            self._load_seconds.clear()
+            self._warmup_seconds.clear()
+
+model_registry = EmbeddingModelRegistry()
+
+query_embedding_cache = LRUCache(
+    max_size=int(config.get('EMBEDDING_CACHE_SIZE', "4096")),
+    ttl_seconds=float(config.get('EMBEDDING_CACHE_TTL', "3600")),
+)
+
+retrieval_cache = LRUCache(
+    max_size=int(config.get('RETRIEVAL_CACHE_SIZE', "1024")),
+    ttl_seconds=float(config.get('RETRIEVAL_CACHE_TTL', "300")),
+)
+
+def get_cached_results(key: tuple, num_results: int) -> Union[List[dict], None]:
+    """Look up cached retrieval results for a query.
+
+    Results cached for a larger `num_results` also answer smaller ones, since the
+    top-k results are a prefix of the top-(k+n) results.
+
+    Args:
+        key: The (collection, collection version, normalized query, model, search
+            parameters) cache key.
+        num_results: Number of results requested.
+
+    Returns:
+        The cached results, or None if there is no usable entry.
+    """
+    entry = retrieval_cache.get(key)
+    if entry is None:
+        return None
+    cached_k, results = entry
+    if cached_k < num_results:
+        return None
+    return [dict(result) for result in results[:num_results]]
+
+def to_results(docs_with_score: list) -> List[dict]:
+    """Convert (document, score) pairs into the API's result dictionaries.
+
+    Args:
+        docs_with_score: The documents and scores returned by the vector store.
+
+    Returns:
+        A list of dictionaries containing the score, source and content, plus the
+        source link when the document was ingested with one.
+    """
+    results = []
+    for doc, score in docs_with_score:
+        result = {'score': score, 'source': doc.metadata['source'], 'content': doc.page_content}
+        if 'source_link' in doc.metadata:
+            result['source_link'] = doc.metadata['source_link']
+        results.append(result)
+    return results
+
+@contextmanager
+def http_errors(failure: str, status_code: int):
+    """Log any error raised in the block and raise it as an HTTP error.
+
+    Args:
+        failure: What failed, used as the error detail, e.g. "Query embedding failed".
+        status_code: The HTTP status code of the error.
+    """
+    try:
+        yield
+    except Exception as err: # pylint: disable=W0703
+        logger.warning("%s: %s", failure, err)
+        raise HTTPException(status_code=status_code, detail=failure) from err
+
 class EmbeddingSource: # pylint: disable=R0903
     """Class to handle embedding sources."""
 
     def __init__(self):
-        self.embeddings = HuggingFaceEmbeddings(model_name=embedding_model_name)
+        self.embeddings = model_registry.get(embedding_model_name)
+        self.batcher = model_registry.batcher(embedding_model_name)
+
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a query, reusing the cached vector for repeated queries.
+
+        Vectors are cached as float32 arrays keyed on the normalized query text and
+        the embedding model name. Cache misses are embedded together with other
+        concurrent queries by the model's batcher.
+
+        Args:
+            query: The query text.
+
+        Returns:
+            The query embedding.
+        """
+        with time_stage("embedding"):
+            query = normalize_query(query)
+            key = (query, embedding_model_name)
+            vector = query_embedding_cache.get(key)
+            if vector is None:
+                vector = np.asarray(self.batcher.embed(query), dtype=np.float32)
+                query_embedding_cache.put(key, vector)
+            return vector.tolist()
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed several queries with one batched forward pass for the cache misses.
+
+        Args:
+            queries: The query texts.
+
+        Returns:
+            One embedding per query, in order.
+        """
+        with time_stage("embedding"):
+            keys = [(normalize_query(query), embedding_model_name) for query in queries]
+            vectors = {key: query_embedding_cache.get(key) for key in dict.fromkeys(keys)}
+            missing = [key for key, vector in vectors.items() if vector is None]
+            if missing:
+                embedded = self.embeddings.embed_documents([query for query, _ in missing])
+                for key, vector in zip(missing, embedded):
+                    vectors[key] = np.asarray(vector, dtype=np.float32)
+                    query_embedding_cache.put(key, vectors[key])
+            return [vectors[key].tolist() for key in keys]
+
+    def get_pgvector_store(self, collection_name: str) -> PooledPGVector:
+        """Return the shared, prepared pgvector store for a collection.
 
-    def get_source(self, query: Union[str, List[str]], num_results: int) -> Union[dict, List[dict]]:
+        Args:
+            collection_name: The name of the collection.
+
+        Returns:
+            The pooled collection store.
+        """
+        return get_collection_store(collection_name, self.embeddings)
+
+    def get_database(self) -> Union[PooledPGVector, MmapVectorIndex]:
+        """Return the shared store for the configured collection.
+
+        `VECTOR_STORE_BACKEND` selects the prepared pgvector store ("pgvector") or the
+        memory-mapped index under `MMAP_INDEX_DIR` ("mmap").
+
+        Returns:
+            The collection store.
+        """
+        settings = get_settings()
+        collection_name = settings.collection_name
+        logger.debug("COLLECTION_NAME: %s", collection_name)
+        if settings.vector_store_backend == "mmap":
+            index_path = os.path.join(settings.mmap_index_dir, collection_name)
+            logger.debug("MMAP_INDEX_PATH: %s", index_path)
+            return mmap_index_registry.get_index(index_path, collection_name)
+        return self.get_pgvector_store(collection_name)
+
+    def get_source(self, query: Union[str, List[str]], num_results: int,
+                   search_params: SearchParams = None) -> Union[dict, List[dict]]:
         """Retrieve source based on the query.
 
         Args:
             query: The query text or list of texts.
             num_results: Number of results to retrieve.
+            search_params: Index search knobs, trading latency for recall.
 
         Returns:
             A dictionary or list of dictionaries containing the results.
+
+        Raises:
+            HTTPException: 401 if the vector store fails, 500 if embedding the query fails.
         """
+        search_params = search_params or SearchParams()
+        if isinstance(query, list):
+            return self.get_sources(query, num_results, search_params)
+
         logger.debug("EMBEDDING_MODEL_NAME: %s", embedding_model_name)
-        connection_string = config.get_secret(
-            'CONNECTION_STRING', "postgresql://UNDEFINED", mask=False)
-        logger.debug("CONNECTION_STRING: %s", config.get_secret('CONNECTION_STRING'))
-        collection_name = config.get('COLLECTION_NAME', "sample_collection")
-        logger.debug("COLLECTION_NAME: %s", collection_name)
         logger.debug("query: %s, num_results: %s", query, num_results)
-        try:
-            database = PGVector(
-                collection_name=collection_name,
-                connection_string=connection_string,
-                embedding_function=self.embeddings,
-            )
-        except ConnectionError as err:
-            error_message = f'PostgreSQL connection failed: {str(err)}'
-            logger.warning(error_message)
-            raise HTTPException(status_code=401, detail="PostgreSQL connection failed") from err
-        except Exception as err: # pylint: disable=W0703
-            error_message = f'PostgreSQL connection failed: {str(err)}'
-            logger.warning(error_message)
-            raise HTTPException(status_code=401, detail="PostgreSQL connection failed") from err
 
-        if isinstance(query, list):
-            query = ' '.join(query)
+        with http_errors("PostgreSQL connection failed", 401):
+            database = self.get_database()
+            cache_key = (database.collection_name, database.collection_version(),
+                         normalize_query(query), embedding_model_name, search_params)
+        results = get_cached_results(cache_key, num_results)
+        if results is not None:
+            return results
+        with http_errors("Query embedding failed", 500):
+            vector = self.embed_query(query)
+        with http_errors("PostgreSQL connection failed", 401), time_stage("vector_search"):
+            docs_with_score = database.similarity_search_with_score_by_vector(
+                vector, k=num_results, search_params=search_params)
 
-        docs_with_score = database.similarity_search_with_score(query, k=num_results)
-        results = [{'score': score, 'source': doc.metadata['source'], 'content': doc.page_content}
-                   for doc, score in docs_with_score]
+        results = to_results(docs_with_score)
+        retrieval_cache.put(cache_key, (num_results, [dict(result) for result in results]))
         return results
+
+    @staticmethod
+    def search_vectors(database, vectors: List[List[float]], num_results: int,
+                       search_params: SearchParams) -> list:
+        """Run a batched similarity search, timed as the vector search stage."""
+        with time_stage("vector_search"):
+            return database.batch_similarity_search_with_score_by_vector(
+                vectors, k=num_results, search_params=search_params)
+
+    def get_sources(self, queries: List[str], num_results: int,
+                    search_params: SearchParams = None) -> List[List[dict]]:
+        """Retrieve sources for several queries at once.
+
+        Uncached queries are embedded in one batch and searched in one database
+        round-trip.
+
+        Args:
+            queries: The query texts.
+            num_results: Number of results to retrieve per query.
+            search_params: Index search knobs, trading latency for recall.
+
+        Returns:
+            One list of result dictionaries per query, in order.
+
+        Raises:
+            HTTPException: 401 if the vector store fails, 500 if embedding the queries fails.
+        """
+        logger.debug("EMBEDDING_MODEL_NAME: %s", embedding_model_name)
+        logger.debug("queries: %s, num_results: %s", len(queries), num_results)
+
+        with http_errors("PostgreSQL connection failed", 401):
+            database = self.get_database()
+            version = database.collection_version()
+        search_params = search_params or SearchParams()
+        cache_keys = [(database.collection_name, version, normalize_query(query),
+                       embedding_model_name, search_params) for query in queries]
+        results = [get_cached_results(key, num_results) for key in cache_keys]
+        uncached = list(dict.fromkeys(
+            key for key, result in zip(cache_keys, results) if result is None))
+        batches = []
+        if uncached:
+            with http_errors("Query embedding failed", 500):
+                vectors = self.embed_queries([key[2] for key in uncached])
+            with http_errors("PostgreSQL connection failed", 401):
+                batches = self.search_vectors(database, vectors, num_results, search_params)
+
+        searched = {}
+        for key, docs_with_score in zip(uncached, batches):
+            searched[key] = to_results(docs_with_score)
+            retrieval_cache.put(key, (num_results, searched[key]))
+        return [result if result is not None else [dict(found) for found in searched[key]]
+                for key, result in zip(cache_keys, results)]
@@ -0,0 +1,62 @@
+"""Module for the HTTP connections shared by every call to the self-hosted model.
+
+Kept apart from `src.hosted_llm`, which needs langchain, so the app can close
+the connections on shutdown without importing a provider it never used.
+"""
+
+import threading
+from typing import Optional
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.config import Config
+
+config = Config()
+
+HOSTED_MODEL_TIMEOUT = float(config.get("HOSTED_MODEL_TIMEOUT", "600"))
+HOSTED_MODEL_MAX_CONNECTIONS = int(config.get("HOSTED_MODEL_MAX_CONNECTIONS", "500"))
+
+_session: Optional[requests.Session] = None # pylint: disable=C0103
+_session_lock = threading.Lock()
+_async_client: Optional[httpx.AsyncClient] = None # pylint: disable=C0103
+
+def get_session() -> requests.Session:
+    """Return the process-wide keep-alive HTTP session used for hosted model calls.
+
+    Returns:
+        The shared HTTP session.
+    """
+    global _session # pylint: disable=W0603
+    with _session_lock:
+        if _session is None:
+            adapter = HTTPAdapter(pool_maxsize=HOSTED_MODEL_MAX_CONNECTIONS)
+            _session = requests.Session()
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return the process-wide async HTTP client used for hosted model calls.
+
+    Sharing one client lets concurrent generations reuse pooled connections
+    instead of each opening its own.
+
+    Returns:
+        The shared async HTTP client.
+    """
+    global _async_client # pylint: disable=W0603
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            timeout=HOSTED_MODEL_TIMEOUT,
+            limits=httpx.Limits(max_connections=HOSTED_MODEL_MAX_CONNECTIONS,
+                                max_keepalive_connections=HOSTED_MODEL_MAX_CONNECTIONS),
+        )
+    return _async_client
+
+async def close_async_client():
+    """Close the shared async HTTP client, if it was ever opened."""
+    global _async_client # pylint: disable=W0603
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
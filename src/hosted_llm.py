@@ -1,17 +1,51 @@
 """Module for handling self-hosted LLama2 models"""
 
-from typing import Any, List, Mapping, Optional
-import requests
+import gzip
+import json
+from typing import Any, List, Mapping, Optional, Tuple
+from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun
 from langchain.callbacks.manager import CallbackManagerForLLMRun
 from langchain.llms.base import LLM
+from langchain.schema import Generation, LLMResult
 from langchain.schema.output_parser import BaseOutputParser
 
+from src.config import Config
+from src.hosted_client import HOSTED_MODEL_TIMEOUT, get_async_client, get_session
+from src.request_trace import time_stage
+
+config = Config()
+
+def encode_body(payload: dict, compress: bool) -> Tuple[bytes, dict]:
+    """Encode a request payload as JSON, gzip-compressed if requested.
+
+    Args:
+        payload: The JSON payload.
+        compress: Whether to gzip the body.
+
+    Returns:
+        The request body and its headers.
+    """
+    body = json.dumps(payload).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    if compress:
+        body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
+
 
 class HostedLLM(LLM):
     """
     Class to define interaction with the hosted LLM at a specified URI
+
+    Prompts are sent as a (by default gzip-compressed) JSON POST body over a
+    pooled keep-alive connection. Set `transport` to "get" for model servers
+    that only accept the prompt as a `text` query parameter. With `batch_prompts`
+    enabled, several prompts handed over by langchain are sent in one request.
     """
     uri: str
+    transport: str = "post"
+    compress: bool = True
+    batch_prompts: bool = False
 
     @property
     def _llm_type(self) -> str:
@@ -25,29 +59,92 @@ class HostedLLM(LLM):
     ) -> str:
         if stop is not None:
             raise ValueError("stop kwargs are not permitted.")
-        response = requests.get(self.uri,
-                                params={"text" : prompt},timeout=600)
+        if self.transport == "get":
+            response = get_session().get(self.uri, params={"text" : prompt},
+                                         timeout=HOSTED_MODEL_TIMEOUT)
+        else:
+            body, headers = encode_body({"text": prompt}, self.compress)
+            response = get_session().post(self.uri, data=body, headers=headers,
+                                          timeout=HOSTED_MODEL_TIMEOUT)
         if response.status_code == 200:
-            return str(response.content)
+            return response.text
         return f"Model Server is not Working due to error {response.status_code}"
 
+    async def _acall(self,
+                     prompt: str,
+                     stop: Optional[List[str]] = None,
+                     run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                     **kwargs: Any,
+    ) -> str:
+        if stop is not None:
+            raise ValueError("stop kwargs are not permitted.")
+        if self.transport == "get":
+            response = await get_async_client().get(self.uri, params={"text" : prompt})
+        else:
+            body, headers = encode_body({"text": prompt}, self.compress)
+            response = await get_async_client().post(self.uri, content=body, headers=headers)
+        if response.status_code == 200:
+            return response.text
+        return f"Model Server is not Working due to error {response.status_code}"
+
+    def _generate(self,
+                  prompts: List[str],
+                  stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None,
+                  **kwargs: Any,
+    ) -> LLMResult:
+        if not self.batch_prompts or len(prompts) < 2:
+            return super()._generate(prompts, stop=stop, run_manager=run_manager, **kwargs)
+        if stop is not None:
+            raise ValueError("stop kwargs are not permitted.")
+        body, headers = encode_body({"texts": prompts}, self.compress)
+        response = get_session().post(self.uri, data=body, headers=headers,
+                                      timeout=HOSTED_MODEL_TIMEOUT)
+        return self._batch_result(response.status_code, response.json, len(prompts))
+
+    async def _agenerate(self,
+                         prompts: List[str],
+                         stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                         **kwargs: Any,
+    ) -> LLMResult:
+        if not self.batch_prompts or len(prompts) < 2:
+            return await super()._agenerate(prompts, stop=stop, run_manager=run_manager,
+                                            **kwargs)
+        if stop is not None:
+            raise ValueError("stop kwargs are not permitted.")
+        body, headers = encode_body({"texts": prompts}, self.compress)
+        response = await get_async_client().post(self.uri, content=body, headers=headers)
+        return self._batch_result(response.status_code, response.json, len(prompts))
+
+    @staticmethod
+    def _batch_result(status_code: int, read_json, num_prompts: int) -> LLMResult:
+        """Turn a batch response (a JSON list with one completion per prompt) into a result."""
+        if status_code == 200:
+            texts = read_json()
+            if len(texts) != num_prompts:
+                raise ValueError(
+                    f"Model server returned {len(texts)} completions for {num_prompts} prompts")
+        else:
+            texts = [f"Model Server is not Working due to error {status_code}"] * num_prompts
+        return LLMResult(generations=[[Generation(text=text)] for text in texts])
 
     @property
     def _identifying_params(self) -> Mapping[str, Any]:
         """Get the identifying parameters."""
-        return {"uri": self.uri}
+        return {"uri": self.uri, "transport": self.transport}
 
 class CustomLlamaParser(BaseOutputParser[str]): # pylint: disable=R0903
     """Class to correctly parse model outputs"""
 
     def parse(self, text:str) -> str:
         """Parse the output of our LLM"""
-        if text.startswith("Model Server is not Working due"):
-            return text
-        cleaned = str(text).split("[/INST]")
-        return cleaned[1]
+        with time_stage("output_parsing"):
+            if text.startswith("Model Server is not Working due"):
+                return text
+            cleaned = str(text).split("[/INST]")
+            return cleaned[1]
 
     @property
     def _type(self) -> str:
         return "custom_output_parser"
-    
\ No newline at end of file
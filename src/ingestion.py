@@ -0,0 +1,458 @@
+"""Module for streaming documents into a collection in bulk."""
+
+import csv
+import io
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.schema.embeddings import Embeddings
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from src.config import Config
+from src.embedding_backends import embedding_model_key, load_embedding_model
+from src.embedding_cache import EmbeddingCache, content_hash
+from src.logging_setup import setup_logger
+from src.mmap_index import MmapIndexWriter
+from src.vector_store import IndexBuildInProgress, PooledPGVector
+
+config = Config()
+logger = setup_logger()
+
+DEFAULT_EXTENSIONS = (".md", ".txt", ".rst", ".adoc", ".html")
+
+def iter_documents(path: str, extensions: Iterable[str] = DEFAULT_EXTENSIONS,
+                   link_prefix: Optional[str] = None) -> Iterator[Document]:
+    """Stream documents from a directory tree or a JSON-lines file.
+
+    Files in a directory become one document each, with their relative path as
+    `source` and, given a `link_prefix`, the prefixed path as `source_link`. Each
+    JSON line holds a `content` (or `page_content`) field, optional `source` and
+    `source_link` fields, and any other fields are kept as metadata.
+
+    Args:
+        path: A directory, or a `.jsonl` file.
+        extensions: File extensions to read from a directory.
+        link_prefix: URL prefix for the `source_link` of files in a directory.
+
+    Yields:
+        The documents, one at a time.
+    """
+    if os.path.isdir(path):
+        extensions = tuple(extensions)
+        for root, directories, files in os.walk(path):
+            directories.sort()
+            for name in sorted(files):
+                if not name.lower().endswith(extensions):
+                    continue
+                file_path = os.path.join(root, name)
+                source = os.path.relpath(file_path, path).replace(os.sep, "/")
+                with open(file_path, "r", encoding="utf-8", errors="replace") as file:
+                    content = file.read()
+                metadata = {"source": source}
+                if link_prefix:
+                    metadata["source_link"] = link_prefix.rstrip("/") + "/" + source
+                yield Document(page_content=content, metadata=metadata)
+        return
+    with open(path, "r", encoding="utf-8") as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            content = record.pop("content", None) or record.pop("page_content", "")
+            record.setdefault("source", f"{os.path.basename(path)}:{line_number}")
+            yield Document(page_content=content, metadata=record)
+
+def iter_chunks(documents: Iterable[Document], chunk_size: int = 1000,
+                chunk_overlap: int = 200) -> Iterator[Document]:
+    """Split documents into overlapping chunks, one document at a time.
+
+    Args:
+        documents: The documents to split.
+        chunk_size: The largest chunk, in characters.
+        chunk_overlap: The characters shared by neighbouring chunks.
+
+    Yields:
+        The chunks, each carrying its document's metadata.
+    """
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    for document in documents:
+        for text in splitter.split_text(document.page_content):
+            yield Document(page_content=text, metadata=dict(document.metadata))
+
+def iter_batches(items: Iterable, batch_size: int) -> Iterator[list]:
+    """Group items into lists of at most `batch_size`.
+
+    Args:
+        items: The items to group.
+        batch_size: The largest batch.
+
+    Yields:
+        The batches.
+    """
+    iterator = iter(items)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+_worker_embeddings: Optional[Embeddings] = None # pylint: disable=C0103
+
+def load_worker_model(model_name: str):
+    """Load the embedding model once per pool process."""
+    global _worker_embeddings # pylint: disable=W0603
+    _worker_embeddings = load_embedding_model(model_name)
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """Embed a batch of texts with the pool process's model.
+
+    Args:
+        texts: The texts to embed.
+
+    Returns:
+        The float32 embeddings, one row per text.
+    """
+    return np.asarray(_worker_embeddings.embed_documents(texts), dtype=np.float32)
+
+def _lookup_cached(batch: List[Document], cache_key: str, cache: Optional[EmbeddingCache]
+                  ) -> Tuple[List[str], Dict[str, np.ndarray], Dict[str, str]]:
+    """Split a batch into the texts with a cached embedding and the texts to embed."""
+    hashes = [content_hash(chunk.page_content) for chunk in batch]
+    cached = cache.get_many(cache_key, hashes) if cache is not None else {}
+    missing = {}
+    for digest, chunk in zip(hashes, batch):
+        if digest not in cached:
+            missing.setdefault(digest, chunk.page_content)
+    return hashes, cached, missing
+
+def _merge_embeddings(hashes: List[str], cached: Dict[str, np.ndarray], # pylint: disable=R0913
+                      missing: Dict[str, str], vectors: np.ndarray, cache_key: str,
+                      cache: Optional[EmbeddingCache]) -> np.ndarray:
+    """Combine cached and new embeddings in batch order, caching the new ones."""
+    computed = dict(zip(missing, vectors))
+    if cache is not None and computed:
+        cache.put_many(cache_key, computed.items())
+    computed.update(cached)
+    return np.stack([computed[digest] for digest in hashes]).astype(np.float32, copy=False)
+
+def embed_batches(batches: Iterable[List[Document]], model_name: str, workers: int,
+                  embeddings: Optional[Embeddings] = None,
+                  cache: Optional[EmbeddingCache] = None
+                  ) -> Iterator[Tuple[List[Document], np.ndarray]]:
+    """Embed batches of chunks, in order, across a pool of processes.
+
+    At most two batches per process are queued at a time, so memory use stays
+    bounded however large the input is. With no workers, batches are embedded in
+    this process by `embeddings`. Texts found in `cache` for the model and its
+    configured backend are not embedded again, and new embeddings are added to it.
+
+    Args:
+        batches: The batches of chunks.
+        model_name: The embedding model each pool process loads.
+        workers: The number of pool processes.
+        embeddings: The model to use without a pool.
+        cache: The persistent embedding cache.
+
+    Yields:
+        Each batch with its float32 embeddings.
+    """
+    cache_key = embedding_model_key(model_name)
+    if workers <= 0:
+        embeddings = embeddings or load_embedding_model(model_name)
+        for batch in batches:
+            hashes, cached, missing = _lookup_cached(batch, cache_key, cache)
+            vectors = (np.asarray(embeddings.embed_documents(list(missing.values())),
+                                  dtype=np.float32) if missing else [])
+            yield batch, _merge_embeddings(hashes, cached, missing, vectors, cache_key, cache)
+        return
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=load_worker_model, initargs=(model_name,)) as pool:
+        pending = deque()
+        for batch in batches:
+            hashes, cached, missing = _lookup_cached(batch, cache_key, cache)
+            future = pool.submit(embed_texts, list(missing.values())) if missing else None
+            pending.append((batch, hashes, cached, missing, future))
+            # Fully cached batches at the head of the queue need no waiting.
+            while len(pending) >= 2 * workers or (pending and pending[0][4] is None):
+                yield _resolve(pending.popleft(), cache_key, cache)
+        while pending:
+            yield _resolve(pending.popleft(), cache_key, cache)
+
+def _resolve(entry: tuple, cache_key: str, cache: Optional[EmbeddingCache]
+             ) -> Tuple[List[Document], np.ndarray]:
+    """Wait for a queued batch's embeddings and merge them with its cached ones."""
+    batch, hashes, cached, missing, future = entry
+    vectors = future.result() if future is not None else []
+    return batch, _merge_embeddings(hashes, cached, missing, vectors, cache_key, cache)
+
+def format_vector(vector: np.ndarray) -> str:
+    """Format an embedding in pgvector's text representation."""
+    return "[" + ",".join(np.char.mod("%.9g", vector)) + "]"
+
+def chunk_id(chunk: Document) -> str:
+    """Return the content hash identifying a chunk: its text and metadata.
+
+    Args:
+        chunk: The chunk.
+
+    Returns:
+        The SHA-256 hex digest, stored as the chunk's `custom_id`.
+    """
+    return content_hash(json.dumps([chunk.page_content, chunk.metadata], sort_keys=True))
+
+class PgVectorCopyLoader: # pylint: disable=R0902
+    """Bulk-loads embedded chunks into a pgvector collection with COPY.
+
+    Each batch is streamed as one CSV COPY into the embedding table, instead of
+    inserting and flushing one ORM row at a time. Every row stores its chunk's
+    content hash as `custom_id`. Loading incrementally, each batch is committed,
+    chunks already stored with the same hash are skipped, and once the load
+    finishes the rows of chunks that were changed or removed from the input are
+    deleted. A full load deletes the existing rows and copies the new ones in a
+    single transaction committed by `finish`, so searches keep seeing the old
+    contents, never an empty or partial collection, until the load is complete.
+    """
+
+    def __init__(self, store: PooledPGVector, incremental: bool = False):
+        self.store = store
+        self.table = store.EmbeddingStore.__tablename__
+        self.incremental = incremental
+        self._transaction = None
+        self.existing: Set[Optional[str]] = self.existing_ids() if incremental else set()
+        self.seen: Set[str] = set()
+        self.loaded = 0
+        self.skipped = 0
+        self.deleted = 0
+
+    def existing_ids(self) -> Set[Optional[str]]:
+        """Read the content hashes of every chunk stored in the collection.
+
+        Returns:
+            The `custom_id` of every row, None for rows stored without one.
+        """
+        connection = self.store.engine_pool.engine.raw_connection()
+        try:
+            with connection.cursor(name="deep_thought_custom_ids") as cursor:
+                cursor.itersize = 10000
+                cursor.execute(f"SELECT custom_id FROM {self.table} WHERE collection_id = %s",
+                               (str(self.store.collection_id),))
+                existing = {row[0] for row in cursor}
+            connection.commit()
+        finally:
+            connection.close()
+        return existing
+
+    def delete_existing(self) -> int:
+        """Remove every chunk already stored in the collection.
+
+        In a full load the removal is only committed, together with the new
+        chunks, by `finish`.
+
+        Returns:
+            The number of chunks removed.
+        """
+        return self._delete("TRUE")
+
+    @contextmanager
+    def _cursor(self):
+        """Yield a cursor, in the open transaction of a full load or committed on exit."""
+        if not self.incremental:
+            if self._transaction is None:
+                self._transaction = self.store.engine_pool.engine.raw_connection()
+            with self._transaction.cursor() as cursor:
+                yield cursor
+            return
+        connection = self.store.engine_pool.engine.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                yield cursor
+            connection.commit()
+        finally:
+            connection.close()
+
+    def select(self, chunks: Iterable[Document]) -> Iterator[Document]:
+        """Skip the chunks that are already stored or repeated in the input.
+
+        Args:
+            chunks: The chunks to load.
+
+        Yields:
+            The chunks that need to be embedded and loaded.
+        """
+        for chunk in chunks:
+            identifier = chunk_id(chunk)
+            if identifier in self.seen or identifier in self.existing:
+                self.skipped += 1
+            else:
+                yield chunk
+            self.seen.add(identifier)
+
+    def load(self, chunks: List[Document], vectors: np.ndarray):
+        """Copy a batch of chunks and their embeddings into the collection.
+
+        Args:
+            chunks: The chunks.
+            vectors: Their embeddings, one row per chunk.
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        collection_id = str(self.store.collection_id)
+        for chunk, vector in zip(chunks, vectors):
+            writer.writerow([uuid.uuid4(), collection_id, format_vector(vector),
+                             chunk.page_content, json.dumps(chunk.metadata), chunk_id(chunk)])
+        buffer.seek(0)
+        with self._cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {self.table} (uuid, collection_id, embedding, document, cmetadata, "
+                f"custom_id) FROM STDIN WITH (FORMAT csv)", buffer)
+        self.loaded += len(chunks)
+
+    def finish(self):
+        """Remove stale chunks, index the collection and invalidate every worker's cached results.
+
+        A full load commits its transaction and rebuilds the index. An incremental
+        load leaves the index to be maintained by the inserts and deletes, and
+        changes nothing at all if every chunk was unchanged.
+        """
+        if self._transaction is not None:
+            try:
+                self._transaction.commit()
+            finally:
+                self._transaction.close()
+                self._transaction = None
+        if self.incremental:
+            if None in self.existing:
+                self.deleted += self._delete("custom_id IS NULL")
+            stale = sorted(self.existing - self.seen - {None})
+            for start in range(0, len(stale), 10000):
+                self.deleted += self._delete("custom_id = ANY(%s)", stale[start:start + 10000])
+            if not self.loaded and not self.deleted:
+                return
+        if self.store.index_type != "none":
+            try:
+                self.store.build_index(rebuild=not self.incremental)
+            except IndexBuildInProgress as err:
+                # The rows are committed, and a concurrent build indexes them as well.
+                logger.warning("%s, not rebuilding it", err)
+        self.store.bump_collection_version()
+
+    def stats(self) -> dict:
+        """Report how many chunks were skipped as unchanged and how many were deleted.
+
+        Returns:
+            A dictionary with the skipped and deleted chunk counts.
+        """
+        return {"skipped": self.skipped, "deleted": self.deleted}
+
+    def abort(self):
+        """Roll back a full load, leaving the collection as it was."""
+        if self._transaction is not None:
+            try:
+                self._transaction.rollback()
+            finally:
+                self._transaction.close()
+                self._transaction = None
+
+    def _delete(self, condition: str, *params) -> int:
+        """Delete the collection's rows matching a condition, returning how many were deleted."""
+        with self._cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE collection_id = %s AND {condition}",
+                           (str(self.store.collection_id), *params))
+            return cursor.rowcount
+
+class MmapIndexLoader:
+    """Writes embedded chunks as a new version of a memory-mapped index."""
+
+    def __init__(self, path: str):
+        self.writer = MmapIndexWriter(path)
+
+    @staticmethod
+    def select(chunks: Iterable[Document]) -> Iterable[Document]:
+        """Load every chunk, since each version of the index is written in full."""
+        return chunks
+
+    def load(self, chunks: List[Document], vectors: np.ndarray):
+        """Append a batch of chunks and their embeddings to the new index version.
+
+        Args:
+            chunks: The chunks.
+            vectors: Their embeddings, one row per chunk.
+        """
+        self.writer.add([chunk.page_content for chunk in chunks],
+                        [chunk.metadata for chunk in chunks], vectors)
+
+    def finish(self):
+        """Publish the new index version."""
+        self.writer.commit()
+
+    def abort(self):
+        """Discard the new index version."""
+        self.writer.abort()
+
+    @staticmethod
+    def stats() -> dict:
+        """Report nothing skipped or deleted, since every version is written in full."""
+        return {"skipped": 0, "deleted": 0}
+
+def ingest(chunks: Iterable[Document], loader, model_name: str, # pylint: disable=R0913,R0914
+           batch_size: int = 256, workers: int = 0, embeddings: Optional[Embeddings] = None,
+           cache: Optional[EmbeddingCache] = None, report_seconds: float = 10.0) -> dict:
+    """Embed chunks in batches and bulk-load them, reporting throughput as it goes.
+
+    Args:
+        chunks: The chunks to load.
+        loader: A `PgVectorCopyLoader` or `MmapIndexLoader`.
+        model_name: The embedding model.
+        batch_size: Chunks embedded and loaded together.
+        workers: The number of embedding processes, 0 to embed in this process.
+        embeddings: The model to use without a pool.
+        cache: The persistent embedding cache.
+        report_seconds: Seconds between progress reports.
+
+    Returns:
+        A dictionary with the number of chunks loaded, skipped as unchanged and
+        deleted as stale, the number of texts embedded and found in the cache, the
+        batches, the elapsed seconds and the chunks loaded per second.
+    """
+    start = last_report = time.perf_counter()
+    loaded = batches = 0
+    cache_stats = cache.stats() if cache is not None else {"hits": 0, "misses": 0}
+    try:
+        for batch, vectors in embed_batches(iter_batches(loader.select(chunks), batch_size),
+                                            model_name, workers, embeddings, cache):
+            loader.load(batch, vectors)
+            loaded += len(batch)
+            batches += 1
+            now = time.perf_counter()
+            if now - last_report >= report_seconds:
+                logger.info("Loaded %s chunks (%.1f chunks/s)", loaded, loaded / (now - start))
+                last_report = now
+    except BaseException:
+        loader.abort()
+        raise
+    loader.finish()
+    elapsed = time.perf_counter() - start
+    embedded, cached = loaded, 0
+    if cache is not None:
+        cached = cache.stats()["hits"] - cache_stats["hits"]
+        embedded = cache.stats()["misses"] - cache_stats["misses"]
+    stats = {
+        "chunks": loaded,
+        **loader.stats(),
+        "embedded": embedded,
+        "cached": cached,
+        "batches": batches,
+        "seconds": elapsed,
+        "chunks_per_second": loaded / elapsed if elapsed else 0.0,
+    }
+    logger.info("Loaded %s chunks (%s unchanged, %s deleted, %s embedded) in %.1fs "
+                "(%.1f chunks/s)", loaded, stats["skipped"], stats["deleted"], embedded,
+                elapsed, stats["chunks_per_second"])
+    return stats
@@ -1,6 +1,20 @@
-"""Module to set up a colored logger."""
+"""Module to set up non-blocking, structured logging.
 
+Records are put on a bounded in-memory queue and written to `debug.log` and
+stderr by a background thread, so a slow disk or terminal never holds up a
+request. Output is JSON, one object per line, unless stderr is a terminal, in
+which case it keeps the colored text format.
+"""
+
+import atexit
+import datetime
+import json
 import logging
+import logging.handlers
+import queue
+import threading
+from typing import Optional
+
 from termcolor import colored
 
 from src.config import Config
@@ -8,6 +22,31 @@ from src.config import Config
 config = Config()
 log_level = config.get("LOG_LEVEL", "INFO")
 
+LOG_FILE = config.get("LOG_FILE", "debug.log")
+LOG_FORMAT = config.get("LOG_FORMAT", "auto").lower()
+LOG_QUEUE_SIZE = int(config.get("LOG_QUEUE_SIZE", "10000"))
+LOG_MAX_ARG_LENGTH = int(config.get("LOG_MAX_ARG_LENGTH", "2000"))
+LOG_MAX_MESSAGE_LENGTH = int(config.get("LOG_MAX_MESSAGE_LENGTH", "8000"))
+
+TEXT_FORMAT = "%(levelname)s: %(asctime)s - %(message)s"
+
+# Attributes every LogRecord has; anything else was passed with `extra=`.
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+def truncate(value, max_length: int = LOG_MAX_ARG_LENGTH):
+    """Shorten a long string logged as an argument, noting how much was cut.
+
+    Args:
+        value: The logged value; anything but a string is returned unchanged.
+        max_length: The longest string kept whole.
+
+    Returns:
+        The value, truncated if it is a string longer than `max_length`.
+    """
+    if isinstance(value, str) and len(value) > max_length:
+        return f"{value[:max_length]}... [{len(value) - max_length} more characters]"
+    return value
+
 class ColoredFormatter(logging.Formatter):
     """Formatter class to color log levels."""
 
@@ -19,27 +58,144 @@ class ColoredFormatter(logging.Formatter):
         'CRITICAL': 'magenta'
     }
 
+    def __init__(self, fmt=None, datefmt=None):
+        super().__init__(fmt, datefmt)
+        self._colored_levels = {level: colored(level, color)
+                                for level, color in self.COLORS.items()}
+
+    def formatMessage(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.levelname = self._colored_levels.get(record.levelname, record.levelname)
+        return super().formatMessage(record)
+
+class JsonFormatter(logging.Formatter):
+    """Formatter writing each record as one JSON object.
+
+    Attributes passed with `extra=` are included as fields of their own.
+    """
+
     def format(self, record):
-        local_log_level = record.levelname
-        log_message = super().format(record)
-        colored_level = colored(local_log_level, self.COLORS.get(local_log_level))
-        return log_message.replace(local_log_level, colored_level)
+        entry = {
+            "time": datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
 
-def setup_logger():
-    """Set up and return a logger with colored log levels."""
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that never blocks the logging thread.
 
-    logging.basicConfig(
-        level=getattr(logging, log_level),
-        format="%(levelname)s: %(asctime)s - %(message)s",
-        handlers=[
-            logging.FileHandler("debug.log"),
-            logging.StreamHandler()
-        ]
-    )
+    When the queue is full, DEBUG and INFO records are dropped, and WARNING and
+    above replace the oldest queued record, so errors survive a burst of
+    chatter. Long string arguments, such as prompts, are truncated before the
+    message is formatted, and the formatted message is truncated too.
+    """
 
-    formatter = ColoredFormatter("%(levelname)s: %(asctime)s - %(message)s")
+    def __init__(self, log_queue: queue.Queue, max_arg_length: int = LOG_MAX_ARG_LENGTH,
+                 max_message_length: int = LOG_MAX_MESSAGE_LENGTH):
+        super().__init__(log_queue)
+        self.max_arg_length = max_arg_length
+        self.max_message_length = max_message_length
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
 
-    for handler in logging.getLogger().handlers:
-        handler.setFormatter(formatter)
+    def prepare(self, record):
+        if isinstance(record.args, tuple):
+            record.args = tuple(truncate(arg, self.max_arg_length) for arg in record.args)
+        elif isinstance(record.args, dict):
+            record.args = {key: truncate(arg, self.max_arg_length)
+                           for key, arg in record.args.items()}
+        record = super().prepare(record)
+        record.msg = record.message = truncate(record.msg, self.max_message_length)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        dropped = 1
+        if record.levelno >= logging.WARNING:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                dropped = 0
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                dropped += 1
+        with self._dropped_lock:
+            self.dropped += dropped
+
+class BlockingStopQueueListener(logging.handlers.QueueListener):
+    """Queue listener whose stop waits for room in a full queue instead of raising."""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+_handler: Optional[DroppingQueueHandler] = None # pylint: disable=C0103
+_listener: Optional[BlockingStopQueueListener] = None # pylint: disable=C0103
+_lock = threading.Lock()
+
+def output_formatter(stream) -> logging.Formatter:
+    """Return the formatter for an output, following LOG_FORMAT.
+
+    Args:
+        stream: The output stream.
+
+    Returns:
+        A JSON formatter, or the colored text formatter when LOG_FORMAT is "text"
+        (or "auto" and the stream is a terminal).
+    """
+    if LOG_FORMAT == "text" or (LOG_FORMAT == "auto" and stream.isatty()):
+        return ColoredFormatter(TEXT_FORMAT)
+    return JsonFormatter()
+
+def stop_logging():
+    """Write out the queued records and stop the background thread."""
+    global _handler, _listener # pylint: disable=W0603
+    with _lock:
+        if _listener is not None:
+            logging.getLogger().removeHandler(_handler)
+            _listener.stop()
+            _listener = None
+            _handler = None
+
+def dropped_records() -> int:
+    """Return how many log records were dropped because the queue was full.
+
+    Returns:
+        The number of dropped records.
+    """
+    handler = _handler
+    return handler.dropped if handler is not None else 0
+
+def setup_logger():
+    """Set up, once per process, and return the root logger.
 
+    Returns:
+        The root logger.
+    """
+    global _handler, _listener # pylint: disable=W0603
+    with _lock:
+        if _listener is None:
+            file_handler = logging.FileHandler(LOG_FILE)
+            file_handler.setFormatter(output_formatter(file_handler.stream))
+            stream_handler = logging.StreamHandler()
+            stream_handler.setFormatter(output_formatter(stream_handler.stream))
+            _handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+            _listener = BlockingStopQueueListener(_handler.queue, file_handler, stream_handler)
+            _listener.start()
+            root = logging.getLogger()
+            root.setLevel(getattr(logging, log_level))
+            root.addHandler(_handler)
+            atexit.register(stop_logging)
     return logging.getLogger()
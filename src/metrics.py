@@ -0,0 +1,280 @@
+"""Module providing in-process metrics in the Prometheus text exposition format."""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Sample = Tuple[str, Dict[str, str], float]
+
+def _escape(value: str) -> str:
+    """Escape a label value for the text exposition format."""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    """Format a sample value, spelling infinities the way Prometheus expects."""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+def _format_sample(name: str, labels: Dict[str, str], value: float) -> str:
+    """Format one sample line."""
+    if labels:
+        pairs = ",".join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+        return f"{name}{{{pairs}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+class Metric: # pylint: disable=R0903
+    """A named family of samples, one per combination of label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> tuple:
+        """Return the label values in label name order, checking every label is given."""
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[Sample]:
+        """Yield the (name, labels, value) samples of the family."""
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+class Counter(Metric):
+    """A value that only goes up, such as a number of requests."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        """Add to the counter.
+
+        Args:
+            amount: The non-negative amount to add.
+            **labels: The label values.
+        """
+        if amount < 0:
+            raise ValueError("Counters can only be incremented")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+class Gauge(Metric):
+    """A value that goes up and down, such as the number of requests in flight."""
+
+    kind = "gauge"
+
+    def inc(self, amount: float = 1.0, **labels):
+        """Add to the gauge.
+
+        Args:
+            amount: The amount to add.
+            **labels: The label values.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        """Subtract from the gauge.
+
+        Args:
+            amount: The amount to subtract.
+            **labels: The label values.
+        """
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        """Set the gauge.
+
+        Args:
+            value: The new value.
+            **labels: The label values.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(Metric):
+    """Counts observations, such as latencies, in cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        """Record an observation.
+
+        Args:
+            value: The observed value.
+            **labels: The label values.
+        """
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent in a `with` block, even if it raises.
+
+        Args:
+            **labels: The label values.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_count", labels, cumulative
+            yield f"{self.name}_sum", labels, total
+
+class MetricsRegistry:
+    """Process-wide collection of metrics, rendered together for scraping.
+
+    Besides the metrics it owns, collectors registered with `add_collector` are
+    called at scrape time, so counters that other components already keep (such as
+    cache hits) are exported without being counted twice.
+    """
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        """Add a metric to the registry.
+
+        Args:
+            metric: The metric.
+
+        Returns:
+            The metric.
+        """
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Create and register a counter."""
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """Create and register a gauge."""
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Create and register a histogram."""
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str,
+                                                                   List[Sample]]]]):
+        """Register a function returning (name, kind, documentation, samples) families.
+
+        Args:
+            collector: Called on every scrape.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            The exposition text.
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        families = [(metric.name, metric.kind, metric.documentation, metric.samples())
+                    for metric in metrics]
+        for collector in collectors:
+            families.extend(collector())
+        lines = []
+        for name, kind, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(_format_sample(*sample) for sample in samples)
+        return "\n".join(lines) + "\n"
+
+metrics_registry = MetricsRegistry()
+
+stage_seconds = metrics_registry.histogram(
+    "deep_thought_stage_seconds",
+    "Seconds spent in each stage of answering a request.", ["stage"])
+language_model_seconds = metrics_registry.histogram(
+    "deep_thought_language_model_seconds",
+    "Seconds spent waiting for each language model provider.", ["provider"])
+language_model_errors = metrics_registry.counter(
+    "deep_thought_language_model_errors_total",
+    "Language model calls that raised, by provider.", ["provider"])
+tokens_total = metrics_registry.counter(
+    "deep_thought_tokens_total", "Language model tokens billed.", ["provider"])
+spend_dollars_total = metrics_registry.counter(
+    "deep_thought_spend_dollars_total", "Language model spend recorded, in dollars.",
+    ["provider"])
+http_responses_total = metrics_registry.counter(
+    "deep_thought_http_responses_total", "HTTP responses sent, by status code.", ["status"])
+http_requests_in_flight = metrics_registry.gauge(
+    "deep_thought_http_requests_in_flight", "HTTP requests being handled.")
+http_request_seconds = metrics_registry.histogram(
+    "deep_thought_http_request_seconds", "Seconds from receiving a request to its response.")
+
+class MetricsMiddleware: # pylint: disable=R0903
+    """ASGI middleware counting in-flight requests and responses by status code.
+
+    Requests that raise before responding are counted as 500s.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            http_request_seconds.observe(time.perf_counter() - start)
+            http_responses_total.inc(status=status["code"])
@@ -0,0 +1,466 @@
+"""Module for a local vector index served from memory-mapped files."""
+
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.vectorstores.pgvector import DistanceStrategy
+
+from src.config import Config, get_settings
+from src.logging_setup import setup_logger
+from src.vector_store import SearchParams
+
+config = Config()
+logger = setup_logger()
+
+CURRENT_FILE = "CURRENT"
+HEADER_FILE = "index.json"
+VECTORS_FILE = "vectors.f32"
+NORMS_FILE = "norms.f32"
+OFFSETS_FILE = "offsets.u64"
+DOCUMENTS_FILE = "documents.jsonl"
+QUANTIZED_FILE = "quantized.bin"
+SCALES_FILE = "scales.f32"
+
+# Storage types of the compact vectors scanned for candidates, by quantization.
+QUANTIZED_TYPES = {"float16": np.float16, "int8": np.int8}
+
+# Upper bound on the number of query-by-row scores held in memory at once.
+MAX_SCORES_PER_CHUNK = 16_000_000
+
+# Rows of compact vectors widened to float32 at a time while scanning.
+ROWS_PER_BLOCK = 65_536
+
+def quantize(matrix: np.ndarray, norms: np.ndarray, quantization: str,
+             distance_strategy: DistanceStrategy) -> Tuple[np.ndarray, np.ndarray]:
+    """Compress embeddings into compact vectors and per-row scales.
+
+    For cosine distance the embeddings are normalized first, so every component
+    lies in [-1, 1], and the norm is folded into the scale. Int8 vectors use one
+    symmetric scale per row. A compact vector times its scale approximates the
+    embedding, so its dot product with a query approximates the exact one.
+
+    Args:
+        matrix: The float32 embeddings, one per row.
+        norms: Their norms.
+        quantization: "float16" or "int8".
+        distance_strategy: The distance the embeddings are ranked by.
+
+    Returns:
+        The compact vectors and the float32 scales.
+    """
+    if distance_strategy == DistanceStrategy.COSINE:
+        safe_norms = np.maximum(norms, 1e-12)[:, None]
+        target, scales = matrix / safe_norms, norms.astype(np.float32)
+    else:
+        target, scales = matrix, np.ones(len(matrix), dtype=np.float32)
+    if quantization == "float16":
+        return target.astype(np.float16), scales
+    steps = np.maximum(np.abs(target).max(axis=1), 1e-12) / 127
+    codes = np.clip(np.rint(target / steps[:, None]), -127, 127).astype(np.int8)
+    return codes, (scales * steps).astype(np.float32)
+
+def read_current_version(path: str) -> int:
+    """Return the version of the index stored at `path`.
+
+    Args:
+        path: The index directory.
+
+    Returns:
+        The current index version, or 0 if no index was ever written there.
+    """
+    try:
+        with open(os.path.join(path, CURRENT_FILE), "r", encoding="utf-8") as file:
+            return int(file.read().strip())
+    except FileNotFoundError:
+        return 0
+
+class MmapIndexWriter: # pylint: disable=R0902
+    """Streams documents and their embeddings into a new version of an on-disk index.
+
+    Each version is written to its own `v<version>` subdirectory and published by
+    atomically replacing the `CURRENT` file, so readers never see a half-written
+    index and keep serving the version they have mapped until they switch.
+    """
+
+    def __init__(self, path: str, distance_strategy: DistanceStrategy = DistanceStrategy.COSINE,
+                 quantization: Optional[str] = None):
+        quantization = quantization or config.get("MMAP_INDEX_QUANTIZATION", "none").lower()
+        if quantization not in ("none", *QUANTIZED_TYPES):
+            raise ValueError(f"Invalid index quantization: {quantization}")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.distance_strategy = distance_strategy
+        self.quantization = quantization
+        self.version = read_current_version(path) + 1
+        self.directory = os.path.join(path, f"v{self.version}")
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory)
+        self.count = 0
+        self.dimensions = None
+        self._position = 0
+        names = [VECTORS_FILE, NORMS_FILE, OFFSETS_FILE, DOCUMENTS_FILE]
+        if quantization != "none":
+            names += [QUANTIZED_FILE, SCALES_FILE]
+        self._files = {
+            name: open(os.path.join(self.directory, name), "wb") # pylint: disable=R1732
+            for name in names
+        }
+        self._files[OFFSETS_FILE].write(np.uint64(0).tobytes())
+
+    def add(self, texts: List[str], metadatas: List[dict], embeddings: List[List[float]]):
+        """Append a batch of documents and their embeddings.
+
+        Args:
+            texts: The document contents.
+            metadatas: The document metadata.
+            embeddings: The document embeddings.
+        """
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.size == 0:
+            return
+        if self.dimensions is None:
+            self.dimensions = matrix.shape[1]
+        if matrix.ndim != 2 or matrix.shape[1] != self.dimensions or len(matrix) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings of {self.dimensions} dimensions")
+        norms = np.linalg.norm(matrix, axis=1).astype(np.float32)
+        self._files[VECTORS_FILE].write(matrix.tobytes())
+        self._files[NORMS_FILE].write(norms.tobytes())
+        if self.quantization != "none":
+            codes, scales = quantize(matrix, norms, self.quantization, self.distance_strategy)
+            self._files[QUANTIZED_FILE].write(codes.tobytes())
+            self._files[SCALES_FILE].write(scales.tobytes())
+        offsets = []
+        for text, metadata in zip(texts, metadatas):
+            record = json.dumps({"page_content": text, "metadata": metadata}).encode("utf-8")
+            self._files[DOCUMENTS_FILE].write(record + b"\n")
+            self._position += len(record) + 1
+            offsets.append(self._position)
+        self._files[OFFSETS_FILE].write(np.asarray(offsets, dtype=np.uint64).tobytes())
+        self.count += len(texts)
+
+    def commit(self) -> int:
+        """Publish the written documents as the index's current version.
+
+        Returns:
+            The new index version.
+        """
+        for file in self._files.values():
+            file.flush()
+            os.fsync(file.fileno())
+            file.close()
+        header = {
+            "count": self.count,
+            "dimensions": self.dimensions or 0,
+            "distance_strategy": self.distance_strategy.value,
+            "quantization": self.quantization,
+        }
+        with open(os.path.join(self.directory, HEADER_FILE), "w", encoding="utf-8") as file:
+            json.dump(header, file)
+        current = os.path.join(self.path, f"{CURRENT_FILE}.{os.getpid()}")
+        with open(current, "w", encoding="utf-8") as file:
+            file.write(str(self.version))
+        os.replace(current, os.path.join(self.path, CURRENT_FILE))
+        # Keep the previous version for readers that have not switched yet.
+        for entry in os.listdir(self.path):
+            if entry.startswith("v") and entry[1:].isdigit() and int(entry[1:]) < self.version - 1:
+                shutil.rmtree(os.path.join(self.path, entry), ignore_errors=True)
+        logger.info("Wrote %s documents to %s version %s", self.count, self.path, self.version)
+        return self.version
+
+    def abort(self):
+        """Discard the documents written so far."""
+        for file in self._files.values():
+            file.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+class MmapIndexSnapshot: # pylint: disable=R0902
+    """One version of an on-disk index, mapped read-only into memory.
+
+    The embedding matrix, norms and document offsets are NumPy memory maps and the
+    documents a plain memory map, so every worker reading the same files shares
+    one copy through the page cache. A quantized index is scanned through its
+    compact vectors, and only the candidates' float32 embeddings are read to
+    rescore them exactly, so mostly the compact vectors stay in memory.
+    """
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, HEADER_FILE), "r", encoding="utf-8") as file:
+            header = json.load(file)
+        self.count = header["count"]
+        self.dimensions = header["dimensions"]
+        self.distance_strategy = DistanceStrategy(header["distance_strategy"])
+        self.quantization = header.get("quantization", "none")
+        self.rescore_factor = max(1, int(config.get("MMAP_INDEX_RESCORE_FACTOR", "4")))
+        self.codes = self.scales = None
+        if self.count and self.quantization != "none":
+            self.codes = np.memmap(os.path.join(directory, QUANTIZED_FILE),
+                                   dtype=QUANTIZED_TYPES[self.quantization], mode="r",
+                                   shape=(self.count, self.dimensions))
+            self.scales = np.memmap(os.path.join(directory, SCALES_FILE), dtype=np.float32,
+                                    mode="r", shape=(self.count,))
+        if self.count:
+            self.vectors = np.memmap(os.path.join(directory, VECTORS_FILE), dtype=np.float32,
+                                     mode="r", shape=(self.count, self.dimensions))
+            self.norms = np.memmap(os.path.join(directory, NORMS_FILE), dtype=np.float32,
+                                   mode="r", shape=(self.count,))
+            self.offsets = np.memmap(os.path.join(directory, OFFSETS_FILE), dtype=np.uint64,
+                                     mode="r", shape=(self.count + 1,))
+            with open(os.path.join(directory, DOCUMENTS_FILE), "rb") as file:
+                self.documents = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def distances(self, queries: np.ndarray) -> np.ndarray:
+        """Score every row against every query, matching pgvector's distance operators.
+
+        Args:
+            queries: The query embeddings, one per row.
+
+        Returns:
+            The (queries x rows) distance matrix.
+        """
+        return self._to_distances(queries @ self.vectors.T, queries, self.norms[None, :])
+
+    def approximate_distances(self, queries: np.ndarray) -> np.ndarray:
+        """Score every row against every query through the compact vectors.
+
+        Args:
+            queries: The query embeddings, one per row.
+
+        Returns:
+            The (queries x rows) approximate distance matrix.
+        """
+        products = np.empty((len(queries), self.count), dtype=np.float32)
+        for start in range(0, self.count, ROWS_PER_BLOCK):
+            block = slice(start, start + ROWS_PER_BLOCK)
+            products[:, block] = queries @ self.codes[block].astype(np.float32).T
+            products[:, block] *= self.scales[block]
+        return self._to_distances(products, queries, self.norms[None, :])
+
+    def _to_distances(self, products: np.ndarray, queries: np.ndarray,
+                      norms: np.ndarray) -> np.ndarray:
+        """Turn query-by-row dot products into pgvector's distances."""
+        if self.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+            return -products
+        query_norms = np.linalg.norm(queries, axis=1)[:, None]
+        if self.distance_strategy == DistanceStrategy.EUCLIDEAN:
+            squared = np.square(norms) + np.square(query_norms) - 2 * products
+            return np.sqrt(np.maximum(squared, 0))
+        return 1 - products / np.maximum(query_norms * norms, 1e-12)
+
+    def document(self, row: int) -> Document:
+        """Read the document stored in a row.
+
+        Args:
+            row: The row number.
+
+        Returns:
+            The document.
+        """
+        record = json.loads(self.documents[int(self.offsets[row]):int(self.offsets[row + 1])])
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    def nearest_rows(self, queries: np.ndarray, k: int,
+                     rescore_factor: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Find the rows nearest to each query and their distances.
+
+        Rows are scored with one matrix product per chunk of queries, and only the
+        k best of each are sorted. A quantized index keeps the `rescore_factor * k`
+        best rows by approximate distance and ranks them by exact distance.
+
+        Args:
+            queries: The query embeddings, one per row.
+            k: Number of rows to return per query.
+            rescore_factor: Candidates rescored per result; defaults to
+                `MMAP_INDEX_RESCORE_FACTOR`.
+
+        Returns:
+            The (queries x k) row numbers and distances, nearest first.
+        """
+        k = min(k, self.count)
+        found_rows, found_distances = [], []
+        chunk_size = max(1, MAX_SCORES_PER_CHUNK // max(self.count, 1))
+        for start in range(0, len(queries), chunk_size):
+            chunk = queries[start:start + chunk_size]
+            if self.codes is None:
+                rows, distances = self._top(self.distances(chunk), k)
+            else:
+                candidates = min(self.count, k * (rescore_factor or self.rescore_factor))
+                rows, _ = self._top(self.approximate_distances(chunk), candidates)
+                products = np.einsum("qcd,qd->qc", self.vectors[rows.ravel()].reshape(
+                    rows.shape + (self.dimensions,)), chunk)
+                exact = self._to_distances(products, chunk, self.norms[rows])
+                order, distances = self._top(exact, k)
+                rows = np.take_along_axis(rows, order, axis=1)
+            found_rows.append(rows)
+            found_distances.append(distances)
+        if not found_rows:
+            return np.empty((0, k), dtype=np.intp), np.empty((0, k), dtype=np.float32)
+        return np.concatenate(found_rows), np.concatenate(found_distances)
+
+    @staticmethod
+    def _top(distances: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the columns of the k smallest distances in each row, and those distances."""
+        if k < distances.shape[1]:
+            columns = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        else:
+            columns = np.broadcast_to(np.arange(distances.shape[1]), distances.shape)
+        nearest = np.take_along_axis(distances, columns, axis=1)
+        order = np.argsort(nearest, axis=1, kind="stable")
+        return (np.take_along_axis(columns, order, axis=1),
+                np.take_along_axis(nearest, order, axis=1))
+
+    def search(self, queries: np.ndarray, k: int) -> List[List[Tuple[Document, float]]]:
+        """Find the k nearest documents to each query.
+
+        Args:
+            queries: The query embeddings, one per row.
+            k: Number of results to return per query.
+
+        Returns:
+            One list of (document, distance) pairs per query, nearest first.
+        """
+        if min(k, self.count) <= 0:
+            return [[] for _ in queries]
+        rows, distances = self.nearest_rows(queries, k)
+        return [[(self.document(row), float(distance)) for row, distance in zip(found, scores)]
+                for found, scores in zip(rows, distances)]
+
+class MmapVectorIndex:
+    """Read-only vector store for one collection, served from a memory-mapped index.
+
+    It answers the same searches as `PooledPGVector` with an exact scan, so the
+    index search knobs are accepted and ignored. The index version doubles as the
+    collection version, so caches are invalidated when a new version is written.
+    """
+
+    def __init__(self, path: str, collection_name: str):
+        self.path = path
+        self.collection_name = collection_name
+        self.version_poll_seconds = get_settings().retrieval_cache_version_poll
+        self._snapshot = None
+        self._version = None
+        self._version_checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def collection_version(self) -> int:
+        """Return the index version, switching to a newer version at most every poll interval.
+
+        Returns:
+            The current index version (0 if no index was written yet).
+        """
+        now = time.monotonic()
+        if self._version is None or now - self._version_checked_at >= self.version_poll_seconds:
+            with self._lock:
+                version = read_current_version(self.path)
+                if version != self._version:
+                    self._snapshot = (MmapIndexSnapshot(os.path.join(self.path, f"v{version}"))
+                                      if version else None)
+                    self._version = version
+                    logger.info("Mapped %s version %s", self.path, version)
+                self._version_checked_at = now
+        return self._version
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        search_params: Optional[SearchParams] = None, # pylint: disable=W0613
+    ) -> List[Tuple[Document, float]]:
+        """Find the k documents nearest to an embedding.
+
+        Args:
+            embedding: The query embedding.
+            k: Number of results to return.
+            search_params: Ignored, the scan is exact.
+
+        Returns:
+            The (document, distance) pairs, nearest first.
+        """
+        return self.batch_similarity_search_with_score_by_vector([embedding], k=k)[0]
+
+    def batch_similarity_search_with_score_by_vector(
+        self,
+        embeddings: List[List[float]],
+        k: int = 4,
+        search_params: Optional[SearchParams] = None, # pylint: disable=W0613
+    ) -> List[List[Tuple[Document, float]]]:
+        """Find the k documents nearest to each of several embeddings.
+
+        Args:
+            embeddings: The query embeddings.
+            k: Number of results to return per query.
+            search_params: Ignored, the scan is exact.
+
+        Returns:
+            One list of (document, distance) pairs per query embedding, in order.
+        """
+        self.collection_version()
+        snapshot = self._snapshot
+        if snapshot is None or not embeddings:
+            return [[] for _ in embeddings]
+        return snapshot.search(np.asarray(embeddings, dtype=np.float32), k)
+
+class MmapIndexRegistry:
+    """Process-wide registry of memory-mapped collection indexes, keyed by path."""
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get_index(self, path: str, collection_name: str) -> MmapVectorIndex:
+        """Return the shared index for a path, mapping it on first use.
+
+        Args:
+            path: The index directory.
+            collection_name: The name of the collection stored there.
+
+        Returns:
+            The collection index.
+        """
+        with self._lock:
+            index = self._indexes.get(path)
+            if index is None:
+                index = MmapVectorIndex(path, collection_name)
+                self._indexes[path] = index
+            return index
+
+    def clear(self):
+        """Forget every index so the next request maps it again."""
+        with self._lock:
+            self._indexes.clear()
+
+mmap_index_registry = MmapIndexRegistry()
+
+def write_index(path: str, batches: Iterable[Tuple[List[str], List[dict], List[List[float]]]],
+                distance_strategy: DistanceStrategy = DistanceStrategy.COSINE,
+                quantization: Optional[str] = None) -> int:
+    """Write a new version of an index from batches of documents.
+
+    Args:
+        path: The index directory.
+        batches: (texts, metadatas, embeddings) batches.
+        distance_strategy: The distance searches are ranked by.
+        quantization: "none", "float16" or "int8"; defaults to `MMAP_INDEX_QUANTIZATION`.
+
+    Returns:
+        The new index version.
+    """
+    with MmapIndexWriter(path, distance_strategy, quantization) as writer:
+        for texts, metadatas, embeddings in batches:
+            writer.add(texts, metadatas, embeddings)
+    return writer.version
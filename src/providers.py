@@ -0,0 +1,160 @@
+"""Module for building language model clients and chains once per configuration.
+
+langchain's chains and LLM clients take most of a second to import, so each
+builder imports its provider's classes when the provider is first used, rather
+than every provider being imported when the app starts.
+"""
+
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, Tuple
+
+from src.config import get_settings, reload_settings
+from src.logging_setup import setup_logger
+
+if TYPE_CHECKING:
+    from langchain.chains import LLMChain
+    from langchain.prompts import PromptTemplate
+
+logger = setup_logger()
+
+LANGUAGE_MODEL_TEMPLATE = "Pay close attention to the following... {input_val}"
+
+def language_model_prompt() -> "PromptTemplate":
+    """Return the prompt every provider's chain formats its input with.
+
+    Returns:
+        The prompt template.
+    """
+    from langchain.prompts import PromptTemplate # pylint: disable=C0415
+    return PromptTemplate(input_variables=["input_val"], template=LANGUAGE_MODEL_TEMPLATE)
+
+def model_temperature() -> float:
+    """Return the configured sampling temperature.
+
+    Returns:
+        The model temperature.
+    """
+    return get_settings().model_temperature
+
+def build_hosted_llm_chain() -> Tuple[tuple, "LLMChain"]:
+    """Build the chain for the hosted language model.
+
+    Returns:
+        The (provider, model, temperature) key and the language model chain.
+    """
+    from langchain.chains import LLMChain # pylint: disable=C0415
+    from src.hosted_llm import CustomLlamaParser, HostedLLM # pylint: disable=C0415
+    settings = get_settings()
+    hosted_model_name = settings.hosted_model_name
+    logger.debug("Using self-hosted model: %s", hosted_model_name)
+    llm = HostedLLM(
+        uri=settings.hosted_model_uri,
+        transport=settings.hosted_model_transport,
+        compress=settings.hosted_model_compression == "gzip",
+        batch_prompts=settings.hosted_model_batch,
+    )
+    chain = LLMChain(llm=llm, prompt=language_model_prompt(),
+                     output_parser=CustomLlamaParser())
+    return ("hosted", hosted_model_name, None), chain
+
+def build_vertexai_chain() -> Tuple[tuple, "LLMChain"]:
+    """Build the chain for the Vertex AI language model.
+
+    Returns:
+        The (provider, model, temperature) key and the language model chain.
+    """
+    from langchain.chains import LLMChain # pylint: disable=C0415
+    from langchain.llms import VertexAI # pylint: disable=C0415
+    vertex_model_name = get_settings().vertex_model_name
+    logger.debug("Using Vertex AI model: %s", vertex_model_name)
+    temperature = model_temperature()
+    llm = VertexAI(model_name=vertex_model_name, temperature=temperature)
+    return ("vertex", vertex_model_name, temperature), LLMChain(llm=llm,
+                                                                prompt=language_model_prompt())
+
+def build_openai_chain() -> Tuple[tuple, "LLMChain"]:
+    """Build the chain for the OpenAI language model.
+
+    Returns:
+        The (provider, model, temperature) key and the language model chain.
+    """
+    from langchain.chains import LLMChain # pylint: disable=C0415
+    from langchain.llms import OpenAI # pylint: disable=C0415
+    openai_model_name = get_settings().openai_model_name
+    logger.debug("Using OpenAI model: %s", openai_model_name)
+    temperature = model_temperature()
+    llm = OpenAI(model_name=openai_model_name, temperature=temperature)
+    return ("openai", openai_model_name, temperature), LLMChain(llm=llm,
+                                                                prompt=language_model_prompt())
+
+CHAIN_BUILDERS: Dict[str, Callable[[], Tuple[tuple, "LLMChain"]]] = {
+    "openai": build_openai_chain,
+    "vertex": build_vertexai_chain,
+    "hosted": build_hosted_llm_chain,
+}
+
+class ProviderRegistry:
+    """Process-wide, thread-safe registry of language model chains.
+
+    Each provider's client and chain is built from the configuration on first use
+    and shared by every request, instead of being rebuilt (and, for Vertex AI,
+    re-authenticated) per call. `reload` re-reads the configuration and drops the
+    built chains so the next request picks up the new model or temperature.
+    """
+
+    def __init__(self, builders: Dict[str, Callable[[], Tuple[tuple, "LLMChain"]]] = None):
+        self._builders = CHAIN_BUILDERS if builders is None else builders
+        self._chains = {}
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def get_chain(self, model_provider: str) -> "LLMChain":
+        """Return the shared chain for a provider, building it on first use.
+
+        Args:
+            model_provider: The configured model provider.
+
+        Returns:
+            The language model chain.
+        """
+        chain = self._chains.get(model_provider)
+        if chain is not None:
+            return chain
+        builder = self._builders.get(model_provider)
+        if builder is None:
+            raise ValueError(f"Invalid model name: {model_provider}")
+        with self._lock:
+            chain = self._chains.get(model_provider)
+            if chain is None:
+                key, chain = builder()
+                self._keys[model_provider] = key
+                self._chains[model_provider] = chain
+                logger.info("Built language model chain for %s", key)
+        return chain
+
+    def loaded(self) -> Dict[str, tuple]:
+        """Report the (provider, model, temperature) of every built chain.
+
+        Returns:
+            A dictionary mapping providers to the configuration their chain was built with.
+        """
+        with self._lock:
+            return dict(self._keys)
+
+    def reload(self):
+        """Re-read the configuration files and drop every built chain.
+
+        If the new settings are invalid, the error is logged and the current
+        settings and chains are kept.
+        """
+        try:
+            reload_settings()
+        except ValueError as err:
+            logger.error("Configuration reload failed, keeping current settings: %s", err)
+            return
+        with self._lock:
+            self._chains.clear()
+            self._keys.clear()
+        logger.info("Reloaded language model configuration")
+
+provider_registry = ProviderRegistry()
@@ -0,0 +1,157 @@
+"""Module for breaking the latency of individual requests down by stage."""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from src.metrics import stage_seconds
+
+# Short metric names used in the Server-Timing header, in pipeline order.
+SERVER_TIMING_NAMES = {
+    "embedding": "embed",
+    "vector_search": "retrieve",
+    "pool_wait": "pool-wait",
+    "prompt_assembly": "prompt",
+    "language_model": "llm",
+    "output_parsing": "parse",
+}
+
+class RequestTrace:
+    """Per-stage durations and attributes (provider, model, tokens) of one request.
+
+    Stages recorded more than once, such as a pool checkout per query, are summed.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.attributes = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage: str, seconds: float):
+        """Add time spent in a stage.
+
+        Args:
+            stage: The stage name.
+            seconds: The time spent.
+        """
+        with self._lock:
+            total, count = self.stages.get(stage, (0.0, 0))
+            self.stages[stage] = (total + seconds, count + 1)
+
+    def annotate(self, **attributes):
+        """Attach attributes to the trace.
+
+        Args:
+            **attributes: The JSON-serializable attribute values.
+        """
+        with self._lock:
+            self.attributes.update(attributes)
+
+    def server_timing(self) -> str:
+        """Format the stage durations as a Server-Timing header value.
+
+        Returns:
+            The header value, in milliseconds, ending with the total so far.
+        """
+        with self._lock:
+            stages = dict(self.stages)
+        ordered = [stage for stage in SERVER_TIMING_NAMES if stage in stages]
+        ordered += [stage for stage in stages if stage not in SERVER_TIMING_NAMES]
+        metrics = [f"{SERVER_TIMING_NAMES.get(stage, stage)};dur={stages[stage][0] * 1000:.1f}"
+                   for stage in ordered]
+        metrics.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(metrics)
+
+    def to_dict(self) -> dict:
+        """Return the breakdown returned to callers that ask for a trace.
+
+        Returns:
+            A dictionary with the elapsed milliseconds, the milliseconds and number
+            of calls per stage, and the trace attributes.
+        """
+        with self._lock:
+            return {
+                "total_ms": round((time.perf_counter() - self.start) * 1000, 3),
+                "stages": {stage: {"ms": round(total * 1000, 3), "calls": count}
+                           for stage, (total, count) in self.stages.items()},
+                **self.attributes,
+            }
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+def current_trace() -> Optional[RequestTrace]:
+    """Return the trace of the request being handled, if it is traced.
+
+    Returns:
+        The trace, or None outside a traced request.
+    """
+    return _current_trace.get()
+
+def record_stage(stage: str, seconds: float):
+    """Record time spent in a pipeline stage, in the stage histogram and the request trace.
+
+    Args:
+        stage: The stage name.
+        seconds: The time spent.
+    """
+    stage_seconds.observe(seconds, stage=stage)
+    trace = current_trace()
+    if trace is not None:
+        trace.add_stage(stage, seconds)
+
+@contextmanager
+def time_stage(stage: str):
+    """Record the time spent in a `with` block as a pipeline stage, even if it raises.
+
+    Args:
+        stage: The stage name.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+def annotate(**attributes):
+    """Attach attributes to the current request's trace, if it is traced.
+
+    Args:
+        **attributes: The JSON-serializable attribute values.
+    """
+    trace = current_trace()
+    if trace is not None:
+        trace.annotate(**attributes)
+
+class ServerTimingMiddleware: # pylint: disable=R0903
+    """ASGI middleware tracing requests under a path prefix.
+
+    Each request gets its own `RequestTrace`, and its stage durations so far are
+    sent in a `Server-Timing` header. Streamed responses send their headers before
+    the language model runs, so only the stages before it appear there.
+    """
+
+    def __init__(self, app, path_prefix: str = "/v1/"):
+        self.app = app
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        trace = RequestTrace()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _current_trace.set(trace)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
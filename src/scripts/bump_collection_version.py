@@ -0,0 +1,31 @@
+"""Script to invalidate cached retrieval results after a collection is reloaded."""
+
+import argparse
+import sys
+
+from src.config import Config
+from src.logging_setup import setup_logger
+from src.vector_store import get_collection_store
+
+config = Config()
+logger = setup_logger()
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description='Bump the content version of a collection after changing its documents.')
+    parser.add_argument('--collection',
+                        default=config.get('COLLECTION_NAME', "sample_collection"),
+                        help='Name of the collection whose contents changed.')
+    return parser.parse_args()
+
+def main():
+    """Bump the collection version so every worker drops its cached results."""
+    args = parse_args()
+    store = get_collection_store(args.collection)
+    version = store.bump_collection_version()
+    print(f"{args.collection}: version {version}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
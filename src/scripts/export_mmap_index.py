@@ -0,0 +1,64 @@
+"""Script to export a pgvector collection to a memory-mapped index."""
+
+import argparse
+import os
+import sys
+import time
+
+import sqlalchemy
+
+from src.config import Config
+from src.logging_setup import setup_logger
+from src.mmap_index import write_index
+from src.vector_store import get_collection_store
+
+config = Config()
+logger = setup_logger()
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description='Export a pgvector collection to a memory-mapped index for '
+                    'VECTOR_STORE_BACKEND=mmap.')
+    parser.add_argument('--collection',
+                        default=config.get('COLLECTION_NAME', "sample_collection"),
+                        help='Name of the collection to export.')
+    parser.add_argument('--output', default=config.get('MMAP_INDEX_DIR', "indexes"),
+                        help='Directory holding one index directory per collection.')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='Rows read from the database per batch.')
+    return parser.parse_args()
+
+def read_batches(store, batch_size):
+    """Stream a collection's documents and embeddings in batches.
+
+    Args:
+        store: The prepared collection store.
+        batch_size: Rows per batch.
+
+    Yields:
+        (texts, metadatas, embeddings) batches.
+    """
+    table = store.EmbeddingStore
+    statement = (sqlalchemy.select(table.document, table.cmetadata, table.embedding)
+                 .where(table.collection_id == store.collection_id))
+    with store.engine_pool.engine.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(statement)
+        for rows in result.partitions(batch_size):
+            yield ([row.document for row in rows], [row.cmetadata for row in rows],
+                   [row.embedding for row in rows])
+
+def main():
+    """Write the collection's rows as a new version of its memory-mapped index."""
+    args = parse_args()
+    store = get_collection_store(args.collection)
+    start = time.perf_counter()
+    path = os.path.join(args.output, args.collection)
+    version = write_index(path, read_batches(store, args.batch_size),
+                          store._distance_strategy) # pylint: disable=W0212
+    print(f"{args.collection}: {path} version {version} "
+          f"in {time.perf_counter() - start:.1f}s")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
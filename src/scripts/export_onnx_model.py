@@ -0,0 +1,58 @@
+"""Script to export the embedding model for the ONNX backend and check its parity."""
+
+import argparse
+import json
+import sys
+
+from langchain.embeddings import HuggingFaceEmbeddings
+
+from src.config import Config
+from src.embedding_backends import OnnxEmbeddings, compare_backends, export_onnx_model
+from src.embedding_backends import onnx_model_dir
+from src.logging_setup import setup_logger
+
+config = Config()
+logger = setup_logger()
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description='Export the embedding model as an ONNX graph for EMBEDDING_BACKEND=onnx, '
+                    'then compare its vectors and latency with sentence-transformers.')
+    parser.add_argument('--model', default=config.get('EMBEDDING_MODEL_NAME', "all-MiniLM-L6-v2"),
+                        help='Name of the embedding model.')
+    parser.add_argument('--output', default=None,
+                        help='Export directory; defaults to EMBEDDING_ONNX_DIR/<model>.')
+    parser.add_argument('--no-quantize', action='store_true',
+                        help='Do not write the dynamically quantized int8 graph.')
+    parser.add_argument('--check-only', action='store_true',
+                        help='Only compare an existing export with sentence-transformers.')
+    parser.add_argument('--texts', default=None,
+                        help='File with one text per line to compare on.')
+    parser.add_argument('--min-similarity', type=float, default=0.99,
+                        help='Lowest cosine similarity to the current vectors that passes.')
+    return parser.parse_args()
+
+def main():
+    """Export the model and print one parity and latency report per graph as JSON lines."""
+    args = parse_args()
+    output = args.output or onnx_model_dir(args.model)
+    if not args.check_only:
+        export_onnx_model(args.model, output, quantize=not args.no_quantize)
+    texts = None
+    if args.texts:
+        with open(args.texts, "r", encoding="utf-8") as file:
+            texts = [line.strip() for line in file if line.strip()]
+    reference = HuggingFaceEmbeddings(model_name=args.model,
+                                      encode_kwargs={"show_progress_bar": False})
+    passed = True
+    for quantized in ((False,) if args.no_quantize else (False, True)):
+        report = compare_backends(reference, OnnxEmbeddings(output, quantized=quantized), texts)
+        report["quantized"] = quantized
+        report["passed"] = report["min_cosine_similarity"] >= args.min_similarity
+        passed = passed and report["passed"]
+        print(json.dumps(report))
+    return 0 if passed else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""Script to load documents into a collection in bulk."""
+
+import argparse
+import os
+import sys
+
+from src.config import Config
+from src.embedding_cache import EmbeddingCache
+from src.ingestion import DEFAULT_EXTENSIONS, MmapIndexLoader, PgVectorCopyLoader
+from src.ingestion import ingest, iter_chunks, iter_documents
+from src.logging_setup import setup_logger
+from src.vector_store import get_collection_store
+
+config = Config()
+logger = setup_logger()
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description='Chunk, embed and bulk-load documents from a directory or JSONL file.')
+    parser.add_argument('path', help='A directory of documents, or a JSONL file with one '
+                                     'document per line.')
+    parser.add_argument('--collection',
+                        default=config.get('COLLECTION_NAME', "sample_collection"),
+                        help='Name of the collection to load into.')
+    parser.add_argument('--link-prefix', default=None,
+                        help='URL prefix turning file paths into source links.')
+    parser.add_argument('--extensions', default=','.join(DEFAULT_EXTENSIONS),
+                        help='Comma separated file extensions read from a directory.')
+    parser.add_argument('--chunk-size', type=int, default=1000,
+                        help='Largest chunk, in characters.')
+    parser.add_argument('--chunk-overlap', type=int, default=200,
+                        help='Characters shared by neighbouring chunks.')
+    parser.add_argument('--batch-size', type=int, default=256,
+                        help='Chunks embedded and loaded together.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Embedding processes; 0 embeds in this process.')
+    parser.add_argument('--replace', action='store_true',
+                        help='Replace every chunk already in the collection in one '
+                             'transaction, instead of only loading new and changed chunks and '
+                             'deleting stale ones.')
+    parser.add_argument('--embedding-cache',
+                        default=config.get('EMBEDDING_CACHE_PATH', "embedding_cache.sqlite3"),
+                        help='File caching embeddings by content hash and model; empty to '
+                             'disable.')
+    return parser.parse_args()
+
+def main():
+    """Load the documents into the configured vector store backend."""
+    args = parse_args()
+    if config.get('VECTOR_STORE_BACKEND', "pgvector") == "mmap":
+        # A memory-mapped index is always written as a complete new version.
+        loader = MmapIndexLoader(os.path.join(config.get('MMAP_INDEX_DIR', "indexes"),
+                                              args.collection))
+    else:
+        loader = PgVectorCopyLoader(get_collection_store(args.collection),
+                                    incremental=not args.replace)
+        if args.replace:
+            logger.info("Replacing %s existing chunks once the load completes",
+                        loader.delete_existing())
+    cache = EmbeddingCache(args.embedding_cache) if args.embedding_cache else None
+    documents = iter_documents(args.path, args.extensions.split(','), args.link_prefix)
+    stats = ingest(iter_chunks(documents, args.chunk_size, args.chunk_overlap), loader,
+                   config.get('EMBEDDING_MODEL_NAME', "all-MiniLM-L6-v2"),
+                   batch_size=args.batch_size, workers=args.workers, cache=cache)
+    if cache is not None:
+        cache.close()
+    print(f"{args.collection}: {stats['chunks']} chunks loaded, {stats['skipped']} unchanged, "
+          f"{stats['deleted']} deleted, {stats['embedded']} embedded in {stats['seconds']:.1f}s "
+          f"({stats['chunks_per_second']:.1f} chunks/s)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
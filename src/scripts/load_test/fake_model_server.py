@@ -0,0 +1,87 @@
+"""Module for a local stand-in of the self-hosted model server."""
+
+import asyncio
+import gzip
+import json
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+class FakeModelServer:
+    """Self-hosted model server stand-in with a configurable latency and token rate.
+
+    It accepts the requests `HostedLLM` sends: a prompt as a (possibly gzipped)
+    JSON `text` POST body or a `text` query parameter, or a batch as a JSON
+    `texts` list. Each generation waits the time to the first token, then the
+    time to produce every other token, and answers in the Llama 2 chat format
+    `CustomLlamaParser` expects.
+    """
+
+    def __init__(self, latency_ms: float = 200.0, tokens: int = 64,
+                 tokens_per_second: float = 50.0):
+        self.latency_ms = latency_ms
+        self.tokens = tokens
+        self.tokens_per_second = tokens_per_second
+
+    def generation_seconds(self) -> float:
+        """Return how long one generation takes.
+
+        Returns:
+            The time to the first token plus the time to generate the rest.
+        """
+        token_seconds = (self.tokens - 1) / self.tokens_per_second if self.tokens > 1 else 0.0
+        return self.latency_ms / 1000 + token_seconds
+
+    def completion(self) -> str:
+        """Return the text of one generation.
+
+        Returns:
+            An empty instruction followed by `tokens` words.
+        """
+        return "[INST] [/INST] " + " ".join(f"token{i}" for i in range(self.tokens))
+
+    async def generate(self, request: Request):
+        """Answer a generation request after the simulated generation time."""
+        if request.method == "GET":
+            payload = {"text": request.query_params.get("text", "")}
+        else:
+            body = await request.body()
+            if request.headers.get("content-encoding") == "gzip":
+                body = gzip.decompress(body)
+            payload = json.loads(body)
+        await asyncio.sleep(self.generation_seconds())
+        if "texts" in payload:
+            return JSONResponse([self.completion() for _ in payload["texts"]])
+        return PlainTextResponse(self.completion())
+
+    @staticmethod
+    async def health(_request: Request):
+        """Report the server is up."""
+        return PlainTextResponse("ok")
+
+    def app(self) -> Starlette:
+        """Return the ASGI app serving `/generate` and `/health`.
+
+        Returns:
+            The app.
+        """
+        return Starlette(routes=[
+            Route("/generate", self.generate, methods=["GET", "POST"]),
+            Route("/health", self.health),
+        ])
+
+def serve(host: str, port: int, latency_ms: float, tokens: int, tokens_per_second: float):
+    """Run a fake model server until the process is terminated.
+
+    Args:
+        host: The address to listen on.
+        port: The port to listen on.
+        latency_ms: Milliseconds to the first token.
+        tokens: Tokens generated per prompt.
+        tokens_per_second: Tokens generated per second after the first.
+    """
+    server = FakeModelServer(latency_ms, tokens, tokens_per_second)
+    uvicorn.run(server.app(), host=host, port=port, log_level="warning")
@@ -0,0 +1,167 @@
+"""Module to drive concurrent requests at an endpoint and summarize their latency."""
+
+import asyncio
+import itertools
+import math
+import time
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+# Latency metrics that regress when they go up, and throughput that regresses when it goes down.
+LATENCY_METRICS = ("p50", "p95", "p99")
+THROUGHPUT_METRIC = "throughput_rps"
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Return a nearest-rank percentile.
+
+    Args:
+        sorted_values: The values, in ascending order.
+        pct: The percentile, from 0 to 100.
+
+    Returns:
+        The smallest value at least `pct` percent of the values are less than or
+        equal to, or None if there are no values.
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """Parse the durations of a Server-Timing header.
+
+    Args:
+        header: The header value, e.g. "embed;dur=1.2, total;dur=5.0".
+
+    Returns:
+        The milliseconds per metric name.
+    """
+    durations = {}
+    for metric in header.split(","):
+        name, *params = [part.strip() for part in metric.split(";")]
+        for param in params:
+            if param.startswith("dur="):
+                durations[name] = float(param[4:])
+    return durations
+
+class LoadResult:
+    """Latencies, status codes and server timings of the requests of one run."""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.status_codes = {}
+        self.server_timing = {}
+        self.seconds = 0.0
+
+    def add(self, seconds: float, status_code: int, server_timing: str = ""):
+        """Record one response.
+
+        Args:
+            seconds: The time from sending the request to reading the response.
+            status_code: The response status, or 0 if the request failed.
+            server_timing: The response's Server-Timing header.
+        """
+        self.latencies.append(seconds)
+        self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+        if not 200 <= status_code < 300:
+            self.errors += 1
+        for name, duration in parse_server_timing(server_timing).items():
+            self.server_timing.setdefault(name, []).append(duration)
+
+    def summary(self) -> dict:
+        """Summarize the run.
+
+        Returns:
+            The request and error counts, throughput, latency percentiles in
+            milliseconds and the mean Server-Timing durations.
+        """
+        latencies = sorted(seconds * 1000 for seconds in self.latencies)
+        requests = len(latencies)
+        latency = {"mean": sum(latencies) / requests if requests else None,
+                   "max": latencies[-1] if requests else None}
+        latency.update({metric: percentile(latencies, float(metric[1:]))
+                        for metric in LATENCY_METRICS})
+        return {
+            "requests": requests,
+            "errors": self.errors,
+            "error_rate": self.errors / requests if requests else 0.0,
+            "status_codes": {str(code): count for code, count in sorted(self.status_codes.items())},
+            THROUGHPUT_METRIC: requests / self.seconds if self.seconds else 0.0,
+            "latency_ms": latency,
+            "server_timing_ms": {name: sum(values) / len(values)
+                                 for name, values in self.server_timing.items()},
+        }
+
+async def run_load(url: str, make_body: Callable[[int], dict], requests: int,
+                   concurrency: int, timeout: float = 60.0) -> LoadResult:
+    """Send POST requests from `concurrency` workers until `requests` were sent.
+
+    Args:
+        url: The endpoint URL.
+        make_body: Returns the JSON body of the n-th request.
+        requests: The number of requests.
+        concurrency: The number of requests in flight at once.
+        timeout: Seconds before a request counts as failed.
+
+    Returns:
+        The result of the run.
+    """
+    result = LoadResult()
+    numbers = itertools.count()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def worker(client: httpx.AsyncClient):
+        for number in numbers:
+            if number >= requests:
+                return
+            start = time.perf_counter()
+            try:
+                response = await client.post(url, json=make_body(number))
+                status_code, server_timing = (response.status_code,
+                                              response.headers.get("server-timing", ""))
+            except httpx.HTTPError:
+                status_code, server_timing = 0, ""
+            result.add(time.perf_counter() - start, status_code, server_timing)
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        result.seconds = time.perf_counter() - start
+    return result
+
+def compare_reports(report: dict, baseline: dict, tolerance: float) -> List[dict]:
+    """Compare the runs of a report with the same runs of a baseline report.
+
+    Args:
+        report: The new report.
+        baseline: The stored report to compare with.
+        tolerance: The fraction a metric may get worse by before it is a regression.
+
+    Returns:
+        One row per metric of every run found in both reports, with the baseline
+        and new values, the relative change and whether it is a regression.
+    """
+    baseline_runs = {(run["endpoint"], run["concurrency"]): run for run in baseline["runs"]}
+    rows = []
+    for run in report["runs"]:
+        previous = baseline_runs.get((run["endpoint"], run["concurrency"]))
+        if previous is None:
+            continue
+        metrics = [(metric, previous["latency_ms"][metric], run["latency_ms"][metric], 1)
+                   for metric in LATENCY_METRICS]
+        metrics.append((THROUGHPUT_METRIC, previous[THROUGHPUT_METRIC], run[THROUGHPUT_METRIC],
+                        -1))
+        for metric, old, new, direction in metrics:
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            rows.append({"endpoint": run["endpoint"], "concurrency": run["concurrency"],
+                         "metric": metric, "baseline": old, "current": new,
+                         "change": change, "regression": change * direction > tolerance})
+        if run["error_rate"] > previous["error_rate"]:
+            rows.append({"endpoint": run["endpoint"], "concurrency": run["concurrency"],
+                         "metric": "error_rate", "baseline": previous["error_rate"],
+                         "current": run["error_rate"], "change": None, "regression": True})
+    return rows
@@ -0,0 +1,88 @@
+"""Module to run the app with a synthetic index and a stand-in embedding model.
+
+Run as `python -m src.scripts.load_test.stand_in_app`, with `CONFIG_FILE`
+pointing at a configuration that selects the memory-mapped vector store and
+the self-hosted model provider, so no database, model download or network
+access is needed.
+"""
+
+import argparse
+import time
+from typing import List
+
+import numpy as np
+import uvicorn
+from langchain.embeddings.base import Embeddings
+from langchain.embeddings.fake import DeterministicFakeEmbedding
+
+from src.mmap_index import write_index
+
+class StandInEmbeddings(Embeddings):
+    """Embedding model stand-in returning a fixed random vector per text.
+
+    Each call waits `delay_ms` to stand in for the model's forward pass.
+    """
+
+    def __init__(self, dimensions: int, delay_ms: float = 0.0):
+        self.model = DeterministicFakeEmbedding(size=dimensions)
+        self.delay_ms = delay_ms
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.delay_ms / 1000)
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.delay_ms / 1000)
+        return self.model.embed_query(text)
+
+def write_corpus(path: str, documents: int, dimensions: int, # pylint: disable=R0913
+                 quantization: str = "none", seed: int = 0, batch_size: int = 10000) -> int:
+    """Write an index of synthetic documents with random embeddings.
+
+    Args:
+        path: The index directory.
+        documents: The number of documents.
+        dimensions: The embedding size.
+        quantization: "none", "float16" or "int8".
+        seed: The random seed, so every run searches the same corpus.
+        batch_size: Documents generated at a time.
+
+    Returns:
+        The index version written.
+    """
+    rng = np.random.default_rng(seed)
+
+    def batches():
+        for start in range(0, documents, batch_size):
+            rows = range(start, min(start + batch_size, documents))
+            texts = [f"Synthetic document {row} describing step {row % 97} of an install."
+                     for row in rows]
+            metadatas = [{"source": f"https://docs.example.com/synthetic/{row}"} for row in rows]
+            yield texts, metadatas, rng.standard_normal((len(rows), dimensions),
+                                                        dtype=np.float32)
+    return write_index(path, batches(), quantization=quantization)
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description='Serve the app with a stand-in embedding model.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on.')
+    parser.add_argument('--dimensions', type=int, default=384,
+                        help='Embedding size; must match the index.')
+    parser.add_argument('--embedding-ms', type=float, default=0.0,
+                        help='Milliseconds each embedding call takes.')
+    return parser.parse_args()
+
+def main():
+    """Register the stand-in embedding model and serve the app."""
+    args = parse_args()
+    # Imported here so the load test can use `write_corpus` without loading the app.
+    from src.app import app # pylint: disable=C0415
+    from src.embeddings import embedding_model_name, model_registry # pylint: disable=C0415
+    model_registry.register(embedding_model_name,
+                            StandInEmbeddings(args.dimensions, args.embedding_ms))
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == '__main__':
+    main()
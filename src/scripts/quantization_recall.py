@@ -0,0 +1,105 @@
+"""Script to report the recall of quantized memory-mapped indexes."""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from src.config import Config
+from src.logging_setup import setup_logger
+from src.mmap_index import QUANTIZED_TYPES, MmapIndexSnapshot, read_current_version, write_index
+
+config = Config()
+logger = setup_logger()
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description='Compare the search results of quantized copies of a memory-mapped index '
+                    'with full precision ones.')
+    parser.add_argument('--collection',
+                        default=config.get('COLLECTION_NAME', "sample_collection"),
+                        help='Name of the collection to evaluate.')
+    parser.add_argument('--index-dir', default=config.get('MMAP_INDEX_DIR', "indexes"),
+                        help='Directory holding one index directory per collection.')
+    parser.add_argument('--queries', type=int, default=200,
+                        help='Stored embeddings sampled as queries.')
+    parser.add_argument('--k', type=int, default=10, help='Results per query.')
+    parser.add_argument('--rescore-factors', default='1,2,4',
+                        help='Comma separated candidates rescored per result.')
+    return parser.parse_args()
+
+def copy_vectors(snapshot, path, quantization):
+    """Write the snapshot's embeddings, without documents, as an index with a quantization."""
+    def batches():
+        for start in range(0, snapshot.count, 10000):
+            vectors = snapshot.vectors[start:start + 10000]
+            yield [""] * len(vectors), [{}] * len(vectors), vectors
+    write_index(path, batches(), snapshot.distance_strategy, quantization)
+    return MmapIndexSnapshot(os.path.join(path, "v1"))
+
+def recall_report(snapshot, queries, k, rescore_factors):
+    """Measure recall@k and latency of each quantization against full precision.
+
+    Args:
+        snapshot: The index to evaluate.
+        queries: The query embeddings.
+        k: Results per query.
+        rescore_factors: Candidates rescored per result.
+
+    Returns:
+        One dictionary per quantization and rescore factor.
+    """
+    report = []
+    with tempfile.TemporaryDirectory() as directory:
+        exact = copy_vectors(snapshot, os.path.join(directory, "none"), "none")
+        start = time.perf_counter()
+        expected, _ = exact.nearest_rows(queries, k)
+        report.append({"quantization": "none", "rescore_factor": None, "recall": 1.0,
+                       "ms_per_query": (time.perf_counter() - start) * 1000 / len(queries),
+                       "scanned_bytes_per_vector": 4 * snapshot.dimensions})
+        for quantization in QUANTIZED_TYPES:
+            quantized = copy_vectors(snapshot, os.path.join(directory, quantization),
+                                     quantization)
+            for factor in rescore_factors:
+                start = time.perf_counter()
+                found, _ = quantized.nearest_rows(queries, k, factor)
+                elapsed = time.perf_counter() - start
+                recall = np.mean([len(set(rows) & set(truth)) / len(truth)
+                                  for rows, truth in zip(found, expected)])
+                report.append({
+                    "quantization": quantization,
+                    "rescore_factor": factor,
+                    "recall": float(recall),
+                    "ms_per_query": elapsed * 1000 / len(queries),
+                    "scanned_bytes_per_vector":
+                        quantized.codes.dtype.itemsize * snapshot.dimensions + 4,
+                })
+    return report
+
+def main():
+    """Print the recall report of the collection's current index as JSON lines."""
+    args = parse_args()
+    path = os.path.join(args.index_dir, args.collection)
+    version = read_current_version(path)
+    if not version:
+        print(f"No index found at {path}")
+        return 1
+    snapshot = MmapIndexSnapshot(os.path.join(path, f"v{version}"))
+    if not snapshot.count:
+        print(f"{path} version {version} is empty")
+        return 1
+    rows = np.random.default_rng(0).choice(snapshot.count, min(args.queries, snapshot.count),
+                                           replace=False)
+    queries = np.asarray(snapshot.vectors[np.sort(rows)], dtype=np.float32)
+    factors = [int(factor) for factor in args.rescore_factors.split(',')]
+    for line in recall_report(snapshot, queries, args.k, factors):
+        print(json.dumps(line))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
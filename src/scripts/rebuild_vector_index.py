@@ -0,0 +1,48 @@
+"""Script to create or rebuild the approximate nearest neighbor index of a collection."""
+
+import argparse
+import sys
+
+from src.config import Config, get_settings
+from src.logging_setup import setup_logger
+from src.vector_store import INDEX_TYPES, IndexBuildInProgress, get_collection_store
+
+config = Config()
+logger = setup_logger()
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description='Rebuild the vector index of a collection, e.g. after a bulk load.')
+    parser.add_argument('--collection',
+                        default=config.get('COLLECTION_NAME', "sample_collection"),
+                        help='Name of the collection to index.')
+    parser.add_argument('--index-type', choices=INDEX_TYPES,
+                        default=get_settings().vector_index_type,
+                        help='Kind of index to build; an index of the other kind is dropped.')
+    parser.add_argument('--create-only', action='store_true',
+                        help='Only create the index if it is missing, without rebuilding it.')
+    return parser.parse_args()
+
+def main():
+    """Rebuild the index, then bump the collection version so every worker uses it."""
+    args = parse_args()
+    if args.index_type not in INDEX_TYPES:
+        logger.error("Invalid vector index type: %s", args.index_type)
+        return 1
+    store = get_collection_store(args.collection)
+    try:
+        name = store.build_index(args.index_type, rebuild=not args.create_only)
+    except IndexBuildInProgress as err:
+        logger.error("%s", err)
+        print(f"{args.collection}: index build in progress in another session")
+        return 1
+    if name is None:
+        print(f"{args.collection}: empty, nothing to index")
+        return 0
+    version = store.bump_collection_version()
+    print(f"{args.collection}: index {name}, version {version}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,249 @@
+"""Script to load test the app against local stand-ins for its dependencies.
+
+The app is started in its own process with a synthetic memory-mapped index in
+place of PGVector, a stand-in embedding model, and a fake self-hosted model
+server with a configurable latency and token rate, so the run needs neither a
+database nor network access. `/v1/find_sources` and `/v1/ask` are then driven at
+each requested concurrency, and the latency percentiles and throughput are
+written as a JSON report, optionally compared with a stored baseline report.
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Process
+
+import httpx
+
+from src.logging_setup import setup_logger
+from src.scripts.load_test.fake_model_server import serve
+from src.scripts.load_test.load_generator import compare_reports, run_load
+from src.scripts.load_test.stand_in_app import write_corpus
+
+logger = setup_logger()
+
+HOST = "127.0.0.1"
+COLLECTION_NAME = "load_test"
+EMBEDDING_MODEL_NAME = "load-test-stand-in"
+ENDPOINTS = ("find_sources", "ask")
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description='Measure the latency and throughput of the app against local stand-ins.')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                        help='Comma separated endpoints to drive.')
+    parser.add_argument('--concurrency', default='1,8,32',
+                        help='Comma separated numbers of requests in flight.')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='Requests measured per endpoint and concurrency.')
+    parser.add_argument('--warmup-requests', type=int, default=20,
+                        help='Requests sent, and not measured, before each endpoint.')
+    parser.add_argument('--num-results', type=int, default=3, help='Sources per query.')
+    parser.add_argument('--corpus-size', type=int, default=10000,
+                        help='Synthetic documents in the index.')
+    parser.add_argument('--dimensions', type=int, default=384, help='Embedding size.')
+    parser.add_argument('--quantization', default='none', choices=('none', 'float16', 'int8'),
+                        help='Quantization of the synthetic index.')
+    parser.add_argument('--embedding-ms', type=float, default=5.0,
+                        help='Milliseconds each call to the stand-in embedding model takes.')
+    parser.add_argument('--llm-latency-ms', type=float, default=200.0,
+                        help='Milliseconds the fake model server takes to the first token.')
+    parser.add_argument('--llm-tokens', type=int, default=64,
+                        help='Tokens the fake model server generates per prompt.')
+    parser.add_argument('--llm-tokens-per-second', type=float, default=200.0,
+                        help='Tokens the fake model server generates per second.')
+    parser.add_argument('--enable-caches', action='store_true',
+                        help='Keep the embedding, retrieval and answer caches enabled.')
+    parser.add_argument('--distinct-queries', type=int, default=100000,
+                        help='Distinct queries cycled through; lower it to exercise the caches.')
+    parser.add_argument('--timeout', type=float, default=60.0,
+                        help='Seconds before a request, or the app starting, fails.')
+    parser.add_argument('--output', help='File to write the JSON report to.')
+    parser.add_argument('--baseline', help='Report to compare the results with.')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Fraction a metric may get worse by before it is a regression.')
+    return parser.parse_args()
+
+def free_port() -> int:
+    """Return a TCP port nothing is listening on."""
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+def write_config(path: str, directory: str, model_port: int, args) -> str:
+    """Write the app configuration used for the load test.
+
+    Args:
+        path: The configuration file to write.
+        directory: Where the app keeps its index, ledger and logs.
+        model_port: The port of the fake model server.
+        args: The command-line arguments.
+
+    Returns:
+        The path of the configuration file.
+    """
+    settings = {
+        "MODEL_PROVIDER": "hosted",
+        "HOSTED_MODEL_URI": f"http://{HOST}:{model_port}/generate",
+        "VECTOR_STORE_BACKEND": "mmap",
+        "MMAP_INDEX_DIR": os.path.join(directory, "indexes"),
+        "COLLECTION_NAME": COLLECTION_NAME,
+        "EMBEDDING_MODEL_NAME": EMBEDDING_MODEL_NAME,
+        "SPEND_LEDGER_FILE": os.path.join(directory, "spend.db"),
+        "SPEND_LOG_FILE": os.path.join(directory, "spend.log"),
+        "LOG_FILE": os.path.join(directory, "app.log"),
+        "LOG_LEVEL": "WARNING",
+        "CONFIG_WATCH_INTERVAL": "0",
+    }
+    if not args.enable_caches:
+        settings.update({"EMBEDDING_CACHE_SIZE": "0", "RETRIEVAL_CACHE_SIZE": "0",
+                         "ANSWER_CACHE_SIZE": "0"})
+    with open(path, "w", encoding="utf-8") as file:
+        file.writelines(f"{key}={value}\n" for key, value in settings.items())
+    return path
+
+def wait_until_ready(url: str, timeout: float) -> bool:
+    """Poll a URL until it answers 200.
+
+    Args:
+        url: The URL to poll.
+        timeout: Seconds to wait.
+
+    Returns:
+        Whether the URL answered in time.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    return False
+
+def request_bodies(offset: int, args):
+    """Return a function giving the JSON body of the n-th request of a run.
+
+    Args:
+        offset: The number of requests sent before the run, so a run does not
+            repeat the queries of the previous one.
+        args: The command-line arguments.
+
+    Returns:
+        The function.
+    """
+    def make_body(number):
+        query = f"how do I install operator {(offset + number) % args.distinct_queries}"
+        return {"query": query, "num_results": args.num_results}
+    return make_body
+
+async def measure(app_url: str, args) -> list:
+    """Drive every endpoint at every concurrency.
+
+    Args:
+        app_url: The URL of the app.
+        args: The command-line arguments.
+
+    Returns:
+        The summary of every run.
+    """
+    runs = []
+    offset = 0
+    for endpoint in args.endpoints.split(','):
+        url = f"{app_url}/v1/{endpoint}"
+        await run_load(url, request_bodies(offset, args), args.warmup_requests, 1, args.timeout)
+        offset += args.warmup_requests
+        for concurrency in [int(value) for value in args.concurrency.split(',')]:
+            result = await run_load(url, request_bodies(offset, args), args.requests,
+                                    concurrency, args.timeout)
+            offset += args.requests
+            summary = result.summary()
+            logger.info("%s at concurrency %d: %.1f requests/s, p50 %.1fms, p99 %.1fms, "
+                        "%d errors", endpoint, concurrency, summary["throughput_rps"],
+                        summary["latency_ms"]["p50"], summary["latency_ms"]["p99"],
+                        summary["errors"])
+            runs.append({"endpoint": endpoint, "concurrency": concurrency, **summary})
+    return runs
+
+def run(args, directory: str) -> dict:
+    """Start the stand-ins and the app, measure them and return the report.
+
+    Args:
+        args: The command-line arguments.
+        directory: A scratch directory for the index, configuration and logs.
+
+    Returns:
+        The report.
+    """
+    start = time.perf_counter()
+    write_corpus(os.path.join(directory, "indexes", COLLECTION_NAME), args.corpus_size,
+                 args.dimensions, quantization=args.quantization)
+    logger.info("Wrote %d synthetic documents in %.1fs",
+                args.corpus_size, time.perf_counter() - start)
+
+    model_port, app_port = free_port(), free_port()
+    model_server = Process(target=serve, daemon=True,
+                           args=(HOST, model_port, args.llm_latency_ms, args.llm_tokens,
+                                 args.llm_tokens_per_second))
+    model_server.start()
+    env = {**os.environ,
+           "CONFIG_FILE": write_config(os.path.join(directory, ".env.config"), directory,
+                                       model_port, args),
+           "SECRETS_FILE": os.path.join(directory, ".env.secrets")}
+    command = [sys.executable, "-m", "src.scripts.load_test.stand_in_app", "--host", HOST,
+               "--port", str(app_port), "--dimensions", str(args.dimensions),
+               "--embedding-ms", str(args.embedding_ms)]
+    with subprocess.Popen(command, env=env) as app_server:
+        try:
+            app_url = f"http://{HOST}:{app_port}"
+            if not (wait_until_ready(f"http://{HOST}:{model_port}/health", args.timeout)
+                    and wait_until_ready(f"{app_url}/ready", args.timeout)):
+                raise RuntimeError("The app or the fake model server did not start")
+            runs = asyncio.run(measure(app_url, args))
+        finally:
+            app_server.terminate()
+            model_server.terminate()
+    settings = {key: value for key, value in vars(args).items()
+                if key not in ("output", "baseline", "tolerance", "timeout")}
+    return {"created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "settings": settings, "runs": runs}
+
+def main():
+    """Run the load test, print the report and compare it with the baseline."""
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            report = run(args, directory)
+        except RuntimeError as err:
+            logger.error("Load test failed: %s", err)
+            return 1
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            rows = compare_reports(report, json.load(file), args.tolerance)
+        report["comparison"] = {"baseline": args.baseline, "tolerance": args.tolerance,
+                                "metrics": rows}
+        for row in rows:
+            if row["regression"]:
+                logger.error("Regression in %s at concurrency %d: %s went from %s to %s",
+                             row["endpoint"], row["concurrency"], row["metric"],
+                             row["baseline"], row["current"])
+                exit_code = 1
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+    print(output)
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Module for coalescing identical concurrent calls into one."""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Hashable, Tuple
+
+class SingleFlight:
+    """Thread- and event-loop-safe deduplication of identical in-flight calls.
+
+    The first caller for a key runs the call; every caller that arrives with the
+    same key before it finishes waits for that call and receives its result (or
+    its exception) instead of running its own. Synchronous callers on threadpool
+    threads and coroutines on the event loop share the same in-flight calls.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def run(self, key: Hashable, function: Callable[..., Any], *args) -> Any:
+        """Run `function(*args)`, or wait for the in-flight call with the same key.
+
+        Args:
+            key: Identifies calls that produce the same result.
+            function: The function to call.
+            *args: The arguments to call it with.
+
+        Returns:
+            The result of the call.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = function(*args)
+        except BaseException as err:
+            self._finish(key, future, error=err)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    async def arun(self, key: Hashable, function: Callable[..., Awaitable[Any]], *args) -> Any:
+        """Await `function(*args)`, or wait for the in-flight call with the same key.
+
+        The call runs as its own task, so it still completes for the other waiters
+        if the caller that started it is cancelled.
+
+        Args:
+            key: Identifies calls that produce the same result.
+            function: The coroutine function to call.
+            *args: The arguments to call it with.
+
+        Returns:
+            The result of the call.
+        """
+        future, leader = self._join(key)
+        if leader:
+            task = asyncio.ensure_future(function(*args))
+            self._tasks.add(task)
+            task.add_done_callback(lambda done: self._settle(key, future, done))
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def stats(self) -> dict:
+        """Report how many calls ran and how many were served by another caller's call.
+
+        Returns:
+            A dictionary with the in-flight, executed and coalesced call counts.
+        """
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+            }
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        """Return the future for a key's call and whether this caller must run it."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            self.calls += 1
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future, result: Any = None,
+                error: BaseException = None):
+        """Stop sharing a call, then hand its outcome to the waiting callers."""
+        with self._lock:
+            del self._calls[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _settle(self, key: Hashable, future: Future, task: asyncio.Task):
+        """Hand a finished task's outcome to the waiting callers."""
+        self._tasks.discard(task)
+        if task.cancelled():
+            self._finish(key, future, error=asyncio.CancelledError())
+        elif task.exception() is not None:
+            self._finish(key, future, error=task.exception())
+        else:
+            self._finish(key, future, result=task.result())
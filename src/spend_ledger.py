@@ -0,0 +1,106 @@
+"""Module to keep a running, process-safe total of language model spend."""
+
+import os
+import sqlite3
+import threading
+import time
+
+from src.logging_setup import setup_logger
+
+logger = setup_logger()
+
+class SpendLedger:
+    """Running total of spend stored in a SQLite database in WAL mode.
+
+    Every recorded cost updates a single-row total in the same transaction as its
+    history entry, so budget checks read one row instead of re-summing a log, and
+    every worker process sharing the file sees the same total. The history is
+    compacted to the most recent `keep_entries` rows; the total is unaffected.
+    """
+
+    def __init__(self, path: str, legacy_log_file: str = None, keep_entries: int = 10000):
+        self.path = path
+        self.legacy_log_file = legacy_log_file
+        self.keep_entries = keep_entries
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, creating the schema on first use."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    self._create_schema(connection)
+                    self._initialized = True
+        return connection
+
+    def _create_schema(self, connection: sqlite3.Connection):
+        """Create the ledger tables, seeding the total from the legacy spend log once."""
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS spend_total "
+                "(id INTEGER PRIMARY KEY CHECK (id = 1), total REAL NOT NULL)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS spend_entries "
+                "(id INTEGER PRIMARY KEY AUTOINCREMENT, recorded_at REAL NOT NULL, "
+                "cost REAL NOT NULL)")
+            if connection.execute("SELECT total FROM spend_total").fetchone() is None:
+                legacy_total = self._read_legacy_total()
+                connection.execute("INSERT INTO spend_total (id, total) VALUES (1, ?)",
+                                   (legacy_total,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _read_legacy_total(self) -> float:
+        """Sum the legacy one-cost-per-line spend log, if there is one."""
+        if not self.legacy_log_file or not os.path.exists(self.legacy_log_file):
+            return 0.0
+        with open(self.legacy_log_file, "r", encoding="utf-8") as file:
+            legacy_total = sum(float(line.strip()) for line in file if line.strip())
+        logger.info("Imported $%.5f of spend from %s", legacy_total, self.legacy_log_file)
+        return legacy_total
+
+    def record(self, cost: float) -> float:
+        """Atomically add a cost to the ledger.
+
+        Args:
+            cost: The cost to add, in dollars.
+
+        Returns:
+            The total spent after adding the cost.
+        """
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = connection.execute(
+                "INSERT INTO spend_entries (recorded_at, cost) VALUES (?, ?)", (time.time(), cost))
+            entry_id = cursor.lastrowid
+            connection.execute("UPDATE spend_total SET total = total + ? WHERE id = 1", (cost,))
+            total = connection.execute("SELECT total FROM spend_total WHERE id = 1").fetchone()[0]
+            if self.keep_entries and entry_id % self.keep_entries == 0:
+                connection.execute("DELETE FROM spend_entries WHERE id <= ?",
+                                   (entry_id - self.keep_entries,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return total
+
+    def total(self) -> float:
+        """Return the total spent so far.
+
+        Returns:
+            The total spent, in dollars.
+        """
+        row = self._connect().execute("SELECT total FROM spend_total WHERE id = 1").fetchone()
+        return row[0]
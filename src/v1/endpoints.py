@@ -1,23 +1,44 @@
 """Module to define API routing and handle interactions with language models."""
 
+import json
+import time
+from contextlib import contextmanager
+from typing import List, Union
+
 from fastapi import APIRouter, Body, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel # pylint: disable=E0611
-from langchain.llms import OpenAI
-from langchain.llms import VertexAI
-from langchain.callbacks import get_openai_callback
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
-
-from src.hosted_llm import HostedLLM
-from src.hosted_llm import CustomLlamaParser
-from src.config import Config
+
+from src.answer_cache import SemanticAnswerCache
+from src.config import Config, get_settings
 from src.embeddings import EmbeddingSource
 from src.logging_setup import setup_logger
+from src.metrics import language_model_errors, language_model_seconds, spend_dollars_total
+from src.metrics import tokens_total
+from src.providers import provider_registry
+from src.request_trace import annotate, current_trace, record_stage, time_stage
+from src.single_flight import SingleFlight
+from src.vector_store import SearchParams
+from src.spend_ledger import SpendLedger
 
 config = Config()
 logger = setup_logger()
 
+spend_ledger = SpendLedger(
+    config.get("SPEND_LEDGER_FILE", "spend.db"),
+    legacy_log_file=config.get("SPEND_LOG_FILE", "spend.log"),
+    keep_entries=int(config.get("SPEND_LEDGER_KEEP_ENTRIES", "10000")),
+)
+
+answer_cache = SemanticAnswerCache(
+    max_size=int(config.get("ANSWER_CACHE_SIZE", "1024")),
+    threshold=float(config.get("ANSWER_CACHE_THRESHOLD", "0.95")),
+    ttl_seconds=float(config.get("ANSWER_CACHE_TTL", "3600")),
+)
+
+request_flights = SingleFlight()
+
 router = APIRouter()
 
 class HandleRequestPostBody(BaseModel): # pylint: disable=R0903
@@ -33,24 +54,122 @@ def call_language_model(input_val):
     Returns:
         The result from the language model.
     """
-    model_provider = config.get("MODEL_PROVIDER", "UNDEFINED")
+    model_provider = get_settings().model_provider
     logger.debug("Using model provider: %s", model_provider)
-    prompt = PromptTemplate(
-        input_variables=["input_val"],
-        template="Pay close attention to the following... {input_val}",
-    )
-    if model_provider == 'openai':
-        result = call_openai(input_val, prompt)
-    elif model_provider == 'vertex':
-        result = call_vertexai(input_val, prompt)
-    elif model_provider == 'hosted':
-        result = call_hosted_llm(input_val, prompt)
-    else:
-        raise ValueError(f"Invalid model name: {model_provider}")
+    with observe_language_model(model_provider):
+        if model_provider == 'openai':
+            result = call_openai(input_val)
+        elif model_provider == 'vertex':
+            result = call_vertexai(input_val)
+        elif model_provider == 'hosted':
+            result = call_hosted_llm(input_val)
+        else:
+            raise ValueError(f"Invalid model name: {model_provider}")
     return result
 
+async def acall_language_model(input_val):
+    """Call the language model without blocking the event loop and return the result.
+
+    Args:
+        input_val: The input value to pass to the language model.
+
+    Returns:
+        The result from the language model.
+    """
+    model_provider = get_settings().model_provider
+    logger.debug("Using model provider: %s", model_provider)
+    with observe_language_model(model_provider):
+        if model_provider == 'openai':
+            result = await acall_openai(input_val)
+        elif model_provider == 'vertex':
+            result = await acall_vertexai(input_val)
+        elif model_provider == 'hosted':
+            result = await acall_hosted_llm(input_val)
+        else:
+            raise ValueError(f"Invalid model name: {model_provider}")
+    return result
+
+@contextmanager
+def observe_language_model(model_provider):
+    """Record the latency, and any failure, of a language model call.
+
+    Args:
+        model_provider: The configured model provider.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        language_model_errors.inc(provider=model_provider)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        language_model_seconds.observe(elapsed, provider=model_provider)
+        record_stage("language_model", elapsed)
+        model = provider_registry.loaded().get(model_provider)
+        annotate(provider=model_provider, model=model[1] if model else None)
+
+def language_model_chain(model_provider):
+    """Return the shared chain for the given model provider.
+
+    Args:
+        model_provider: The configured model provider.
+
+    Returns:
+        The language model chain.
+    """
+    return provider_registry.get_chain(model_provider)
+
+def estimate_tokens(text):
+    """Roughly estimate the token count of a text (about four characters per token).
+
+    Args:
+        text: The text to estimate.
+
+    Returns:
+        The estimated number of tokens.
+    """
+    return max(1, len(text) // 4)
+
+async def astream_language_model(input_val):
+    """Stream the language model's response as the provider produces it.
+
+    Providers with native async streaming (OpenAI) are streamed directly,
+    providers with only synchronous streaming (Vertex AI) are streamed from the
+    threadpool, and providers without streaming (the hosted model) fall back to
+    yielding the whole response as a single chunk.
+
+    Args:
+        input_val: The input value to pass to the language model.
 
-def call_hosted_llm(input_val, prompt):
+    Yields:
+        Chunks of the response text.
+    """
+    from langchain.llms.base import BaseLLM # pylint: disable=C0415
+    model_provider = get_settings().model_provider
+    logger.debug("Streaming from model provider: %s", model_provider)
+    chain = language_model_chain(model_provider)
+    llm = chain.llm
+    text = chain.prompt.format(input_val=input_val)
+    completion = []
+    with observe_language_model(model_provider):
+        if type(llm)._astream is not BaseLLM._astream: # pylint: disable=W0212
+            async for chunk in llm.astream(text):
+                completion.append(chunk)
+                yield chunk
+        elif type(llm)._stream is not BaseLLM._stream: # pylint: disable=W0212
+            async for chunk in iterate_in_threadpool(llm.stream(text)):
+                completion.append(chunk)
+                yield chunk
+        else:
+            yield await chain.arun(input_val)
+    if model_provider == 'openai':
+        # Streamed completions carry no usage data, so spend is estimated.
+        await run_in_threadpool(token_cost,
+                                estimate_tokens(text) + estimate_tokens(''.join(completion)))
+
+
+def call_hosted_llm(input_val):
     """Call the hosted language model and return the result.
 
     Args:
@@ -59,16 +178,21 @@ def call_hosted_llm(input_val, prompt):
     Returns:
         The result from the language model.
     """
-    hosted_model_name = config.get("HOSTED_MODEL_NAME", "Llama2-Hosted")
-    logger.debug("Using self-hosted model: %s", hosted_model_name)
-    hosted_model_uri = config.get("HOSTED_MODEL_URI", None)
-    llm = HostedLLM(uri=hosted_model_uri)
-    chain = LLMChain(llm=llm, prompt=prompt, output_parser=CustomLlamaParser())
-    result = chain.run(input_val)
-    return result
+    return language_model_chain('hosted').run(input_val)
 
+async def acall_hosted_llm(input_val):
+    """Call the hosted language model asynchronously and return the result.
 
-def call_vertexai(input_val, prompt):
+    Args:
+        input_val: The input value to pass to the language model.
+
+    Returns:
+        The result from the language model.
+    """
+    return await language_model_chain('hosted').arun(input_val)
+
+
+def call_vertexai(input_val):
     """Call the Vertex AI language model and return the result.
 
     Args:
@@ -77,15 +201,20 @@ def call_vertexai(input_val, prompt):
     Returns:
         The result from the language model.
     """
-    vertex_model_name = config.get("VERTEX_MODEL_NAME", "text-bison")
-    logger.debug("Using Vertex AI model: %s", vertex_model_name)
-    llm = VertexAI(model_name=vertex_model_name, temperature=float(
-        config.get("MODEL_TEMPERATURE", 0.0)))
-    chain = LLMChain(llm=llm, prompt=prompt)
-    result = chain.run(input_val)
-    return result
+    return language_model_chain('vertex').run(input_val)
 
-def call_openai(input_val, prompt):
+async def acall_vertexai(input_val):
+    """Call the Vertex AI language model asynchronously and return the result.
+
+    Args:
+        input_val: The input value to pass to the language model.
+
+    Returns:
+        The result from the language model.
+    """
+    return await language_model_chain('vertex').arun(input_val)
+
+def call_openai(input_val):
     """Call the OpenAI language model and return the result.
 
     Args:
@@ -94,12 +223,9 @@ def call_openai(input_val, prompt):
     Returns:
         The result from the language model.
     """
-    openai_model_name = config.get("OPENAI_MODEL_NAME", "gpt-3.5-turbo")
-    logger.debug("Using OpenAI model: %s", openai_model_name)
+    from langchain.callbacks import get_openai_callback # pylint: disable=C0415
     if not spend_limit_exceeded():
-        llm = OpenAI(model_name=openai_model_name, temperature=float(
-            config.get("MODEL_TEMPERATURE", 0.0)))
-        chain = LLMChain(llm=llm, prompt=prompt)
+        chain = language_model_chain('openai')
         with get_openai_callback() as openai_callback:
             result = chain.run(input_val)
         token_cost(openai_callback.total_tokens)
@@ -108,6 +234,27 @@ def call_openai(input_val, prompt):
 
     return result
 
+async def acall_openai(input_val):
+    """Call the OpenAI language model asynchronously and return the result.
+
+    Args:
+        input_val: The input value to pass to the language model.
+
+    Returns:
+        The result from the language model.
+    """
+    from langchain.callbacks import get_openai_callback # pylint: disable=C0415
+    # The spend ledger is a SQLite file, so it is read and written off the event loop.
+    if not await run_in_threadpool(spend_limit_exceeded):
+        chain = language_model_chain('openai')
+        with get_openai_callback() as openai_callback:
+            result = await chain.arun(input_val)
+        await run_in_threadpool(token_cost, openai_callback.total_tokens)
+    else:
+        raise HTTPException(status_code=402, detail="Spending limit exceeded")
+
+    return result
+
 def token_cost(total_tokens):
     """Calculate the cost of the tokens and log it.
 
@@ -117,15 +264,15 @@ def token_cost(total_tokens):
     Returns:
         The total cost of the tokens.
     """
-    spend_log_file = config.get("SPEND_LOG_FILE", "spend.log")
-    openai_model_price = config.get("OPENAI_MODEL_PRICE", "0.000006")
-    total_cost = total_tokens * float(openai_model_price)
+    total_cost = total_tokens * get_settings().openai_model_price
     logger.debug("Total tokens: %f", total_tokens)
     logger.debug("Total cost: $%.5f", total_cost)
 
-    with open(spend_log_file, "a", encoding="utf-8") as file:
-        file.write(f"{total_cost:.5f}\n")
-    total_spent = calculate_total_spent(spend_log_file)
+    total_spent = spend_ledger.record(total_cost)
+    logger.debug("Total Spent: $%.5f", total_spent)
+    tokens_total.inc(total_tokens, provider="openai")
+    spend_dollars_total.inc(total_cost, provider="openai")
+    annotate(tokens=total_tokens, cost_dollars=total_cost)
     return JSONResponse(
         {
             "total_tokens": total_tokens,
@@ -134,17 +281,16 @@ def token_cost(total_tokens):
         }
     )
 
-def calculate_total_spent(spend_log_file):
+def calculate_total_spent():
     """Calculate the total amount spent on tokens.
 
     Args:
-        spend_log_file: The file containing the spend log.
+        None
 
     Returns:
         The total amount spent on tokens.
     """
-    with open(spend_log_file, "r", encoding="utf-8") as file:
-        total_spent = sum(float(line.strip()) for line in file)
+    total_spent = spend_ledger.total()
     logger.debug("Total Spent: $%.5f", total_spent)
     return total_spent
 
@@ -157,17 +303,16 @@ def spend_limit_exceeded():
     Returns:
         True if the spend limit has been exceeded, False otherwise.
     """
-    spend_log_file = config.get("SPEND_LOG_FILE", "spend.log")
-    spend_limit = config.get("SPEND_LIMIT", "0.001")
-    total_spent = calculate_total_spent(spend_log_file)
-    if total_spent > float(spend_limit):
-        logger.error("SPEND_LIMIT ($%.5f) exceeded: $%.5f", float(spend_limit), total_spent)
+    settings = get_settings()
+    spend_limit = settings.spend_limit
+    total_spent = calculate_total_spent()
+    if total_spent > spend_limit:
+        logger.error("SPEND_LIMIT ($%.5f) exceeded: $%.5f", spend_limit, total_spent)
         return True
     # use SPENDING_WARNING_PCT to determine when to send warning
-    spending_warning_pct = config.get("SPENDING_WARNING_PCT", "0.8")
-    if float(spend_limit) * float(spending_warning_pct) < total_spent <= float(spend_limit):
+    if spend_limit * settings.spending_warning_pct < total_spent <= spend_limit:
         logger.warning("SPEND_LIMIT warning")
-    logger.debug("SPEND_LIMIT ($%.5f) not exceeded: $%.5f", float(spend_limit), total_spent)
+    logger.debug("SPEND_LIMIT ($%.5f) not exceeded: $%.5f", spend_limit, total_spent)
     return False
 
 def get_bot_response(user_input):
@@ -186,6 +331,109 @@ def get_bot_response(user_input):
         return 'My name is Chat Bot!'
     return call_language_model(user_input)
 
+async def aget_bot_response(user_input):
+    """Get the bot response without blocking the event loop.
+
+    Args:
+        user_input: The user input to pass to the bot.
+
+    Returns:
+        The bot response.
+    """
+    logger.info(user_input)
+    if user_input == 'hello':
+        return 'Hi there!'
+    if user_input == 'what is your name?':
+        return 'My name is Chat Bot!'
+    return await acall_language_model(user_input)
+
+def search_sources(query, num_results, search_params=None):
+    """Search the embedding sources for a query.
+
+    Args:
+        query: The user query, or a list of queries.
+        num_results: The number of results to return.
+        search_params: The vector index search knobs.
+
+    Returns:
+        A list of dictionaries containing the results, or one such list per query.
+    """
+    embeddings = EmbeddingSource()
+    return embeddings.get_source(query, num_results, search_params)
+
+def retrieve_sources(query, num_results, search_params=None):
+    """Retrieve the embedding sources for a query.
+
+    Identical concurrent retrievals share a single search.
+
+    Args:
+        query: The user query, or a list of queries.
+        num_results: The number of results to return.
+        search_params: The vector index search knobs.
+
+    Returns:
+        A list of dictionaries containing the results, or one such list per query.
+    """
+    search_params = search_params or SearchParams()
+    key = ("sources", tuple(query) if isinstance(query, list) else query, num_results,
+           search_params)
+    return request_flights.run(key, search_sources, query, num_results, search_params)
+
+def requested_trace(trace):
+    """Return the current request's stage breakdown if the caller asked for it.
+
+    Args:
+        trace: Whether the caller asked for a trace.
+
+    Returns:
+        The trace dictionary, or None if no trace was asked for, traces are
+        disabled with REQUEST_TRACE_ENABLED, or the request is not traced.
+    """
+    if not trace or not get_settings().request_trace_enabled:
+        return None
+    request_trace = current_trace()
+    return request_trace.to_dict() if request_trace is not None else None
+
+def with_trace(response, trace):
+    """Add the requested stage breakdown to a response body.
+
+    Args:
+        response: The response dictionary.
+        trace: Whether the caller asked for a trace.
+
+    Returns:
+        The response, with a `trace` entry if one was asked for.
+    """
+    breakdown = requested_trace(trace)
+    if breakdown is not None:
+        response["trace"] = breakdown
+    return response
+
+def answer_cache_key(query, num_results, prompt, search_params):
+    """Embed a query and collect everything its answer depends on.
+
+    Args:
+        query: The user query.
+        num_results: The number of sources the answer is based on.
+        prompt: The custom prompt, if any.
+        search_params: The vector index search knobs.
+
+    Returns:
+        The (collection, collection version, context, query embedding) the answer
+        is cached under, or None if the vector store is unavailable.
+    """
+    if answer_cache.max_size <= 0:
+        return None
+    try:
+        embeddings = EmbeddingSource()
+        database = embeddings.get_database()
+        context = (num_results, prompt, get_settings().model_provider, search_params)
+        return (database.collection_name, database.collection_version(), context,
+                embeddings.embed_query(query))
+    except Exception as err: # pylint: disable=W0703
+        logger.warning("Answer cache lookup skipped: %s", err)
+        return None
+
 
 @router.get("/api_version_test/")
 async def read_items():
@@ -208,7 +456,7 @@ async def handle_request_post(request_body: HandleRequestPostBody):
         dict: A dictionary containing the bot response.
     """
     user_input = request_body.user_input
-    bot_response = get_bot_response(user_input)
+    bot_response = await aget_bot_response(user_input)
     return {"bot_response": bot_response}
 
 @router.post("/find_sources", responses = {401: {
@@ -220,54 +468,49 @@ async def handle_request_post(request_body: HandleRequestPostBody):
                                             }
                                         }
                                 }})
-def get_embedding_source(query: str = Body("step by step instructions to install a new operator"),
-                        num_results: int = Body(3)):
-    """Endpoint to get embedding sources for a given query.
+def get_embedding_source(
+        query: Union[str, List[str]] = Body("step by step instructions to install a new operator"),
+        num_results: int = Body(3),
+        ef_search: int = Body(None, ge=1, le=1000),
+        probes: int = Body(None, ge=1),
+        trace: bool = Body(False)):
+    """Endpoint to get embedding sources for a given query or batch of queries.
 
     Args:
-        request_body: The body of the request containing the query and number of results.
+        query: The query text, or a list of queries to look up in one batch.
+        num_results: The number of results to return per query.
+        ef_search: The HNSW candidate list size; higher is slower but more accurate.
+        probes: The number of IVFFlat lists searched; higher is slower but more accurate.
+        trace: Whether to include the request's per-stage timing breakdown.
 
     Returns:
-        dict: A dictionary containing the embedding source.
+        dict: A dictionary containing the embedding source, or one list of sources
+            per query when a list of queries is given.
     """
+    max_batch_queries = get_settings().max_batch_queries
+    if isinstance(query, list) and len(query) > max_batch_queries:
+        raise HTTPException(status_code=422,
+                            detail=f"At most {max_batch_queries} queries per request")
+    result = retrieve_sources(query, num_results, SearchParams(ef_search, probes))
+    return with_trace({"find_sources": result}, trace)
 
-    if isinstance(query, list):
-        query = ' '.join(query)
-    embeddings = EmbeddingSource()
-    result = embeddings.get_source(query, num_results)
-    return {"find_sources": result}
 
-
-@router.post("/ask", responses = {402: {
-                                        "description": "Payment Required",
-                                        "content": {
-                                            "application/json": {
-                                                "schema": {
-                                                }
-                                            }
-                                        }
-                                }})
-def synthesize_response(
-                        query: str = Body("step by step instructions to install a new operator"),
-                        num_results: int = Body(3),
-                        prompt: str = Body(None)
-                    ):
-    """Endpoint to synthesize a response to a user query.
+def build_rag_prompt(query, embedding_results, prompt=None):
+    """Build the retrieval-augmented prompt sent to the language model.
 
     Args:
         query: The user query.
-        num_results: The number of results to return.
-        prompt: The prompt to use for the response.
+        embedding_results: The sources retrieved for the query.
+        prompt: An optional custom prompt with an `{embedding_results}` placeholder.
 
     Returns:
-        dict: A dictionary containing the bot response.
+        The formatted prompt.
     """
-    if isinstance(query, list):
-        query = ' '.join(query)
-
-    embeddings = EmbeddingSource()
-    embedding_results = embeddings.get_source(query, num_results)
+    with time_stage("prompt_assembly"):
+        return _build_rag_prompt(query, embedding_results, prompt)
 
+def _build_rag_prompt(query, embedding_results, prompt):
+    """Format the retrieval-augmented prompt; see `build_rag_prompt`."""
     embedding_results_text = '\n\n---\n\n'.join([
         (
             f"Source: <a href=\"{result.get('source_link', '#')}\">"
@@ -293,18 +536,194 @@ def synthesize_response(
             f"{query} [/INST]"
         )
 
-    prompt = prompt.format(embedding_results=embedding_results_text)
-    logger.info("Query: %s", query)
-    logger.info("Prompt: %s", prompt)
-    bot_response = call_language_model(prompt)
+    return prompt.format(embedding_results=embedding_results_text)
+
+def sources_footer(embedding_results):
+    """Build the list of sources appended to every synthesized response.
 
+    Args:
+        embedding_results: The sources retrieved for the query.
+
+    Returns:
+        The text to append to the bot response.
+    """
     sources_used = [
         f"<a href=\"{result.get('source_link', '#')}\">{result['source']}</a>"
         for result in embedding_results
     ]
     if sources_used:
-        bot_response += "\n\nPossibly Related Sources:\n" + '\n'.join(sources_used)
-    else:
-        bot_response += "\n\nNo Sources Found"
+        return "\n\nPossibly Related Sources:\n" + '\n'.join(sources_used)
+    return "\n\nNo Sources Found"
 
-    return {"bot_response": bot_response}
+async def answer_query(query, num_results, prompt, cache_key, search_params):
+    """Retrieve sources for a query and generate an answer from them.
+
+    Args:
+        query: The user query.
+        num_results: The number of sources to retrieve.
+        prompt: The custom prompt, if any.
+        cache_key: Where to store the answer in the answer cache, if anywhere.
+        search_params: The vector index search knobs.
+
+    Returns:
+        The answer followed by the list of sources.
+    """
+    embedding_results = await run_in_threadpool(retrieve_sources, query, num_results,
+                                                search_params)
+
+    rag_prompt = build_rag_prompt(query, embedding_results, prompt)
+    logger.info("Query: %s", query)
+    logger.debug("Prompt: %s", rag_prompt)
+    bot_response = await acall_language_model(rag_prompt)
+    failed = bot_response.startswith("Model Server is not Working")
+    bot_response += sources_footer(embedding_results)
+
+    if cache_key is not None and not failed:
+        answer_cache.put(*cache_key, bot_response)
+    return bot_response
+
+@router.post("/ask", responses = {402: {
+                                        "description": "Payment Required",
+                                        "content": {
+                                            "application/json": {
+                                                "schema": {
+                                                }
+                                            }
+                                        }
+                                }})
+async def synthesize_response( # pylint: disable=R0913
+                        query: str = Body("step by step instructions to install a new operator"),
+                        num_results: int = Body(3),
+                        prompt: str = Body(None),
+                        ef_search: int = Body(None, ge=1, le=1000),
+                        probes: int = Body(None, ge=1),
+                        trace: bool = Body(False)
+                    ):
+    """Endpoint to synthesize a response to a user query.
+
+    Args:
+        query: The user query.
+        num_results: The number of results to return.
+        prompt: The prompt to use for the response.
+        ef_search: The HNSW candidate list size; higher is slower but more accurate.
+        probes: The number of IVFFlat lists searched; higher is slower but more accurate.
+        trace: Whether to include the request's per-stage timing breakdown.
+
+    Returns:
+        dict: A dictionary containing the bot response.
+    """
+    if isinstance(query, list):
+        query = ' '.join(query)
+
+    search_params = SearchParams(ef_search, probes)
+    cache_key = await run_in_threadpool(answer_cache_key, query, num_results, prompt,
+                                        search_params)
+    if cache_key is not None:
+        cached = answer_cache.get(*cache_key)
+        if cached is not None:
+            logger.info("Answer cache hit for query: %s", query)
+            annotate(answer_cache="hit")
+            return with_trace({"bot_response": cached}, trace)
+
+    flight_key = ("ask", query, num_results, prompt, get_settings().model_provider,
+                  search_params)
+    bot_response = await request_flights.arun(flight_key, answer_query, query, num_results,
+                                              prompt, cache_key, search_params)
+    return with_trace({"bot_response": bot_response}, trace)
+
+def sse_event(event, data):
+    """Format one Server-Sent Event.
+
+    Args:
+        event: The event name.
+        data: The JSON-serializable event payload.
+
+    Returns:
+        The encoded event.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def ask_event_stream(embedding_results, prompt, trace=False):
+    """Stream the sources, then the response tokens, as Server-Sent Events.
+
+    The `token` events concatenate to the same text `/ask` returns as `bot_response`.
+
+    Args:
+        embedding_results: The sources retrieved for the query.
+        prompt: The prompt to send to the language model.
+        trace: Whether to send the request's per-stage timing breakdown in the
+            `done` event.
+
+    Yields:
+        The encoded events.
+    """
+    yield sse_event("sources", [
+        {
+            "source": result['source'],
+            "source_link": result.get('source_link', '#'),
+            "score": result.get('score'),
+        }
+        for result in embedding_results
+    ])
+    try:
+        async for token in astream_language_model(prompt):
+            yield sse_event("token", {"text": token})
+    except Exception as err: # pylint: disable=W0703
+        logger.error("Streaming response failed: %s", err)
+        yield sse_event("error", {"message": "An internal error occurred"})
+        return
+    yield sse_event("token", {"text": sources_footer(embedding_results)})
+    yield sse_event("done", with_trace({}, trace))
+
+@router.post("/ask/stream", responses = {
+                                200: {
+                                        "description": "Server-Sent Events: `sources`, then "
+                                                       "`token` events, then `done` or `error`",
+                                        "content": {"text/event-stream": {}}
+                                },
+                                402: {
+                                        "description": "Payment Required",
+                                        "content": {
+                                            "application/json": {
+                                                "schema": {
+                                                }
+                                            }
+                                        }
+                                }})
+async def synthesize_response_stream( # pylint: disable=R0913
+                        query: str = Body("step by step instructions to install a new operator"),
+                        num_results: int = Body(3),
+                        prompt: str = Body(None),
+                        ef_search: int = Body(None, ge=1, le=1000),
+                        probes: int = Body(None, ge=1),
+                        trace: bool = Body(False)
+                    ):
+    """Endpoint to stream a synthesized response to a user query as Server-Sent Events.
+
+    Args:
+        query: The user query.
+        num_results: The number of results to return.
+        prompt: The prompt to use for the response.
+        ef_search: The HNSW candidate list size; higher is slower but more accurate.
+        probes: The number of IVFFlat lists searched; higher is slower but more accurate.
+        trace: Whether to send the request's per-stage timing breakdown in the `done` event.
+
+    Returns:
+        StreamingResponse: The retrieved sources followed by the response tokens.
+    """
+    if isinstance(query, list):
+        query = ' '.join(query)
+
+    embedding_results = await run_in_threadpool(retrieve_sources, query, num_results,
+                                                SearchParams(ef_search, probes))
+
+    prompt = build_rag_prompt(query, embedding_results, prompt)
+    logger.info("Query: %s", query)
+    logger.debug("Prompt: %s", prompt)
+    if (get_settings().model_provider == 'openai'
+            and await run_in_threadpool(spend_limit_exceeded)):
+        raise HTTPException(status_code=402, detail="Spending limit exceeded")
+
+    return StreamingResponse(ask_event_stream(embedding_results, prompt, trace),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
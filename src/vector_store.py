@@ -0,0 +1,553 @@
+"""Module for pooled, long-lived access to pgvector collections."""
+
+import math
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import sqlalchemy
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from langchain.docstore.document import Document
+from langchain.schema.embeddings import Embeddings
+from langchain.vectorstores.pgvector import DistanceStrategy, PGVector
+from pgvector.sqlalchemy import Vector
+
+from src.config import Config, get_settings
+from src.logging_setup import setup_logger
+from src.request_trace import current_trace
+
+config = Config()
+logger = setup_logger()
+
+DISTANCE_OPERATORS = {
+    DistanceStrategy.EUCLIDEAN: "<->",
+    DistanceStrategy.COSINE: "<=>",
+    DistanceStrategy.MAX_INNER_PRODUCT: "<#>",
+}
+
+INDEX_OPERATOR_CLASSES = {
+    DistanceStrategy.EUCLIDEAN: "vector_l2_ops",
+    DistanceStrategy.COSINE: "vector_cosine_ops",
+    DistanceStrategy.MAX_INNER_PRODUCT: "vector_ip_ops",
+}
+
+INDEX_TYPES = ("hnsw", "ivfflat")
+
+HNSW_MAX_EF_SEARCH = 1000
+
+class IndexBuildInProgress(RuntimeError):
+    """Raised when another session is already building a collection's index."""
+
+class SearchParams(NamedTuple):
+    """Per-query recall/latency knobs for approximate nearest neighbor indexes.
+
+    `ef_search` is the HNSW candidate list size and `probes` the number of IVFFlat
+    lists searched; higher values trade latency for recall. None uses the
+    configured default.
+    """
+    ef_search: Optional[int] = None
+    probes: Optional[int] = None
+
+metadata = sqlalchemy.MetaData()
+
+collection_versions = sqlalchemy.Table(
+    "deep_thought_collection_version",
+    metadata,
+    sqlalchemy.Column("name", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("version", sqlalchemy.BigInteger, nullable=False),
+)
+
+class EnginePool:
+    """A pooled SQLAlchemy engine shared by every collection on one database."""
+
+    def __init__(self, connection_string: str):
+        self.connection_string = connection_string
+        settings = get_settings()
+        self.engine = sqlalchemy.create_engine(
+            connection_string,
+            pool_size=settings.pg_pool_size,
+            max_overflow=settings.pg_max_overflow,
+            pool_timeout=settings.pg_pool_timeout,
+            pool_recycle=settings.pg_pool_recycle,
+            pool_pre_ping=settings.pg_pool_pre_ping,
+        )
+        self._lock = threading.Lock()
+        self._checkouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @contextmanager
+    def session(self):
+        """Check a connection out of the pool and yield a session bound to it.
+
+        The time spent waiting for a free connection is recorded for `stats`.
+        """
+        start = time.perf_counter()
+        connection = self.engine.connect()
+        wait = time.perf_counter() - start
+        trace = current_trace()
+        if trace is not None:
+            trace.add_stage("pool_wait", wait)
+        with self._lock:
+            self._checkouts += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+        try:
+            with Session(bind=connection) as session:
+                yield session
+        finally:
+            connection.close()
+
+    def stats(self) -> dict:
+        """Report pool usage so the pool can be sized for the worker count.
+
+        Returns:
+            A dictionary with pool size, in-use connections and checkout wait times.
+        """
+        pool = self.engine.pool
+        with self._lock:
+            return {
+                "pool_size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+                "checkouts": self._checkouts,
+                "checkout_wait_avg_seconds": (self._total_wait / self._checkouts
+                                              if self._checkouts else 0.0),
+                "checkout_wait_max_seconds": self._max_wait,
+            }
+
+    def dispose(self):
+        """Close every pooled connection."""
+        self.engine.dispose()
+
+class PooledPGVector(PGVector): # pylint: disable=R0902
+    """PGVector store that borrows connections from a shared `EnginePool`.
+
+    Unlike `PGVector`, constructing it neither opens a connection nor runs the
+    extension/table/collection setup; that happens once in `prepare`.
+
+    When `VECTOR_INDEX_TYPE` is "hnsw" or "ivfflat", each collection gets its own
+    partial index over its embeddings cast to their fixed dimensions (the shared
+    embedding column has no dimensions, so it cannot be indexed directly), and
+    searches use the same cast so the planner can pick the index. The index is
+    built by ingestion or `src/scripts/rebuild_vector_index.py`, never by the app,
+    so starting a worker does not wait for, or interfere with, a build.
+    """
+
+    def __init__(self, engine_pool: EnginePool, collection_name: str,
+                 embedding_function: Embeddings):
+        self.engine_pool = engine_pool
+        self.collection_id = None
+        settings = get_settings()
+        self.version_poll_seconds = settings.retrieval_cache_version_poll
+        self.index_type = settings.vector_index_type
+        self.index_dimensions = None
+        self._version = None
+        self._version_checked_at = 0.0
+        self._prepare_lock = threading.Lock()
+        super().__init__(
+            connection_string=engine_pool.connection_string,
+            embedding_function=embedding_function,
+            collection_name=collection_name,
+        )
+
+    def __post_init__(self) -> None:
+        from langchain.vectorstores._pgvector_data_models import ( # pylint: disable=C0415
+            CollectionStore,
+            EmbeddingStore,
+        )
+        self.CollectionStore = CollectionStore # pylint: disable=C0103
+        self.EmbeddingStore = EmbeddingStore # pylint: disable=C0103
+        self._conn = self.engine_pool.engine
+
+    def connect(self) -> sqlalchemy.engine.Engine:
+        return self.engine_pool.engine
+
+    @property
+    def is_prepared(self) -> bool:
+        """Whether the one-time schema checks have run for this collection."""
+        return self.collection_id is not None
+
+    def prepare(self):
+        """Run the one-time table and collection checks and cache the collection id.
+
+        Only looks up the collection's index; see `build_index` to create it.
+        """
+        with self._prepare_lock:
+            if self.is_prepared:
+                return
+            self.create_tables_if_not_exists()
+            metadata.create_all(self.engine_pool.engine)
+            self.create_collection()
+            with self.engine_pool.session() as session:
+                collection = self.get_collection(session)
+                if not collection:
+                    raise ValueError("Collection not found")
+                self.collection_id = collection.uuid
+            self.load_index_state()
+            if self.index_type != "none" and self.index_dimensions is None:
+                logger.warning("Collection %s has no usable %s index yet; build it with "
+                               "src/scripts/rebuild_vector_index.py", self.collection_name,
+                               self.index_type)
+        logger.info("Prepared pgvector collection %s", self.collection_name)
+
+    def collection_version(self) -> int:
+        """Return the collection's content version, re-reading it at most every poll interval.
+
+        Ingestion bumps the version whenever it changes the collection, which
+        invalidates results cached against an older version.
+
+        Returns:
+            The current collection version (0 if it was never bumped).
+        """
+        now = time.monotonic()
+        if self._version is None or now - self._version_checked_at >= self.version_poll_seconds:
+            with self.engine_pool.session() as session:
+                version = session.execute(
+                    sqlalchemy.select(collection_versions.c.version)
+                    .where(collection_versions.c.name == self.collection_name)
+                ).scalar()
+            if self._version is not None and (version or 0) != self._version:
+                self.load_index_state()
+            self._version = version or 0
+            self._version_checked_at = now
+        return self._version
+
+    def bump_collection_version(self) -> int:
+        """Increment the collection's content version after its contents changed.
+
+        Returns:
+            The new collection version.
+        """
+        statement = insert(collection_versions).values(name=self.collection_name, version=1)
+        statement = statement.on_conflict_do_update(
+            index_elements=[collection_versions.c.name],
+            set_={"version": collection_versions.c.version + 1},
+        ).returning(collection_versions.c.version)
+        with self.engine_pool.session() as session:
+            version = session.execute(statement).scalar()
+            session.commit()
+        self._version = version
+        self._version_checked_at = time.monotonic()
+        logger.info("Collection %s is now at version %s", self.collection_name, version)
+        return version
+
+    def index_name(self, index_type: str) -> str:
+        """Return the name of the collection's index of the given type.
+
+        Args:
+            index_type: "hnsw" or "ivfflat".
+
+        Returns:
+            The index name.
+        """
+        return f"deep_thought_{self.collection_id.hex}_{index_type}"
+
+    def embedding_dimensions(self) -> Optional[int]:
+        """Return the dimensions of the collection's embeddings.
+
+        Returns:
+            The number of dimensions, or None if the collection is empty.
+        """
+        table = self.EmbeddingStore.__tablename__
+        with self.engine_pool.session() as session:
+            return session.execute(sqlalchemy.text(
+                f"SELECT vector_dims(embedding) FROM {table} "
+                f"WHERE collection_id = :collection_id LIMIT 1"
+            ), {"collection_id": self.collection_id}).scalar()
+
+    @staticmethod
+    def _existing_index(connection, name: str) -> Optional[Tuple[bool, Optional[int]]]:
+        """Look up whether an index exists, whether it is valid and which dimensions it casts to."""
+        row = connection.execute(sqlalchemy.text(
+            "SELECT index.indisvalid, pg_get_indexdef(class.oid) FROM pg_class class "
+            "JOIN pg_index index ON index.indexrelid = class.oid WHERE class.relname = :name"
+        ), {"name": name}).first()
+        if row is None:
+            return None
+        dimensions = re.search(r"vector\((\d+)\)", row[1])
+        return row[0], int(dimensions.group(1)) if dimensions else None
+
+    @staticmethod
+    def _index_build_in_progress(connection, name: str) -> bool:
+        """Check whether some session is currently building or rebuilding an index."""
+        return connection.execute(sqlalchemy.text(
+            "SELECT 1 FROM pg_stat_progress_create_index progress "
+            "JOIN pg_class class ON class.oid = progress.index_relid WHERE class.relname = :name"
+        ), {"name": name}).first() is not None
+
+    def _ivfflat_lists(self, connection) -> int:
+        """Pick the IVFFlat list count: rows / 1000 up to a million rows, sqrt(rows) above."""
+        lists = get_settings().vector_index_ivfflat_lists
+        if lists > 0:
+            return lists
+        rows = connection.execute(sqlalchemy.text(
+            f"SELECT count(*) FROM {self.EmbeddingStore.__tablename__} "
+            f"WHERE collection_id = :collection_id"
+        ), {"collection_id": self.collection_id}).scalar()
+        return max(1, rows // 1000 if rows <= 1000000 else int(math.sqrt(rows)))
+
+    def build_index(self, index_type: Optional[str] = None, rebuild: bool = False) -> Optional[str]:
+        """Create the collection's approximate nearest neighbor index if it is missing.
+
+        Indexes are built concurrently, so searches and ingestion are not blocked.
+        An index of the other type is dropped. With `rebuild`, an existing index is
+        rebuilt from the current rows, which re-clusters IVFFlat lists after bulk loads.
+        An index another session is still building is left alone: it shows as
+        invalid until the build finishes, so dropping it would abort that build.
+
+        Args:
+            index_type: "hnsw" or "ivfflat"; defaults to `VECTOR_INDEX_TYPE`.
+            rebuild: Whether to rebuild an index that already exists.
+
+        Returns:
+            The index name, or None if the collection is empty.
+
+        Raises:
+            IndexBuildInProgress: If another session is building the index.
+        """
+        index_type = index_type or self.index_type
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Invalid vector index type: {index_type}")
+        dimensions = self.embedding_dimensions()
+        if dimensions is None:
+            logger.info("Collection %s is empty, not indexing it yet", self.collection_name)
+            return None
+        table = self.EmbeddingStore.__tablename__
+        name = self.index_name(index_type)
+        with self.engine_pool.engine.connect() as connection:
+            connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+            if self._index_build_in_progress(connection, name):
+                raise IndexBuildInProgress(f"Index {name} is being built by another session")
+            for other_type in INDEX_TYPES:
+                other_name = self.index_name(other_type)
+                if other_type == index_type or self._index_build_in_progress(connection,
+                                                                             other_name):
+                    continue
+                connection.execute(sqlalchemy.text(
+                    f"DROP INDEX CONCURRENTLY IF EXISTS {other_name}"))
+            existing = self._existing_index(connection, name)
+            if existing is not None and existing[0] and existing[1] == dimensions:
+                if rebuild:
+                    start = time.perf_counter()
+                    connection.execute(sqlalchemy.text(f"REINDEX INDEX CONCURRENTLY {name}"))
+                    logger.info("Rebuilt index %s in %.3fs", name, time.perf_counter() - start)
+                return name
+            if existing is not None:
+                connection.execute(sqlalchemy.text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            if index_type == "hnsw":
+                settings = get_settings()
+                options = (f"m = {settings.vector_index_hnsw_m}, "
+                           f"ef_construction = {settings.vector_index_hnsw_ef_construction}")
+            else:
+                options = f"lists = {self._ivfflat_lists(connection)}"
+            start = time.perf_counter()
+            connection.execute(sqlalchemy.text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} "
+                f"USING {index_type} ((CAST(embedding AS vector({dimensions}))) "
+                f"{INDEX_OPERATOR_CLASSES[self._distance_strategy]}) WITH ({options}) "
+                f"WHERE collection_id = '{self.collection_id}'"
+            ))
+        logger.info("Built %s index %s on %s dimensions in %.3fs",
+                    index_type, name, dimensions, time.perf_counter() - start)
+        return name
+
+    def load_index_state(self):
+        """Check whether the collection has a usable index and which dimensions it casts to."""
+        self.index_dimensions = None
+        if self.index_type == "none":
+            return
+        with self.engine_pool.engine.connect() as connection:
+            existing = self._existing_index(connection, self.index_name(self.index_type))
+        if existing is not None and existing[0]:
+            self.index_dimensions = existing[1]
+
+    def _vector(self, expression: str) -> str:
+        """Cast a vector expression to the indexed dimensions, so the index matches."""
+        if self.index_dimensions is None:
+            return f"CAST({expression} AS vector)"
+        return f"CAST({expression} AS vector({self.index_dimensions}))"
+
+    def _apply_search_params(self, session: Session, k: int,
+                             search_params: Optional[SearchParams]):
+        """Set the index search knobs for the rest of the session's transaction."""
+        if self.index_dimensions is None:
+            return
+        search_params = search_params or SearchParams()
+        if self.index_type == "hnsw":
+            ef_search = search_params.ef_search or get_settings().vector_index_ef_search
+            # HNSW returns at most ef_search rows, so it never goes below k.
+            setting, value = "hnsw.ef_search", min(max(ef_search, k), HNSW_MAX_EF_SEARCH)
+        else:
+            setting, value = "ivfflat.probes", (search_params.probes
+                                                or get_settings().vector_index_probes)
+        session.execute(sqlalchemy.text("SELECT set_config(:setting, :value, true)"),
+                        {"setting": setting, "value": str(value)})
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[dict] = None, # pylint: disable=W0622
+        search_params: Optional[SearchParams] = None,
+    ) -> List[Tuple[Document, float]]:
+        if filter is not None:
+            return super().similarity_search_with_score_by_vector(embedding, k=k, filter=filter)
+        table = self.EmbeddingStore.__tablename__
+        operator = DISTANCE_OPERATORS[self._distance_strategy]
+        statement = sqlalchemy.text(
+            f"SELECT document, cmetadata, "
+            f"{self._vector('embedding')} {operator} {self._vector(':query')} AS distance "
+            f"FROM {table} WHERE collection_id = :collection_id "
+            f"ORDER BY distance LIMIT :k"
+        ).bindparams(
+            sqlalchemy.bindparam("query", value=embedding, type_=Vector()),
+            collection_id=self.collection_id,
+            k=k,
+        )
+        with self.engine_pool.session() as session:
+            self._apply_search_params(session, k, search_params)
+            return [(Document(page_content=row.document, metadata=row.cmetadata), row.distance)
+                    for row in session.execute(statement)]
+
+    def batch_similarity_search_with_score_by_vector(
+        self,
+        embeddings: List[List[float]],
+        k: int = 4,
+        search_params: Optional[SearchParams] = None,
+    ) -> List[List[Tuple[Document, float]]]:
+        """Run one top-k search per embedding in a single database round-trip.
+
+        The query vectors are sent as a VALUES list and each one is matched with a
+        LATERAL subquery, so N searches cost one statement instead of N.
+
+        Args:
+            embeddings: The query embeddings.
+            k: Number of results to return per query.
+            search_params: Index search knobs for this search.
+
+        Returns:
+            One list of (document, distance) pairs per query embedding, in order.
+        """
+        if not embeddings:
+            return []
+        table = self.EmbeddingStore.__tablename__
+        operator = DISTANCE_OPERATORS[self._distance_strategy]
+        rows = ", ".join(f"({index}, {self._vector(f':query_{index}')})"
+                         for index in range(len(embeddings)))
+        statement = sqlalchemy.text(
+            f"SELECT queries.idx, matches.document, matches.cmetadata, matches.distance "
+            f"FROM (VALUES {rows}) AS queries (idx, embedding) "
+            f"CROSS JOIN LATERAL ("
+            f"SELECT {table}.document, {table}.cmetadata, "
+            f"{self._vector(f'{table}.embedding')} {operator} queries.embedding AS distance "
+            f"FROM {table} WHERE {table}.collection_id = :collection_id "
+            f"ORDER BY distance LIMIT :k) AS matches "
+            f"ORDER BY queries.idx, matches.distance"
+        ).bindparams(
+            *[sqlalchemy.bindparam(f"query_{index}", value=embedding, type_=Vector())
+              for index, embedding in enumerate(embeddings)],
+            collection_id=self.collection_id,
+            k=k,
+        )
+        results = [[] for _ in embeddings]
+        with self.engine_pool.session() as session:
+            self._apply_search_params(session, k, search_params)
+            for row in session.execute(statement):
+                results[row.idx].append(
+                    (Document(page_content=row.document, metadata=row.cmetadata), row.distance))
+        return results
+
+class VectorStoreRegistry:
+    """Process-wide registry of pooled engines and prepared collection stores.
+
+    Engines are keyed by connection string and stores by (connection string,
+    collection name), so every request reuses the same pool.
+    """
+
+    def __init__(self):
+        self._pools = {}
+        self._stores = {}
+        self._lock = threading.Lock()
+
+    def get_engine_pool(self, connection_string: str) -> EnginePool:
+        """Return the shared engine pool for a database, creating it on first use.
+
+        Args:
+            connection_string: The PostgreSQL connection string.
+
+        Returns:
+            The shared engine pool.
+        """
+        with self._lock:
+            pool = self._pools.get(connection_string)
+            if pool is None:
+                pool = EnginePool(connection_string)
+                self._pools[connection_string] = pool
+            return pool
+
+    def get_store(self, connection_string: str, collection_name: str,
+                  embedding_function: Embeddings) -> PooledPGVector:
+        """Return the prepared store for a collection, preparing it on first use.
+
+        Args:
+            connection_string: The PostgreSQL connection string.
+            collection_name: The name of the collection.
+            embedding_function: The embedding model used to embed queries.
+
+        Returns:
+            The prepared collection store.
+        """
+        key = (connection_string, collection_name)
+        store = self._stores.get(key)
+        if store is None:
+            engine_pool = self.get_engine_pool(connection_string)
+            with self._lock:
+                store = self._stores.get(key)
+                if store is None:
+                    store = PooledPGVector(engine_pool, collection_name, embedding_function)
+                    self._stores[key] = store
+        if not store.is_prepared:
+            store.prepare()
+        return store
+
+    def stats(self) -> Dict[str, dict]:
+        """Report usage of every engine pool, keyed by password-masked database URL.
+
+        Returns:
+            A dictionary mapping database URLs to pool statistics.
+        """
+        with self._lock:
+            pools = list(self._pools.values())
+        return {pool.engine.url.render_as_string(hide_password=True): pool.stats()
+                for pool in pools}
+
+    def dispose(self):
+        """Close every pool and forget every store."""
+        with self._lock:
+            for pool in self._pools.values():
+                pool.dispose()
+            self._pools.clear()
+            self._stores.clear()
+
+vector_store_registry = VectorStoreRegistry()
+
+def get_collection_store(collection_name: str,
+                         embedding_function: Optional[Embeddings] = None) -> PooledPGVector:
+    """Return the prepared store for a collection on the configured database.
+
+    Args:
+        collection_name: The name of the collection.
+        embedding_function: The embedding model used to embed queries, if any.
+
+    Returns:
+        The prepared collection store.
+    """
+    connection_string = config.get_secret(
+        "CONNECTION_STRING", "postgresql://UNDEFINED", mask=False)
+    logger.debug("CONNECTION_STRING: %s", config.get_secret("CONNECTION_STRING"))
+    return vector_store_registry.get_store(connection_string, collection_name,
+                                           embedding_function)
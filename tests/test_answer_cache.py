@@ -0,0 +1,70 @@
+import unittest
+
+from src.answer_cache import SemanticAnswerCache
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestSemanticAnswerCache(unittest.TestCase):
+
+    def test_similar_question_hits(self):
+        cache = SemanticAnswerCache(max_size=4, threshold=0.9)
+        cache.put('collection', 1, 'context', [1.0, 0.0], 'answer')
+        self.assertEqual(cache.get('collection', 1, 'context', [2.0, 0.1]), 'answer')
+        self.assertIsNone(cache.get('collection', 1, 'context', [0.5, 0.5]))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_returns_most_similar_answer(self):
+        cache = SemanticAnswerCache(max_size=4, threshold=0.5)
+        cache.put('collection', 1, 'context', [1.0, 0.0], 'first')
+        cache.put('collection', 1, 'context', [0.0, 1.0], 'second')
+        self.assertEqual(cache.get('collection', 1, 'context', [0.2, 0.8]), 'second')
+
+    def test_context_is_not_shared(self):
+        cache = SemanticAnswerCache(max_size=4, threshold=0.9)
+        cache.put('collection', 1, 'context', [1.0, 0.0], 'answer')
+        self.assertIsNone(cache.get('collection', 1, 'other context', [1.0, 0.0]))
+        self.assertIsNone(cache.get('other collection', 1, 'context', [1.0, 0.0]))
+
+    def test_new_collection_version_invalidates(self):
+        cache = SemanticAnswerCache(max_size=4, threshold=0.9)
+        cache.put('collection', 1, 'context', [1.0, 0.0], 'answer')
+        cache.put('other collection', 1, 'context', [1.0, 0.0], 'other answer')
+        self.assertIsNone(cache.get('collection', 2, 'context', [1.0, 0.0]))
+        self.assertEqual(len(cache), 1)
+        cache.put('collection', 1, 'context', [1.0, 0.0], 'stale answer')
+        self.assertIsNone(cache.get('collection', 2, 'context', [1.0, 0.0]))
+        self.assertEqual(cache.get('other collection', 1, 'context', [1.0, 0.0]), 'other answer')
+
+    def test_evicts_least_recently_used(self):
+        cache = SemanticAnswerCache(max_size=2, threshold=0.9)
+        cache.put('collection', 1, 'context', [1.0, 0.0], 'first')
+        cache.put('collection', 1, 'context', [0.0, 1.0], 'second')
+        cache.get('collection', 1, 'context', [1.0, 0.0])
+        cache.put('collection', 1, 'context', [-1.0, 0.0], 'third')
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('collection', 1, 'context', [1.0, 0.0]), 'first')
+        self.assertIsNone(cache.get('collection', 1, 'context', [0.0, 1.0]))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_ttl_expires(self):
+        clock = FakeClock()
+        cache = SemanticAnswerCache(max_size=2, threshold=0.9, ttl_seconds=10, clock=clock)
+        cache.put('collection', 1, 'context', [1.0, 0.0], 'answer')
+        clock.now = 11
+        self.assertIsNone(cache.get('collection', 1, 'context', [1.0, 0.0]))
+        self.assertEqual(len(cache), 0)
+
+    def test_zero_size_disables(self):
+        cache = SemanticAnswerCache(max_size=0, threshold=0.9)
+        cache.put('collection', 1, 'context', [1.0, 0.0], 'answer')
+        self.assertIsNone(cache.get('collection', 1, 'context', [1.0, 0.0]))
+
+if __name__ == '__main__':
+    unittest.main()
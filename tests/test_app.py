@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+import logging
+
+from fastapi.testclient import TestClient
+
+from src.app import app, schedule_reload
+from src.request_trace import record_stage
+
+class TestApp(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger().setLevel(logging.WARNING)
+        self.client = TestClient(app)
+
+    @patch('src.app.provider_registry')
+    def test_sighup_reload_runs_off_the_event_loop(self, mock_provider_registry):
+        threads = []
+
+        def reload():
+            threads.append(threading.current_thread())
+            raise OSError('config file unreadable')
+
+        mock_provider_registry.reload.side_effect = reload
+
+        async def handle_signal():
+            schedule_reload()
+
+        with self.assertLogs(level='ERROR') as logs:
+            asyncio.run(handle_signal())
+        self.assertIsNot(threads[0], threading.main_thread())
+        self.assertIn('Configuration reload failed: config file unreadable', logs.output[0])
+
+    @patch('src.app.model_registry')
+    def test_ready_before_warm_up(self, mock_registry):
+        mock_registry.is_ready.return_value = False
+        mock_registry.load_times.return_value = {}
+        response = self.client.get('/ready')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['status'], 'starting')
+
+    @patch('src.app.model_registry')
+    def test_ready_after_warm_up(self, mock_registry):
+        mock_registry.is_ready.return_value = True
+        mock_registry.load_times.return_value = {'test_model': {'load_seconds': 1.0,
+                                                                'warmup_seconds': 0.1}}
+        response = self.client.get('/ready')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['embedding_models']['test_model']['load_seconds'], 1.0)
+
+    @patch('src.app.spend_ledger')
+    def test_metrics(self, mock_spend_ledger):
+        mock_spend_ledger.total.return_value = 1.5
+        self.client.get('/ready')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers['content-type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('# TYPE deep_thought_stage_seconds histogram', response.text)
+        self.assertIn('deep_thought_http_responses_total{status="', response.text)
+        self.assertIn('deep_thought_cache_hits_total{cache="answer"}', response.text)
+        self.assertIn('deep_thought_spend_ledger_dollars 1.5', response.text)
+
+    @patch('src.v1.endpoints.search_sources')
+    def test_v1_responses_carry_server_timing_and_trace(self, mock_search_sources):
+        def search(*_args):
+            record_stage('embedding', 0.002)
+            record_stage('vector_search', 0.003)
+            return [{'source': 'a', 'content': 'b'}]
+
+        mock_search_sources.side_effect = search
+        response = self.client.post('/v1/find_sources', json={'query': 'traced query',
+                                                                'trace': True})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers['server-timing'].startswith(
+            'embed;dur=2.0, retrieve;dur=3.0, total;dur='))
+        self.assertEqual(response.json()['trace']['stages']['vector_search'],
+                         {'ms': 3.0, 'calls': 1})
+
+        response = self.client.post('/v1/find_sources', json={'query': 'untraced query'})
+        self.assertNotIn('trace', response.json())
+        self.assertNotIn('server-timing', self.client.get('/ready').headers)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src import config
+from src.config import ConfigWatcher, Settings, parse_bool
+
+class TestSettings(unittest.TestCase):
+
+    def test_parse_bool(self):
+        self.assertTrue(parse_bool(' Yes '))
+        self.assertFalse(parse_bool('0'))
+        with self.assertRaises(ValueError):
+            parse_bool('maybe')
+
+    def test_defaults(self):
+        self.assertEqual(Settings.from_environment({}), Settings())
+
+    def test_from_environment_parses_types(self):
+        settings = Settings.from_environment({
+            'MODEL_PROVIDER': 'OPENAI',
+            'MODEL_TEMPERATURE': '0.5',
+            'MAX_BATCH_QUERIES': '10',
+            'HOSTED_MODEL_BATCH': 'true',
+            'UNRELATED': 'ignored',
+        })
+        self.assertEqual(settings.model_provider, 'OPENAI')
+        self.assertEqual(settings.model_temperature, 0.5)
+        self.assertEqual(settings.max_batch_queries, 10)
+        self.assertTrue(settings.hosted_model_batch)
+
+    def test_from_environment_checks_index_pool_and_backend_settings(self):
+        with self.assertRaises(ValueError) as context:
+            Settings.from_environment({
+                'VECTOR_INDEX_TYPE': 'flat',
+                'VECTOR_INDEX_HNSW_M': '32',
+                'VECTOR_INDEX_HNSW_EF_CONSTRUCTION': '40',
+                'PG_POOL_SIZE': '-1',
+                'PG_MAX_OVERFLOW': '-2',
+                'PG_POOL_PRE_PING': 'sometimes',
+                'EMBEDDING_BACKEND': 'tensorflow',
+            })
+        message = str(context.exception)
+        self.assertIn("VECTOR_INDEX_TYPE='flat' is not one of hnsw, ivfflat, none", message)
+        self.assertIn('VECTOR_INDEX_HNSW_EF_CONSTRUCTION=40 is not between', message)
+        self.assertIn('PG_POOL_SIZE=-1 is negative', message)
+        self.assertIn('PG_MAX_OVERFLOW=-2 is less than -1', message)
+        self.assertIn("PG_POOL_PRE_PING='sometimes' is not a valid bool", message)
+        self.assertIn("EMBEDDING_BACKEND='tensorflow' is not one of", message)
+        self.assertNotIn('VECTOR_INDEX_HNSW_M=', message)
+
+    def test_from_environment_lists_every_error(self):
+        with self.assertRaises(ValueError) as context:
+            Settings.from_environment({
+                'MODEL_TEMPERATURE': 'warm',
+                'MAX_BATCH_QUERIES': '0',
+                'VECTOR_STORE_BACKEND': 'faiss',
+            })
+        message = str(context.exception)
+        self.assertIn("MODEL_TEMPERATURE='warm' is not a valid float", message)
+        self.assertIn('MAX_BATCH_QUERIES=0 is less than 1', message)
+        self.assertIn("VECTOR_STORE_BACKEND='faiss' is not one of pgvector, mmap", message)
+
+    @patch('src.config.Config.reload')
+    def test_reload_settings_replaces_snapshot(self, mock_reload):
+        previous = config.get_settings()
+        try:
+            with patch.dict(os.environ, {'SPEND_LIMIT': '2.5'}):
+                settings = config.reload_settings()
+            mock_reload.assert_called_once()
+            self.assertEqual(settings.spend_limit, 2.5)
+            self.assertIs(config.get_settings(), settings)
+        finally:
+            config._settings = previous
+
+    @patch('src.config.Config.reload')
+    def test_invalid_reload_keeps_snapshot(self, mock_reload):
+        previous = config.get_settings()
+        with patch.dict(os.environ, {'SPEND_LIMIT': '-1'}):
+            with self.assertRaises(ValueError):
+                config.reload_settings()
+        self.assertIs(config.get_settings(), previous)
+
+class TestConfigWatcher(unittest.TestCase):
+
+    def test_check_calls_function_on_change(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, '.env.config')
+            with open(path, 'w', encoding='utf-8') as config_file:
+                config_file.write('SPEND_LIMIT=1\n')
+            on_change = MagicMock()
+            watcher = ConfigWatcher(on_change, 0, paths=[path])
+            self.assertFalse(watcher.check())
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+            self.assertTrue(watcher.check())
+            self.assertFalse(watcher.check())
+            on_change.assert_called_once()
+
+    def test_check_survives_failing_function(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, '.env.config')
+            watcher = ConfigWatcher(MagicMock(side_effect=ValueError('bad')), 0, paths=[path])
+            with open(path, 'w', encoding='utf-8') as config_file:
+                config_file.write('SPEND_LIMIT=-1\n')
+            self.assertTrue(watcher.check())
+
+    def test_zero_interval_does_not_start(self):
+        watcher = ConfigWatcher(MagicMock(), 0, paths=[])
+        watcher.start()
+        self.assertIsNone(watcher._thread)
+        watcher.stop()
+
+if __name__ == '__main__':
+    unittest.main()
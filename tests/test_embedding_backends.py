@@ -0,0 +1,93 @@
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+import logging
+
+import numpy as np
+from langchain.embeddings import HuggingFaceEmbeddings
+
+from src.config import Settings
+from src.embedding_backends import OnnxEmbeddings, compare_backends, embedding_model_key
+from src.embedding_backends import export_onnx_model, import_onnxruntime, load_embedding_model
+
+HAS_ONNX = all(importlib.util.find_spec(name) for name in ('onnx', 'onnxruntime'))
+
+def build_tiny_model(path):
+    """Save a small randomly initialized sentence-transformers model, so no download is needed."""
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+    words = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]', 'the', 'answer', 'is', '?', '.']
+    words += [chr(code) for code in range(97, 123)] + ['##' + chr(code) for code in range(97, 123)]
+    transformer_path = os.path.join(path, 'transformer')
+    os.makedirs(transformer_path)
+    with open(os.path.join(transformer_path, 'vocab.txt'), 'w', encoding='utf-8') as file:
+        file.write('\n'.join(words))
+    BertTokenizerFast(os.path.join(transformer_path, 'vocab.txt')).save_pretrained(transformer_path)
+    BertModel(BertConfig(vocab_size=len(words), hidden_size=32, num_hidden_layers=2,
+                         num_attention_heads=2, intermediate_size=37,
+                         max_position_embeddings=128)).save_pretrained(transformer_path)
+    model = SentenceTransformer(modules=[models.Transformer(transformer_path, max_seq_length=64),
+                                         models.Pooling(32, 'mean'), models.Normalize()])
+    model.save(os.path.join(path, 'model'))
+    return os.path.join(path, 'model')
+
+class TestEmbeddingBackends(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger().setLevel(logging.WARNING)
+
+    @patch('langchain.embeddings.HuggingFaceEmbeddings')
+    def test_default_backend_is_sentence_transformers(self, MockHuggingFaceEmbeddings):
+        self.assertIs(load_embedding_model('test_model'), MockHuggingFaceEmbeddings.return_value)
+        MockHuggingFaceEmbeddings.assert_called_once_with(model_name='test_model')
+        self.assertEqual(embedding_model_key('test_model'), 'test_model')
+
+    @patch('src.embedding_backends.OnnxEmbeddings')
+    @patch('src.embedding_backends.get_settings', return_value=Settings(
+        embedding_backend='onnx', embedding_onnx_dir='/models', embedding_onnx_quantized=True))
+    def test_onnx_backend(self, mock_get_settings, MockOnnxEmbeddings):
+        self.assertIs(load_embedding_model('test_model'), MockOnnxEmbeddings.return_value)
+        MockOnnxEmbeddings.assert_called_once_with('/models/test_model', quantized=True, threads=0)
+        self.assertEqual(embedding_model_key('test_model'), 'test_model+onnx-int8')
+
+    def test_missing_onnxruntime(self):
+        with patch.dict(sys.modules, {'onnxruntime': None}):
+            with self.assertRaisesRegex(ImportError, 'poetry install --extras onnx'):
+                import_onnxruntime()
+
+@unittest.skipUnless(HAS_ONNX, 'onnx and onnxruntime are not installed')
+class TestOnnxEmbeddings(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.getLogger().setLevel(logging.WARNING)
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.model_path = build_tiny_model(cls.directory.name)
+        cls.export_path = export_onnx_model(cls.model_path,
+                                            os.path.join(cls.directory.name, 'onnx'))
+        cls.reference = HuggingFaceEmbeddings(model_name=cls.model_path,
+                                              encode_kwargs={'show_progress_bar': False})
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_matches_sentence_transformers(self):
+        texts = ['the answer', 'is', 'the answer is the answer?\nthe answer.', 'x' * 500]
+        onnx = OnnxEmbeddings(self.export_path, batch_size=2)
+        np.testing.assert_allclose(onnx.embed_documents(texts),
+                                   self.reference.embed_documents(texts), atol=1e-5)
+        np.testing.assert_allclose(onnx.embed_query(texts[2]),
+                                   self.reference.embed_query(texts[2]), atol=1e-5)
+
+    def test_quantized_graph_is_close(self):
+        report = compare_backends(self.reference, OnnxEmbeddings(self.export_path, quantized=True),
+                                  repeats=1)
+        self.assertGreater(report['min_cosine_similarity'], 0.99)
+        self.assertGreater(report['candidate_ms_per_query'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.embedding_cache import EmbeddingCache, content_hash
+
+class TestEmbeddingCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'cache', 'embeddings.sqlite3')
+
+    def test_content_hash(self):
+        self.assertEqual(content_hash('text'), content_hash('text'))
+        self.assertNotEqual(content_hash('text'), content_hash('text '))
+        self.assertEqual(len(content_hash('text')), 64)
+
+    def test_get_many_returns_stored_embeddings(self):
+        cache = EmbeddingCache(self.path)
+        self.addCleanup(cache.close)
+        cache.put_many('model', [('a', np.array([1.0, 2.0])), ('b', np.array([3.0, 4.0]))])
+        found = cache.get_many('model', ['a', 'c', 'a'])
+        self.assertEqual(list(found), ['a'])
+        np.testing.assert_array_equal(found['a'], np.array([1.0, 2.0], dtype=np.float32))
+        self.assertEqual(found['a'].dtype, np.float32)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1})
+
+    def test_embeddings_are_kept_per_model(self):
+        cache = EmbeddingCache(self.path)
+        self.addCleanup(cache.close)
+        cache.put_many('model', [('a', np.array([1.0]))])
+        self.assertEqual(cache.get_many('other-model', ['a']), {})
+
+    def test_embeddings_persist_across_instances(self):
+        cache = EmbeddingCache(self.path)
+        cache.put_many('model', [('a', np.array([1.0, 2.0]))])
+        cache.close()
+        cache = EmbeddingCache(self.path)
+        self.addCleanup(cache.close)
+        self.assertEqual(len(cache), 1)
+        self.assertIn('a', cache.get_many('model', ['a']))
+
+    def test_get_many_with_more_hashes_than_one_query_allows(self):
+        cache = EmbeddingCache(self.path)
+        self.addCleanup(cache.close)
+        hashes = [str(index) for index in range(1200)]
+        cache.put_many('model', [(digest, np.array([float(digest)])) for digest in hashes])
+        found = cache.get_many('model', hashes)
+        self.assertEqual(len(found), 1200)
+        self.assertEqual(found['1199'][0], 1199.0)
+
+if __name__ == '__main__':
+    unittest.main()
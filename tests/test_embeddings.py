@@ -1,29 +1,45 @@
+import threading
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch, MagicMock
 import logging
 
-from src.embeddings import EmbeddingSource
+from fastapi import HTTPException
+
+from src.embeddings import EmbeddingSource, EmbeddingModelRegistry, EmbeddingBatcher, model_registry
+from src.embeddings import normalize_query, query_embedding_cache, retrieval_cache
+from src.config import Settings
+from src.vector_store import SearchParams
 
 class TestEmbeddingSource(unittest.TestCase):
 
     def setUp(self):
         logging.getLogger().setLevel(logging.WARNING)
+        patcher = patch('langchain.embeddings.HuggingFaceEmbeddings')
+        self.MockHuggingFaceEmbeddings = patcher.start()
+        self.MockHuggingFaceEmbeddings.return_value.embed_query.return_value = [0.5, 0.25]
+        self.addCleanup(patcher.stop)
+        self.addCleanup(model_registry.clear)
+        self.addCleanup(query_embedding_cache.clear)
+        self.addCleanup(retrieval_cache.clear)
 
-    @patch('src.embeddings.PGVector')
-    def test_get_source(self, MockPGVector):
+    @patch('src.vector_store.vector_store_registry')
+    def test_get_source(self, mock_registry):
         mock_doc = MagicMock()
         mock_doc.metadata = {'source': 'test_source'}
         mock_doc.page_content = 'test_content'
-        mock_db = MockPGVector.return_value
-        mock_db.similarity_search_with_score.return_value = [(mock_doc, 'test_score')]
+        mock_db = mock_registry.get_store.return_value
+        mock_db.similarity_search_with_score_by_vector.return_value = [(mock_doc, 'test_score')]
         embedding_source = EmbeddingSource()
         results = embedding_source.get_source('test_query', 5)
         expected_results = [{'score': 'test_score', 'source': 'test_source', 'content': 'test_content'}]
         self.assertEqual(results, expected_results)
+        mock_db.similarity_search_with_score_by_vector.assert_called_once_with(
+            [0.5, 0.25], k=5, search_params=SearchParams())
 
-    @patch('src.embeddings.PGVector')
-    def test_get_source_exception(self, MockPGVector):
-        MockPGVector.side_effect = Exception('test_exception')
+    @patch('src.vector_store.vector_store_registry')
+    def test_get_source_exception(self, mock_registry):
+        mock_registry.get_store.side_effect = Exception('test_exception')
         embedding_source = EmbeddingSource()
         try:
             embedding_source.get_source('test_query', 5)
@@ -31,5 +47,210 @@ class TestEmbeddingSource(unittest.TestCase):
             self.assertEqual('PostgreSQL connection failed' , e.detail)
             self.assertEqual(401 , e.status_code)
 
+    @patch('src.vector_store.vector_store_registry')
+    def test_get_source_embedding_failure_is_not_a_database_error(self, mock_registry):
+        self.MockHuggingFaceEmbeddings.return_value.embed_documents.side_effect = RuntimeError(
+            'model crashed')
+        self.MockHuggingFaceEmbeddings.return_value.embed_query.side_effect = RuntimeError(
+            'model crashed')
+        embedding_source = EmbeddingSource()
+        for query in ('test_query', ['first query', 'second query']):
+            with self.assertRaises(HTTPException) as context:
+                embedding_source.get_source(query, 5)
+            self.assertEqual(context.exception.status_code, 500)
+            self.assertEqual(context.exception.detail, 'Query embedding failed')
+        mock_db = mock_registry.get_store.return_value
+        mock_db.similarity_search_with_score_by_vector.assert_not_called()
+        mock_db.batch_similarity_search_with_score_by_vector.assert_not_called()
+
+    @patch('src.vector_store.vector_store_registry')
+    def test_get_source_serves_smaller_k_from_cache(self, mock_registry):
+        mock_db = mock_registry.get_store.return_value
+        mock_db.collection_name = 'test_collection'
+        mock_db.collection_version.return_value = 1
+        docs = []
+        for index in range(3):
+            mock_doc = MagicMock()
+            mock_doc.metadata = {'source': f'source_{index}'}
+            mock_doc.page_content = f'content_{index}'
+            docs.append((mock_doc, index))
+        mock_db.similarity_search_with_score_by_vector.return_value = docs
+        embedding_source = EmbeddingSource()
+        embedding_source.get_source('test_query', 3)
+        results = embedding_source.get_source('test_query', 2)
+        self.assertEqual([result['source'] for result in results], ['source_0', 'source_1'])
+        mock_db.similarity_search_with_score_by_vector.assert_called_once()
+
+    @patch('src.vector_store.vector_store_registry')
+    def test_get_source_cache_invalidated_by_collection_version(self, mock_registry):
+        mock_db = mock_registry.get_store.return_value
+        mock_db.collection_name = 'test_collection'
+        mock_db.collection_version.return_value = 1
+        mock_doc = MagicMock()
+        mock_doc.metadata = {'source': 'test_source'}
+        mock_doc.page_content = 'test_content'
+        mock_db.similarity_search_with_score_by_vector.return_value = [(mock_doc, 0.1)]
+        embedding_source = EmbeddingSource()
+        embedding_source.get_source('test_query', 1)
+        embedding_source.get_source('test_query', 1)
+        mock_db.collection_version.return_value = 2
+        embedding_source.get_source('test_query', 1)
+        self.assertEqual(mock_db.similarity_search_with_score_by_vector.call_count, 2)
+
+    @patch('src.vector_store.vector_store_registry')
+    def test_get_sources_batches_uncached_queries(self, mock_registry):
+        mock_db = mock_registry.get_store.return_value
+        mock_db.collection_name = 'test_collection'
+        mock_db.collection_version.return_value = 1
+        self.MockHuggingFaceEmbeddings.return_value.embed_documents.return_value = [[0.5], [0.25]]
+        first_doc = MagicMock(metadata={'source': 'first_source'}, page_content='first')
+        second_doc = MagicMock(metadata={'source': 'second_source'}, page_content='second')
+        mock_db.batch_similarity_search_with_score_by_vector.return_value = [
+            [(first_doc, 0.1)], [(second_doc, 0.2)]]
+        embedding_source = EmbeddingSource()
+        results = embedding_source.get_source(['first query', 'second query', 'first query'], 1)
+        self.assertEqual([[result['source'] for result in found] for found in results],
+                         [['first_source'], ['second_source'], ['first_source']])
+        self.MockHuggingFaceEmbeddings.return_value.embed_documents.assert_called_once_with(
+            ['first query', 'second query'])
+        mock_db.batch_similarity_search_with_score_by_vector.assert_called_once_with(
+            [[0.5], [0.25]], k=1, search_params=SearchParams())
+        embedding_source.get_sources(['second query'], 1)
+        mock_db.batch_similarity_search_with_score_by_vector.assert_called_once()
+
+    @patch('src.vector_store.vector_store_registry')
+    def test_get_source_caches_per_search_params(self, mock_registry):
+        mock_db = mock_registry.get_store.return_value
+        mock_db.collection_name = 'test_collection'
+        mock_db.collection_version.return_value = 1
+        mock_doc = MagicMock(metadata={'source': 'test_source'}, page_content='test_content')
+        mock_db.similarity_search_with_score_by_vector.return_value = [(mock_doc, 0.1)]
+        embedding_source = EmbeddingSource()
+        embedding_source.get_source('test_query', 1)
+        embedding_source.get_source('test_query', 1, SearchParams(ef_search=200))
+        embedding_source.get_source('test_query', 1, SearchParams(ef_search=200))
+        self.assertEqual(mock_db.similarity_search_with_score_by_vector.call_count, 2)
+        mock_db.similarity_search_with_score_by_vector.assert_called_with(
+            [0.5, 0.25], k=1, search_params=SearchParams(ef_search=200))
+
+    @patch('src.vector_store.vector_store_registry')
+    @patch('src.embeddings.mmap_index_registry')
+    @patch('src.embeddings.get_settings',
+           return_value=Settings(vector_store_backend='mmap', mmap_index_dir='/indexes'))
+    def test_get_database_mmap_backend(self, mock_settings, mock_mmap_registry, mock_registry):
+        database = EmbeddingSource().get_database()
+        self.assertIs(database, mock_mmap_registry.get_index.return_value)
+        mock_mmap_registry.get_index.assert_called_once_with('/indexes/sample_collection',
+                                                             'sample_collection')
+        mock_registry.get_store.assert_not_called()
+
+    def test_embed_query_is_cached(self):
+        embedding_source = EmbeddingSource()
+        first = embedding_source.embed_query('test  query')
+        second = embedding_source.embed_query(' test query ')
+        self.assertEqual(first, second)
+        self.MockHuggingFaceEmbeddings.return_value.embed_query.assert_called_once_with('test query')
+        self.assertEqual(query_embedding_cache.stats()['hits'], 1)
+        self.assertEqual(query_embedding_cache.stats()['misses'], 1)
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query('  how do I\tinstall\n operators '),
+                         'how do I install operators')
+
+    def test_embedding_sources_share_one_model(self):
+        first = EmbeddingSource()
+        second = EmbeddingSource()
+        self.assertIs(first.embeddings, second.embeddings)
+        self.MockHuggingFaceEmbeddings.assert_called_once()
+
+
+class TestEmbeddingModelRegistry(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger().setLevel(logging.WARNING)
+
+    @patch('langchain.embeddings.HuggingFaceEmbeddings')
+    def test_warm_up(self, MockHuggingFaceEmbeddings):
+        registry = EmbeddingModelRegistry()
+        self.assertFalse(registry.is_ready('test_model'))
+        registry.warm_up('test_model')
+        self.assertTrue(registry.is_ready('test_model'))
+        MockHuggingFaceEmbeddings.return_value.embed_query.assert_called_once()
+        load_times = registry.load_times()['test_model']
+        self.assertGreaterEqual(load_times['load_seconds'], 0)
+        self.assertGreaterEqual(load_times['warmup_seconds'], 0)
+
+    @patch('langchain.embeddings.HuggingFaceEmbeddings')
+    def test_clear(self, MockHuggingFaceEmbeddings):
+        registry = EmbeddingModelRegistry()
+        registry.get('test_model')
+        registry.clear()
+        registry.get('test_model')
+        self.assertEqual(MockHuggingFaceEmbeddings.call_count, 2)
+
+    @patch('src.embeddings.load_embedding_model')
+    def test_register(self, mock_load):
+        registry = EmbeddingModelRegistry()
+        model = MagicMock()
+        registry.register('test_model', model)
+        registry.warm_up('test_model')
+        self.assertIs(registry.get('test_model'), model)
+        model.embed_query.assert_called_once()
+        mock_load.assert_not_called()
+
+class TestEmbeddingBatcher(unittest.TestCase):
+
+    def test_concurrent_queries_share_one_forward_pass(self):
+        model = MagicMock()
+        model.embed_documents.side_effect = lambda texts: [[float(len(text))] for text in texts]
+        batcher = EmbeddingBatcher(model, max_batch_size=4, max_wait_seconds=5)
+        self.addCleanup(batcher.close)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            vectors = list(executor.map(batcher.embed, ['a', 'bb', 'ccc', 'dddd']))
+        self.assertEqual(vectors, [[1.0], [2.0], [3.0], [4.0]])
+        model.embed_documents.assert_called_once()
+        stats = batcher.stats()
+        self.assertEqual(stats['batches'], 1)
+        self.assertEqual(stats['batch_size_counts'], {4: 1})
+        self.assertGreaterEqual(stats['queue_delay_max_seconds'], 0)
+
+    def test_lone_query_is_embedded_after_wait(self):
+        model = MagicMock()
+        model.embed_query.return_value = [0.5]
+        batcher = EmbeddingBatcher(model, max_batch_size=4, max_wait_seconds=0.01)
+        self.addCleanup(batcher.close)
+        self.assertEqual(batcher.embed('query'), [0.5])
+        model.embed_query.assert_called_once_with('query')
+        self.assertEqual(batcher.stats()['batch_size_avg'], 1.0)
+
+    def test_errors_reach_every_caller(self):
+        model = MagicMock()
+        model.embed_documents.side_effect = RuntimeError('model failed')
+        batcher = EmbeddingBatcher(model, max_batch_size=2, max_wait_seconds=5)
+        self.addCleanup(batcher.close)
+        errors = []
+        barrier = threading.Barrier(2)
+
+        def embed(text):
+            barrier.wait()
+            try:
+                batcher.embed(text)
+            except RuntimeError as err:
+                errors.append(str(err))
+
+        threads = [threading.Thread(target=embed, args=(text,)) for text in ['a', 'b']]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, ['model failed', 'model failed'])
+
+    def test_batch_size_one_embeds_directly(self):
+        model = MagicMock()
+        model.embed_query.return_value = [0.5]
+        batcher = EmbeddingBatcher(model, max_batch_size=1, max_wait_seconds=5)
+        self.assertEqual(batcher.embed('query'), [0.5])
+        self.assertEqual(batcher.stats()['batches'], 0)
+
 if __name__ == "__main__":
     unittest.main()
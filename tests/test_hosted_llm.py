@@ -0,0 +1,107 @@
+import asyncio
+import gzip
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+
+import httpx
+
+from src.hosted_llm import HostedLLM, CustomLlamaParser, encode_body
+
+class TestHostedLLM(unittest.TestCase):
+
+    @patch('src.hosted_llm.get_session')
+    def test_call_posts_compressed_prompt(self, mock_get_session):
+        mock_post = mock_get_session.return_value.post
+        mock_post.return_value = MagicMock(status_code=200, text='[INST] prompt [/INST] answer')
+        llm = HostedLLM(uri='http://model-server/generate')
+        result = llm._call('prompt')
+        self.assertEqual(result, '[INST] prompt [/INST] answer')
+        _, kwargs = mock_post.call_args
+        self.assertEqual(kwargs['headers']['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(kwargs['data'])), {'text': 'prompt'})
+
+    @patch('src.hosted_llm.get_session')
+    def test_call_get_transport(self, mock_get_session):
+        mock_get = mock_get_session.return_value.get
+        mock_get.return_value = MagicMock(status_code=503)
+        llm = HostedLLM(uri='http://model-server/generate', transport='get')
+        result = llm._call('prompt')
+        self.assertEqual(result, 'Model Server is not Working due to error 503')
+        self.assertEqual(mock_get.call_args.kwargs['params'], {'text': 'prompt'})
+
+    @patch('src.hosted_llm.get_session')
+    def test_generate_batches_prompts(self, mock_get_session):
+        mock_post = mock_get_session.return_value.post
+        mock_post.return_value = MagicMock(status_code=200)
+        mock_post.return_value.json.return_value = ['first answer', 'second answer']
+        llm = HostedLLM(uri='http://model-server/generate', batch_prompts=True, compress=False)
+        result = llm.generate(['first prompt', 'second prompt'])
+        self.assertEqual([generation[0].text for generation in result.generations],
+                         ['first answer', 'second answer'])
+        mock_post.assert_called_once()
+        self.assertEqual(json.loads(mock_post.call_args.kwargs['data']),
+                         {'texts': ['first prompt', 'second prompt']})
+
+    def test_acall(self):
+        requests_seen = []
+
+        def handler(request):
+            requests_seen.append(request)
+            return httpx.Response(200, content='[INST] prompt [/INST] first\nsecond'.encode())
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        llm = HostedLLM(uri='http://model-server/generate')
+        with patch('src.hosted_llm.get_async_client', return_value=client):
+            result = asyncio.run(llm._acall('prompt'))
+        self.assertEqual(result, '[INST] prompt [/INST] first\nsecond')
+        self.assertEqual(requests_seen[0].method, 'POST')
+        self.assertEqual(json.loads(gzip.decompress(requests_seen[0].content)), {'text': 'prompt'})
+
+    def test_single_and_batched_prompts_decode_alike(self):
+        completion = '[INST] prompt [/INST] café\nanswer'
+
+        def handler(request):
+            payload = json.loads(gzip.decompress(request.content))
+            if 'texts' in payload:
+                return httpx.Response(200, json=[completion] * len(payload['texts']))
+            return httpx.Response(200, text=completion)
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        llm = HostedLLM(uri='http://model-server/generate', batch_prompts=True)
+        with patch('src.hosted_llm.get_async_client', return_value=client):
+            single = asyncio.run(llm._acall('prompt'))
+            batched = asyncio.run(llm._agenerate(['prompt', 'prompt']))
+        self.assertEqual(single, completion)
+        self.assertEqual([generation[0].text for generation in batched.generations],
+                         [completion, completion])
+
+    def test_acall_error(self):
+        client = httpx.AsyncClient(transport=httpx.MockTransport(
+            lambda request: httpx.Response(503)))
+        llm = HostedLLM(uri='http://model-server/generate')
+        with patch('src.hosted_llm.get_async_client', return_value=client):
+            result = asyncio.run(llm._acall('prompt'))
+        self.assertEqual(result, 'Model Server is not Working due to error 503')
+
+    def test_acall_rejects_stop(self):
+        llm = HostedLLM(uri='http://model-server/generate')
+        with self.assertRaises(ValueError):
+            asyncio.run(llm._acall('prompt', stop=['</s>']))
+
+    def test_encode_body_uncompressed(self):
+        body, headers = encode_body({'text': 'prompt'}, compress=False)
+        self.assertEqual(json.loads(body), {'text': 'prompt'})
+        self.assertNotIn('Content-Encoding', headers)
+
+class TestCustomLlamaParser(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(CustomLlamaParser().parse('[INST] prompt [/INST] answer'), ' answer')
+
+    def test_parse_error(self):
+        error = 'Model Server is not Working due to error 503'
+        self.assertEqual(CustomLlamaParser().parse(error), error)
+
+if __name__ == "__main__":
+    unittest.main()
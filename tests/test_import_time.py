@@ -0,0 +1,41 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+# Seconds `import src.app` may take in a fresh interpreter; raise it on slow machines.
+IMPORT_TIME_BUDGET_SECONDS = float(os.environ.get('IMPORT_TIME_BUDGET_SECONDS', '2.5'))
+
+# Modules that are only needed once a provider or embedding backend is used.
+LAZY_MODULES = ['langchain.chains', 'src.hosted_llm', 'torch', 'sentence_transformers',
+                'transformers', 'onnxruntime', 'openai', 'vertexai']
+
+MEASURE = '''
+import json, sys, time
+start = time.perf_counter()
+import src.app
+print(json.dumps({"seconds": time.perf_counter() - start,
+                  "modules": [name for name in %r if name in sys.modules]}))
+''' % (LAZY_MODULES,)
+
+def measure_import():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', MEASURE], cwd=root, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+class TestImportTime(unittest.TestCase):
+
+    def test_app_import_defers_providers_and_embedding_backends(self):
+        self.assertEqual(measure_import()['modules'], [])
+
+    def test_app_import_within_budget(self):
+        # The best of a few runs, so a busy machine does not fail the check.
+        seconds = min(measure_import()['seconds'] for _ in range(3))
+        self.assertLess(seconds, IMPORT_TIME_BUDGET_SECONDS,
+                        f'import src.app took {seconds:.2f}s, over the '
+                        f'{IMPORT_TIME_BUDGET_SECONDS:.2f}s budget')
+
+if __name__ == '__main__':
+    unittest.main()
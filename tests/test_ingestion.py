@@ -0,0 +1,226 @@
+import json
+import os
+import tempfile
+import unittest
+import uuid
+from unittest.mock import MagicMock
+import logging
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.embeddings import FakeEmbeddings
+
+from src.embedding_cache import EmbeddingCache
+from src.ingestion import MmapIndexLoader, PgVectorCopyLoader, chunk_id, embed_batches
+from src.ingestion import format_vector
+from src.ingestion import ingest, iter_batches, iter_chunks, iter_documents
+from src.mmap_index import MmapVectorIndex
+from src.vector_store import IndexBuildInProgress
+
+class TestIngestion(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger().setLevel(logging.WARNING)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def test_iter_documents_from_directory(self):
+        self.write('docs/guide.md', 'guide')
+        self.write('readme.txt', 'readme')
+        self.write('image.png', 'binary')
+        documents = list(iter_documents(self.directory.name, link_prefix='https://docs/'))
+        self.assertEqual([doc.page_content for doc in documents], ['readme', 'guide'])
+        self.assertEqual(documents[1].metadata,
+                         {'source': 'docs/guide.md', 'source_link': 'https://docs/docs/guide.md'})
+
+    def test_iter_documents_from_jsonl(self):
+        path = self.write('docs.jsonl', '\n'.join([
+            json.dumps({'content': 'first', 'source': 'a', 'source_link': 'https://a', 'lang': 'en'}),
+            '',
+            json.dumps({'page_content': 'second'}),
+        ]))
+        documents = list(iter_documents(path))
+        self.assertEqual(documents[0].page_content, 'first')
+        self.assertEqual(documents[0].metadata,
+                         {'source': 'a', 'source_link': 'https://a', 'lang': 'en'})
+        self.assertEqual(documents[1].metadata, {'source': 'docs.jsonl:3'})
+
+    def test_iter_chunks_keeps_metadata(self):
+        document = Document(page_content=' '.join(['word'] * 100), metadata={'source': 'a'})
+        chunks = list(iter_chunks([document], chunk_size=50, chunk_overlap=10))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk.page_content) <= 50 for chunk in chunks))
+        self.assertTrue(all(chunk.metadata == {'source': 'a'} for chunk in chunks))
+
+    def test_iter_batches(self):
+        self.assertEqual(list(iter_batches(range(5), 2)), [[0, 1], [2, 3], [4]])
+
+    def test_embed_batches_in_process(self):
+        batches = [[Document(page_content='a')], [Document(page_content='b'),
+                                                   Document(page_content='c')]]
+        results = list(embed_batches(batches, 'unused', 0, FakeEmbeddings(size=4)))
+        self.assertEqual([batch for batch, _ in results], batches)
+        self.assertEqual([vectors.shape for _, vectors in results], [(1, 4), (2, 4)])
+        self.assertEqual(results[0][1].dtype, np.float32)
+
+    def test_embed_batches_reuses_cached_embeddings(self):
+        cache = EmbeddingCache(os.path.join(self.directory.name, 'cache.sqlite3'))
+        self.addCleanup(cache.close)
+        embeddings = MagicMock()
+        embeddings.embed_documents.side_effect = lambda texts: [[float(len(text))] * 2
+                                                                for text in texts]
+        batch = [Document(page_content='a'), Document(page_content='bb'),
+                 Document(page_content='a')]
+        [(_, vectors)] = embed_batches([batch], 'model', 0, embeddings, cache)
+        embeddings.embed_documents.assert_called_once_with(['a', 'bb'])
+        np.testing.assert_array_equal(vectors, [[1, 1], [2, 2], [1, 1]])
+        embeddings.reset_mock()
+        [(_, cached)] = embed_batches([batch], 'model', 0, embeddings, cache)
+        embeddings.embed_documents.assert_not_called()
+        np.testing.assert_array_equal(cached, vectors)
+
+    def test_chunk_id_covers_content_and_metadata(self):
+        chunk = Document(page_content='text', metadata={'source': 'a'})
+        self.assertEqual(chunk_id(chunk), chunk_id(Document(page_content='text',
+                                                             metadata={'source': 'a'})))
+        self.assertNotEqual(chunk_id(chunk), chunk_id(Document(page_content='text',
+                                                                metadata={'source': 'b'})))
+
+    def test_format_vector(self):
+        self.assertEqual(format_vector(np.array([0.5, -1.0, 0.25], dtype=np.float32)),
+                         '[0.5,-1,0.25]')
+
+    def test_pgvector_copy_loader(self):
+        store = MagicMock()
+        store.EmbeddingStore.__tablename__ = 'langchain_pg_embedding'
+        store.collection_id = uuid.UUID(int=1)
+        store.index_type = 'hnsw'
+        connection = store.engine_pool.engine.raw_connection.return_value
+        cursor = connection.cursor.return_value.__enter__.return_value
+        copied = []
+        cursor.copy_expert.side_effect = lambda sql, buffer: copied.append((sql, buffer.read()))
+        loader = PgVectorCopyLoader(store)
+        loader.load([Document(page_content='text, "quoted"', metadata={'source': 'a'})],
+                    np.array([[0.5, 1.0]], dtype=np.float32))
+        loader.finish()
+        sql, data = copied[0]
+        self.assertIn('COPY langchain_pg_embedding', sql)
+        self.assertIn(f'{uuid.UUID(int=1)},"[0.5,1]","text, ""quoted""","{{""source"": ""a""}}",',
+                      data)
+        connection.commit.assert_called_once_with()
+        connection.close.assert_called_once_with()
+        store.build_index.assert_called_once_with(rebuild=True)
+        store.bump_collection_version.assert_called_once_with()
+
+    def test_replacing_pgvector_load_commits_once(self):
+        store = MagicMock()
+        store.EmbeddingStore.__tablename__ = 'langchain_pg_embedding'
+        store.collection_id = uuid.UUID(int=1)
+        store.index_type = 'hnsw'
+        connection = store.engine_pool.engine.raw_connection.return_value
+        events = []
+        connection.commit.side_effect = lambda: events.append('commit')
+        store.bump_collection_version.side_effect = lambda: events.append('bump')
+        loader = PgVectorCopyLoader(store)
+        loader.delete_existing()
+        for _ in range(3):
+            loader.load([Document(page_content='text', metadata={'source': 'a'})],
+                        np.array([[0.5, 1.0]], dtype=np.float32))
+        connection.commit.assert_not_called()
+        loader.finish()
+        self.assertEqual(events, ['commit', 'bump'])
+        store.engine_pool.engine.raw_connection.assert_called_once_with()
+        connection.close.assert_called_once_with()
+
+    def test_pgvector_load_leaves_index_being_built(self):
+        store = MagicMock()
+        store.EmbeddingStore.__tablename__ = 'langchain_pg_embedding'
+        store.collection_id = uuid.UUID(int=1)
+        store.index_type = 'hnsw'
+        store.build_index.side_effect = IndexBuildInProgress('busy')
+        loader = PgVectorCopyLoader(store)
+        loader.load([Document(page_content='text', metadata={'source': 'a'})],
+                    np.array([[0.5, 1.0]], dtype=np.float32))
+        loader.finish()
+        store.engine_pool.engine.raw_connection.return_value.commit.assert_called_once_with()
+        store.bump_collection_version.assert_called_once_with()
+
+    def test_failed_replacing_pgvector_load_rolls_back(self):
+        store = MagicMock()
+        store.EmbeddingStore.__tablename__ = 'langchain_pg_embedding'
+        store.collection_id = uuid.UUID(int=1)
+        connection = store.engine_pool.engine.raw_connection.return_value
+        loader = PgVectorCopyLoader(store)
+        loader.delete_existing()
+        chunks = [Document(page_content='chunk', metadata={'source': 'a'})]
+        embeddings = MagicMock()
+        embeddings.embed_documents.side_effect = RuntimeError('model failed')
+        with self.assertRaises(RuntimeError):
+            ingest(chunks, loader, 'unused', embeddings=embeddings)
+        connection.rollback.assert_called_once_with()
+        connection.commit.assert_not_called()
+        store.bump_collection_version.assert_not_called()
+
+    def test_incremental_pgvector_load_skips_unchanged_and_deletes_stale(self):
+        unchanged = Document(page_content='unchanged', metadata={'source': 'a'})
+        changed = Document(page_content='changed', metadata={'source': 'b'})
+        store = MagicMock()
+        store.EmbeddingStore.__tablename__ = 'langchain_pg_embedding'
+        store.collection_id = uuid.UUID(int=1)
+        store.index_type = 'hnsw'
+        connection = store.engine_pool.engine.raw_connection.return_value
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.__iter__.return_value = iter([(chunk_id(unchanged),), ('stale',), (None,)])
+        cursor.rowcount = 1
+        loader = PgVectorCopyLoader(store, incremental=True)
+        selected = list(loader.select([unchanged, changed, changed]))
+        self.assertEqual(selected, [changed])
+        loader.finish()
+        deletes = [call.args for call in cursor.execute.call_args_list
+                   if call.args[0].startswith('DELETE')]
+        self.assertEqual(deletes, [
+            ('DELETE FROM langchain_pg_embedding WHERE collection_id = %s AND custom_id IS NULL',
+             (str(uuid.UUID(int=1)),)),
+            ('DELETE FROM langchain_pg_embedding WHERE collection_id = %s AND custom_id = ANY(%s)',
+             (str(uuid.UUID(int=1)), ['stale'])),
+        ])
+        self.assertEqual(loader.stats(), {'skipped': 2, 'deleted': 2})
+        store.build_index.assert_called_once_with(rebuild=False)
+        store.bump_collection_version.assert_called_once_with()
+
+    def test_incremental_pgvector_load_without_changes(self):
+        unchanged = Document(page_content='unchanged', metadata={'source': 'a'})
+        store = MagicMock()
+        store.EmbeddingStore.__tablename__ = 'langchain_pg_embedding'
+        connection = store.engine_pool.engine.raw_connection.return_value
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.__iter__.return_value = iter([(chunk_id(unchanged),)])
+        loader = PgVectorCopyLoader(store, incremental=True)
+        self.assertEqual(list(loader.select([unchanged])), [])
+        loader.finish()
+        store.build_index.assert_not_called()
+        store.bump_collection_version.assert_not_called()
+
+    def test_ingest_into_mmap_index(self):
+        path = os.path.join(self.directory.name, 'index')
+        chunks = [Document(page_content=f'chunk {index}', metadata={'source': str(index)})
+                  for index in range(10)]
+        stats = ingest(chunks, MmapIndexLoader(path), 'unused', batch_size=4,
+                       embeddings=FakeEmbeddings(size=8))
+        self.assertEqual(stats['chunks'], 10)
+        self.assertEqual(stats['batches'], 3)
+        self.assertEqual(stats['embedded'], 10)
+        self.assertGreater(stats['chunks_per_second'], 0)
+        index = MmapVectorIndex(path, 'index')
+        self.assertEqual(index.collection_version(), 1)
+        self.assertEqual(len(index.similarity_search_with_score_by_vector([1.0] * 8, k=20)), 10)
+
+if __name__ == '__main__':
+    unittest.main()
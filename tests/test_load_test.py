@@ -0,0 +1,84 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+from starlette.testclient import TestClient
+
+from src.mmap_index import MmapIndexSnapshot
+from src.scripts.load_test.fake_model_server import FakeModelServer
+from src.scripts.load_test.load_generator import LoadResult, compare_reports, parse_server_timing
+from src.scripts.load_test.load_generator import percentile
+from src.scripts.load_test.stand_in_app import StandInEmbeddings, write_corpus
+
+def make_run(endpoint='ask', concurrency=1, p50=100.0, throughput=10.0, error_rate=0.0):
+    return {'endpoint': endpoint, 'concurrency': concurrency, 'error_rate': error_rate,
+            'throughput_rps': throughput,
+            'latency_ms': {'p50': p50, 'p95': p50 * 2, 'p99': p50 * 3}}
+
+class TestLoadGenerator(unittest.TestCase):
+
+    def test_percentile(self):
+        values = [float(value) for value in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 50.0)
+        self.assertEqual(percentile(values, 99), 99.0)
+        self.assertEqual(percentile([7.0], 95), 7.0)
+        self.assertIsNone(percentile([], 50))
+
+    def test_parse_server_timing(self):
+        self.assertEqual(parse_server_timing('embed;dur=1.5, llm;desc="x";dur=20, total;dur=22'),
+                         {'embed': 1.5, 'llm': 20.0, 'total': 22.0})
+        self.assertEqual(parse_server_timing(''), {})
+
+    def test_summary(self):
+        result = LoadResult()
+        result.add(0.010, 200, 'embed;dur=2.0, total;dur=9.0')
+        result.add(0.030, 200, 'embed;dur=4.0, total;dur=29.0')
+        result.add(0.020, 0)
+        result.seconds = 0.5
+        summary = result.summary()
+        self.assertEqual(summary['requests'], 3)
+        self.assertEqual(summary['errors'], 1)
+        self.assertEqual(summary['status_codes'], {'0': 1, '200': 2})
+        self.assertEqual(summary['throughput_rps'], 6.0)
+        self.assertAlmostEqual(summary['latency_ms']['p50'], 20.0)
+        self.assertAlmostEqual(summary['latency_ms']['p99'], 30.0)
+        self.assertEqual(summary['server_timing_ms'], {'embed': 3.0, 'total': 19.0})
+
+    def test_compare_reports(self):
+        baseline = {'runs': [make_run(), make_run('find_sources')]}
+        report = {'runs': [make_run(p50=105.0, throughput=8.0, error_rate=0.1),
+                           make_run('find_sources', concurrency=8)]}
+        rows = compare_reports(report, baseline, tolerance=0.1)
+        regressions = {row['metric'] for row in rows if row['regression']}
+        self.assertEqual(regressions, {'throughput_rps', 'error_rate'})
+        self.assertEqual({row['endpoint'] for row in rows}, {'ask'})
+
+class TestStandIns(unittest.TestCase):
+
+    def test_fake_model_server(self):
+        server = FakeModelServer(latency_ms=0, tokens=3, tokens_per_second=1000)
+        self.assertAlmostEqual(server.generation_seconds(), 0.002)
+        client = TestClient(server.app())
+        response = client.post('/generate', content=gzip.compress(b'{"text": "prompt"}'),
+                               headers={'Content-Encoding': 'gzip'})
+        self.assertEqual(response.text, '[INST] [/INST] token0 token1 token2')
+        self.assertEqual(client.get('/generate', params={'text': 'prompt'}).status_code, 200)
+        batch = client.post('/generate', content=json.dumps({'texts': ['a', 'b']}))
+        self.assertEqual(len(batch.json()), 2)
+
+    def test_write_corpus(self):
+        with tempfile.TemporaryDirectory() as path:
+            self.assertEqual(write_corpus(path, 25, 8, batch_size=10), 1)
+            snapshot = MmapIndexSnapshot(os.path.join(path, 'v1'))
+            self.assertEqual(snapshot.count, 25)
+            self.assertEqual(snapshot.dimensions, 8)
+
+    def test_stand_in_embeddings_are_deterministic(self):
+        embeddings = StandInEmbeddings(dimensions=4)
+        self.assertEqual(embeddings.embed_query('query'), embeddings.embed_documents(['query'])[0])
+        self.assertEqual(len(embeddings.embed_query('query')), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import json
+import logging
+import queue
+import sys
+import unittest
+from unittest.mock import patch
+
+from src.logging_setup import ColoredFormatter, DroppingQueueHandler, JsonFormatter, truncate
+
+def make_record(message, *args, level=logging.INFO, **extra):
+    record = logging.LogRecord('app', level, __file__, 1, message, args or None, None)
+    record.__dict__.update(extra)
+    return record
+
+class TestLoggingSetup(unittest.TestCase):
+
+    def test_truncate(self):
+        self.assertEqual(truncate('abcdef', 4), 'abcd... [2 more characters]')
+        self.assertEqual(truncate('abcd', 4), 'abcd')
+        self.assertEqual(truncate(12345, 2), 12345)
+
+    def test_json_formatter(self):
+        record = make_record('Query: %s', 'install', request_id='abc')
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry['level'], 'INFO')
+        self.assertEqual(entry['message'], 'Query: install')
+        self.assertEqual(entry['request_id'], 'abc')
+        self.assertNotIn('args', entry)
+
+    def test_json_formatter_includes_exception(self):
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record = logging.LogRecord('app', logging.ERROR, __file__, 1, 'failed', None,
+                                       sys.exc_info())
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertIn('ValueError: boom', entry['exception'])
+
+    @patch('src.logging_setup.colored', side_effect=lambda text, color: f'<{color}>{text}')
+    def test_colored_formatter_only_colors_the_level(self, mock_colored):
+        record = make_record('INFO about INFO')
+        line = ColoredFormatter('%(levelname)s - %(message)s').format(record)
+        self.assertEqual(line, '<green>INFO - INFO about INFO')
+        self.assertEqual(record.levelname, 'INFO')
+
+    def test_queue_handler_truncates_long_arguments(self):
+        handler = DroppingQueueHandler(queue.Queue(), max_arg_length=5)
+        handler.handle(make_record('Prompt: %s', 'x' * 100))
+        record = handler.queue.get_nowait()
+        self.assertEqual(record.getMessage(), 'Prompt: xxxxx... [95 more characters]')
+        self.assertIsNone(record.args)
+
+    def test_queue_handler_truncates_long_messages(self):
+        handler = DroppingQueueHandler(queue.Queue(), max_message_length=5)
+        handler.handle(make_record('%s', ['a'] * 10))
+        self.assertEqual(handler.queue.get_nowait().getMessage(),
+                         "['a',... [45 more characters]")
+
+    def test_queue_handler_drops_when_full(self):
+        handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+        handler.handle(make_record('first'))
+        handler.handle(make_record('second'))
+        handler.handle(make_record('chatter', level=logging.DEBUG))
+        self.assertEqual(handler.dropped, 1)
+        handler.handle(make_record('error', level=logging.ERROR))
+        self.assertEqual(handler.dropped, 2)
+        self.assertEqual([handler.queue.get_nowait().getMessage() for _ in range(2)],
+                         ['second', 'error'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import asyncio
+import unittest
+
+from src.metrics import Counter, Gauge, Histogram, MetricsMiddleware, MetricsRegistry
+from src.metrics import http_requests_in_flight, http_responses_total
+
+class TestMetrics(unittest.TestCase):
+
+    def test_counter_renders_by_label(self):
+        registry = MetricsRegistry()
+        counter = registry.counter('requests_total', 'Requests.', ['status'])
+        counter.inc(status=200)
+        counter.inc(2, status=200)
+        counter.inc(status=500)
+        self.assertEqual(registry.render(), '\n'.join([
+            '# HELP requests_total Requests.',
+            '# TYPE requests_total counter',
+            'requests_total{status="200"} 3.0',
+            'requests_total{status="500"} 1.0',
+        ]) + '\n')
+
+    def test_counter_rejects_decrement_and_wrong_labels(self):
+        counter = Counter('requests_total', 'Requests.', ['status'])
+        with self.assertRaises(ValueError):
+            counter.inc(-1, status=200)
+        with self.assertRaises(ValueError):
+            counter.inc(stage='embedding')
+
+    def test_gauge(self):
+        gauge = Gauge('in_flight', 'In flight.')
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+        self.assertEqual(list(gauge.samples()), [('in_flight', {}, 1.0)])
+        gauge.set(5)
+        self.assertEqual(list(gauge.samples()), [('in_flight', {}, 5)])
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('latency_seconds', 'Latency.', ['stage'], buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value, stage='embedding')
+        samples = [(name, labels.get('le'), value)
+                   for name, labels, value in histogram.samples()]
+        self.assertEqual(samples, [
+            ('latency_seconds_bucket', '0.1', 2),
+            ('latency_seconds_bucket', '1.0', 3),
+            ('latency_seconds_bucket', '+Inf', 4),
+            ('latency_seconds_count', None, 4),
+            ('latency_seconds_sum', None, 2.65),
+        ])
+
+    def test_histogram_time_observes_on_error(self):
+        histogram = Histogram('latency_seconds', 'Latency.', ['stage'])
+        with self.assertRaises(RuntimeError):
+            with histogram.time(stage='language_model'):
+                raise RuntimeError('boom')
+        samples = {name: value for name, _, value in histogram.samples()}
+        self.assertEqual(samples['latency_seconds_count'], 1)
+
+    def test_label_values_are_escaped(self):
+        registry = MetricsRegistry()
+        registry.counter('errors_total', 'Errors.', ['message']).inc(message='say "hi"\n')
+        self.assertIn('errors_total{message="say \\"hi\\"\\n"} 1.0', registry.render())
+
+    def test_collectors_are_rendered(self):
+        registry = MetricsRegistry()
+        registry.add_collector(lambda: [('cache_hits_total', 'counter', 'Hits.',
+                                         [('cache_hits_total', {'cache': 'answer'}, 3)])])
+        self.assertIn('cache_hits_total{cache="answer"} 3.0', registry.render())
+
+    def test_middleware_counts_status_and_in_flight(self):
+        seen = {}
+
+        async def app(_scope, _receive, send):
+            seen['in_flight'] = dict(((), value) for _, _, value in
+                                     http_requests_in_flight.samples())[()]
+            await send({'type': 'http.response.start', 'status': 418})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        async def failing_app(_scope, _receive, _send):
+            raise RuntimeError('boom')
+
+        async def send(_message):
+            pass
+
+        def responses(status):
+            return dict((labels['status'], value) for _, labels, value in
+                        http_responses_total.samples()).get(status, 0)
+
+        before = responses('418'), responses('500')
+        asyncio.run(MetricsMiddleware(app)({'type': 'http'}, None, send))
+        with self.assertRaises(RuntimeError):
+            asyncio.run(MetricsMiddleware(failing_app)({'type': 'http'}, None, send))
+        self.assertGreaterEqual(seen['in_flight'], 1)
+        self.assertEqual((responses('418'), responses('500')), (before[0] + 1, before[1] + 1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import logging
+
+import numpy as np
+from langchain.vectorstores.pgvector import DistanceStrategy
+
+from src.config import Settings
+from src.mmap_index import MmapIndexSnapshot, MmapIndexWriter, MmapVectorIndex, quantize
+from src.mmap_index import read_current_version, write_index
+
+class TestMmapVectorIndex(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger().setLevel(logging.WARNING)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'test_collection')
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(200, 8)).astype(np.float32)
+        self.texts = [f'content_{index}' for index in range(200)]
+        self.metadatas = [{'source': f'source_{index}'} for index in range(200)]
+
+    def write(self, distance_strategy=DistanceStrategy.COSINE, quantization='none'):
+        return write_index(self.path, [
+            (self.texts[:150], self.metadatas[:150], self.vectors[:150].tolist()),
+            (self.texts[150:], self.metadatas[150:], self.vectors[150:].tolist()),
+        ], distance_strategy, quantization)
+
+    def expected(self, query, distances, k):
+        rows = np.argsort(distances, kind='stable')[:k]
+        return [self.texts[row] for row in rows]
+
+    def test_cosine_search_matches_brute_force(self):
+        self.write()
+        index = MmapVectorIndex(self.path, 'test_collection')
+        query = self.vectors[7] + 0.01
+        results = index.similarity_search_with_score_by_vector(query.tolist(), k=5)
+        cosine = 1 - self.vectors @ query / (np.linalg.norm(self.vectors, axis=1)
+                                             * np.linalg.norm(query))
+        self.assertEqual([doc.page_content for doc, _ in results],
+                         self.expected(query, cosine, 5))
+        self.assertEqual(results[0][0].metadata, {'source': 'source_7'})
+        self.assertAlmostEqual(results[0][1], float(np.sort(cosine)[0]), places=5)
+
+    def test_euclidean_batch_search(self):
+        self.write(DistanceStrategy.EUCLIDEAN)
+        index = MmapVectorIndex(self.path, 'test_collection')
+        queries = self.vectors[[3, 190]]
+        results = index.batch_similarity_search_with_score_by_vector(queries.tolist(), k=3)
+        for query, found in zip(queries, results):
+            distances = np.linalg.norm(self.vectors - query, axis=1)
+            self.assertEqual([doc.page_content for doc, _ in found],
+                             self.expected(query, distances, 3))
+
+    def test_k_larger_than_index(self):
+        write_index(self.path, [(self.texts[:2], self.metadatas[:2], self.vectors[:2].tolist())])
+        index = MmapVectorIndex(self.path, 'test_collection')
+        results = index.similarity_search_with_score_by_vector(self.vectors[1].tolist(), k=10)
+        self.assertEqual([doc.page_content for doc, _ in results], ['content_1', 'content_0'])
+
+    def test_missing_index_is_empty(self):
+        index = MmapVectorIndex(self.path, 'test_collection')
+        self.assertEqual(index.collection_version(), 0)
+        self.assertEqual(index.similarity_search_with_score_by_vector([1.0] * 8, k=3), [])
+
+    @patch('src.mmap_index.get_settings', return_value=Settings(retrieval_cache_version_poll=0))
+    def test_new_version_is_picked_up(self, mock_get_settings):
+        self.write()
+        index = MmapVectorIndex(self.path, 'test_collection')
+        self.assertEqual(index.collection_version(), 1)
+        write_index(self.path, [(['replacement'], [{'source': 'new'}], [self.vectors[0].tolist()])])
+        write_index(self.path, [(['latest'], [{'source': 'newest'}], [self.vectors[0].tolist()])])
+        results = index.similarity_search_with_score_by_vector(self.vectors[0].tolist(), k=3)
+        self.assertEqual(index.collection_version(), 3)
+        self.assertEqual([doc.page_content for doc, _ in results], ['latest'])
+        self.assertEqual(sorted(os.listdir(self.path)), ['CURRENT', 'v2', 'v3'])
+
+    def test_failed_write_keeps_current_version(self):
+        self.write()
+        with self.assertRaises(ValueError):
+            with MmapIndexWriter(self.path) as writer:
+                writer.add(['wrong', 'rows'], [{}, {}], [[1.0, 2.0]])
+        self.assertEqual(read_current_version(self.path), 1)
+        self.assertEqual(sorted(os.listdir(self.path)), ['CURRENT', 'v1'])
+
+    def test_quantize_approximates_embeddings(self):
+        norms = np.linalg.norm(self.vectors, axis=1)
+        for quantization in ('float16', 'int8'):
+            codes, scales = quantize(self.vectors, norms, quantization, DistanceStrategy.EUCLIDEAN)
+            np.testing.assert_allclose(codes * scales[:, None], self.vectors, atol=0.02)
+            codes, scales = quantize(self.vectors, norms, quantization, DistanceStrategy.COSINE)
+            self.assertLessEqual(np.abs(codes.astype(np.float32) * (scales / norms)[:, None]).max(),
+                                 1.0 + 1e-3)
+            np.testing.assert_allclose(codes * scales[:, None], self.vectors, atol=0.02)
+
+    def test_quantized_search_rescores_exactly(self):
+        queries = self.vectors[[3, 42, 190]] + 0.05
+        for distance_strategy in DistanceStrategy:
+            for quantization in ('float16', 'int8'):
+                self.write(distance_strategy, 'none')
+                exact = MmapIndexSnapshot(os.path.join(self.path, 'v1'))
+                self.write(distance_strategy, quantization)
+                snapshot = MmapIndexSnapshot(os.path.join(self.path, 'v2'))
+                self.assertEqual(snapshot.quantization, quantization)
+                rows, distances = snapshot.nearest_rows(queries, 5, rescore_factor=4)
+                expected_rows, expected_distances = exact.nearest_rows(queries, 5)
+                np.testing.assert_array_equal(rows, expected_rows)
+                np.testing.assert_allclose(distances, expected_distances, rtol=1e-5, atol=1e-5)
+                os.remove(os.path.join(self.path, 'CURRENT'))
+
+    def test_quantized_index_serves_documents(self):
+        self.write(quantization='int8')
+        index = MmapVectorIndex(self.path, 'test_collection')
+        results = index.similarity_search_with_score_by_vector(self.vectors[7].tolist(), k=2)
+        self.assertEqual(results[0][0].page_content, 'content_7')
+        self.assertAlmostEqual(results[0][1], 0.0, places=5)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.path, 'v1'))),
+                         ['documents.jsonl', 'index.json', 'norms.f32', 'offsets.u64',
+                          'quantized.bin', 'scales.f32', 'vectors.f32'])
+
+    def test_invalid_quantization(self):
+        with self.assertRaises(ValueError):
+            MmapIndexWriter(self.path, quantization='int4')
+
+if __name__ == '__main__':
+    unittest.main()
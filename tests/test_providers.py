@@ -0,0 +1,50 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+from src.config import Settings
+from src.hosted_llm import HostedLLM
+from src.providers import ProviderRegistry, build_hosted_llm_chain
+
+class TestProviderRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.chain = MagicMock()
+        self.builder = MagicMock(return_value=(('hosted', 'Llama2-Hosted', None), self.chain))
+        self.registry = ProviderRegistry(builders={'hosted': self.builder})
+
+    def test_get_chain_builds_once(self):
+        self.assertIs(self.registry.get_chain('hosted'), self.chain)
+        self.assertIs(self.registry.get_chain('hosted'), self.chain)
+        self.builder.assert_called_once_with()
+        self.assertEqual(self.registry.loaded(), {'hosted': ('hosted', 'Llama2-Hosted', None)})
+
+    def test_get_chain_rejects_unknown_provider(self):
+        with self.assertRaises(ValueError):
+            self.registry.get_chain('UNDEFINED')
+
+    @patch('src.providers.reload_settings')
+    def test_reload_rebuilds_chain(self, mock_reload_settings):
+        self.registry.get_chain('hosted')
+        self.registry.reload()
+        mock_reload_settings.assert_called_once_with()
+        self.assertEqual(self.registry.loaded(), {})
+        self.registry.get_chain('hosted')
+        self.assertEqual(self.builder.call_count, 2)
+
+    @patch('src.providers.reload_settings', side_effect=ValueError('Invalid settings'))
+    def test_invalid_reload_keeps_chain(self, mock_reload_settings):
+        self.registry.get_chain('hosted')
+        self.registry.reload()
+        self.assertIs(self.registry.get_chain('hosted'), self.chain)
+        self.builder.assert_called_once_with()
+
+    @patch('src.providers.get_settings',
+           return_value=Settings(hosted_model_uri='http://model-server/generate'))
+    def test_build_hosted_llm_chain(self, mock_settings):
+        key, chain = build_hosted_llm_chain()
+        self.assertEqual(key, ('hosted', 'Llama2-Hosted', None))
+        self.assertIsInstance(chain.llm, HostedLLM)
+        self.assertEqual(chain.llm.uri, 'http://model-server/generate')
+
+if __name__ == '__main__':
+    unittest.main()
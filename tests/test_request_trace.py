@@ -0,0 +1,59 @@
+import asyncio
+import unittest
+
+from src.request_trace import RequestTrace, ServerTimingMiddleware, annotate, current_trace
+from src.request_trace import record_stage, time_stage
+
+class TestRequestTrace(unittest.TestCase):
+
+    def test_stages_are_summed(self):
+        trace = RequestTrace()
+        trace.add_stage('pool_wait', 0.001)
+        trace.add_stage('pool_wait', 0.002)
+        trace.annotate(provider='openai', tokens=12)
+        breakdown = trace.to_dict()
+        self.assertEqual(breakdown['stages'], {'pool_wait': {'ms': 3.0, 'calls': 2}})
+        self.assertEqual((breakdown['provider'], breakdown['tokens']), ('openai', 12))
+
+    def test_server_timing_follows_pipeline_order(self):
+        trace = RequestTrace()
+        trace.add_stage('language_model', 0.5)
+        trace.add_stage('custom', 0.001)
+        trace.add_stage('embedding', 0.0123)
+        header = trace.server_timing()
+        self.assertTrue(header.startswith('embed;dur=12.3, llm;dur=500.0, custom;dur=1.0, '
+                                          'total;dur='))
+
+    def test_recording_outside_a_request_is_ignored(self):
+        self.assertIsNone(current_trace())
+        record_stage('embedding', 0.1)
+        annotate(provider='openai')
+        with time_stage('vector_search'):
+            pass
+
+    def test_middleware_traces_matching_paths(self):
+        messages = []
+        seen = {}
+
+        async def app(scope, _receive, send):
+            seen[scope['path']] = current_trace()
+            with time_stage('vector_search'):
+                pass
+            await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        async def send(message):
+            messages.append(message)
+
+        middleware = ServerTimingMiddleware(app, path_prefix='/v1/')
+        asyncio.run(middleware({'type': 'http', 'path': '/v1/ask'}, None, send))
+        asyncio.run(middleware({'type': 'http', 'path': '/metrics'}, None, send))
+        self.assertIsInstance(seen['/v1/ask'], RequestTrace)
+        self.assertIsNone(seen['/metrics'])
+        self.assertIsNone(current_trace())
+        headers = dict(messages[0]['headers'])
+        self.assertTrue(headers[b'server-timing'].startswith(b'retrieve;dur='))
+        self.assertEqual(messages[2]['headers'], [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from src.single_flight import SingleFlight
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_run_coalesces_concurrent_threads(self):
+        flight = SingleFlight()
+        calls = []
+
+        def search(query):
+            calls.append(query)
+            time.sleep(0.2)
+            return f'result for {query}'
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: flight.run('key', search, 'query'), range(8)))
+        self.assertEqual(results, ['result for query'] * 8)
+        self.assertEqual(calls, ['query'])
+        self.assertEqual(flight.stats(), {'in_flight': 0, 'calls': 1, 'coalesced': 7})
+
+    def test_run_shares_exceptions_and_forgets_finished_calls(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError('failed')
+
+        with self.assertRaises(ValueError):
+            flight.run('key', fail)
+        self.assertEqual(flight.run('key', lambda: 'retried'), 'retried')
+
+    def test_arun_coalesces_concurrent_coroutines(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def generate(query):
+            calls.append(query)
+            await asyncio.sleep(0.05)
+            return f'answer for {query}'
+
+        async def ask():
+            return await asyncio.gather(*[flight.arun('key', generate, 'query') for _ in range(5)],
+                                        flight.arun('other key', generate, 'other query'))
+
+        results = asyncio.run(ask())
+        self.assertEqual(results, ['answer for query'] * 5 + ['answer for other query'])
+        self.assertEqual(calls, ['query', 'other query'])
+
+    def test_arun_survives_cancelled_leader(self):
+        flight = SingleFlight()
+
+        async def generate():
+            await asyncio.sleep(0.05)
+            return 'answer'
+
+        async def ask():
+            leader = asyncio.ensure_future(flight.arun('key', generate))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(flight.arun('key', generate))
+            await asyncio.sleep(0)
+            leader.cancel()
+            return await follower
+
+        self.assertEqual(asyncio.run(ask()), 'answer')
+
+    def test_arun_waits_for_threadpool_call(self):
+        flight = SingleFlight()
+        started = threading.Event()
+
+        def search():
+            started.set()
+            time.sleep(0.1)
+            return 'result'
+
+        async def generate():
+            return 'not coalesced'
+
+        async def ask():
+            loop = asyncio.get_running_loop()
+            leader = loop.run_in_executor(None, flight.run, 'key', search)
+            await loop.run_in_executor(None, started.wait)
+            return await asyncio.gather(leader, flight.arun('key', generate))
+
+        self.assertEqual(asyncio.run(ask()), ['result', 'result'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+from multiprocessing import Process
+from concurrent.futures import ThreadPoolExecutor
+
+from src.spend_ledger import SpendLedger
+
+def record_costs(path, count):
+    ledger = SpendLedger(path)
+    for _ in range(count):
+        ledger.record(0.25)
+
+class TestSpendLedger(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'spend.db')
+
+    def test_record_and_total(self):
+        ledger = SpendLedger(self.path)
+        self.assertEqual(ledger.total(), 0.0)
+        self.assertEqual(ledger.record(0.5), 0.5)
+        self.assertEqual(ledger.record(0.25), 0.75)
+        self.assertEqual(SpendLedger(self.path).total(), 0.75)
+
+    def test_imports_legacy_log_once(self):
+        legacy_log_file = os.path.join(self.directory.name, 'spend.log')
+        with open(legacy_log_file, 'w', encoding='utf-8') as file:
+            file.write('0.50000\n0.25000\n')
+        self.assertEqual(SpendLedger(self.path, legacy_log_file=legacy_log_file).total(), 0.75)
+        self.assertEqual(SpendLedger(self.path, legacy_log_file=legacy_log_file).total(), 0.75)
+
+    def test_compaction_keeps_total(self):
+        ledger = SpendLedger(self.path, keep_entries=4)
+        for _ in range(10):
+            ledger.record(0.5)
+        self.assertEqual(ledger.total(), 5.0)
+        entries = ledger._connect().execute('SELECT COUNT(*) FROM spend_entries').fetchone()[0]
+        self.assertLessEqual(entries, 8)
+
+    def test_concurrent_threads(self):
+        ledger = SpendLedger(self.path)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: ledger.record(0.25), range(200)))
+        self.assertEqual(ledger.total(), 50.0)
+
+    def test_concurrent_processes(self):
+        processes = [Process(target=record_costs, args=(self.path, 50)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(SpendLedger(self.path).total(), 50.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+import logging
+
+import uuid
+
+import sqlalchemy
+from langchain.embeddings.fake import FakeEmbeddings
+
+from src.config import Settings
+from src.scripts import rebuild_vector_index
+from src.vector_store import EnginePool, IndexBuildInProgress, PooledPGVector, SearchParams
+from src.vector_store import VectorStoreRegistry
+
+class TestEnginePool(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger().setLevel(logging.WARNING)
+        handle, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.pool = EnginePool(f'sqlite:///{self.db_path}')
+
+    def tearDown(self):
+        self.pool.dispose()
+        os.remove(self.db_path)
+
+    def test_session_records_checkout(self):
+        with self.pool.session() as session:
+            self.assertEqual(session.execute(sqlalchemy.text('SELECT 1')).scalar(), 1)
+            self.assertEqual(self.pool.stats()['checked_out'], 1)
+        stats = self.pool.stats()
+        self.assertEqual(stats['checked_out'], 0)
+        self.assertEqual(stats['checkouts'], 1)
+        self.assertGreaterEqual(stats['checkout_wait_max_seconds'], 0)
+
+class TestPooledPGVectorIndex(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger().setLevel(logging.WARNING)
+        self.pool = MagicMock(connection_string='postgresql://test')
+
+    def make_store(self, index_type):
+        with patch('src.vector_store.get_settings',
+                   return_value=Settings(vector_index_type=index_type)):
+            store = PooledPGVector(self.pool, 'test_collection', FakeEmbeddings(size=4))
+        store.collection_id = uuid.UUID('12345678123456781234567812345678')
+        return store
+
+    def test_vector_cast_matches_index(self):
+        store = self.make_store('hnsw')
+        self.assertEqual(store.index_name('hnsw'),
+                         'deep_thought_12345678123456781234567812345678_hnsw')
+        self.assertEqual(store._vector('embedding'), 'CAST(embedding AS vector)')
+        store.index_dimensions = 384
+        self.assertEqual(store._vector('embedding'), 'CAST(embedding AS vector(384))')
+
+    def test_hnsw_ef_search_is_at_least_k(self):
+        store = self.make_store('hnsw')
+        store.index_dimensions = 384
+        session = MagicMock()
+        store._apply_search_params(session, 100, SearchParams(ef_search=50))
+        self.assertEqual(session.execute.call_args[0][1],
+                         {'setting': 'hnsw.ef_search', 'value': '100'})
+        store._apply_search_params(session, 5, SearchParams(ef_search=5000))
+        self.assertEqual(session.execute.call_args[0][1]['value'], '1000')
+
+    def test_ivfflat_probes(self):
+        store = self.make_store('ivfflat')
+        session = MagicMock()
+        store._apply_search_params(session, 5, SearchParams(probes=10))
+        session.execute.assert_not_called()
+        store.index_dimensions = 384
+        store._apply_search_params(session, 5, SearchParams(probes=10))
+        self.assertEqual(session.execute.call_args[0][1],
+                         {'setting': 'ivfflat.probes', 'value': '10'})
+
+    @patch('src.vector_store.metadata')
+    def test_prepare_does_not_build_index(self, mock_metadata):
+        store = self.make_store('hnsw')
+        store.collection_id = None
+        collection = MagicMock(uuid=uuid.uuid4())
+        with patch.object(store, 'create_tables_if_not_exists'), \
+                patch.object(store, 'create_collection'), \
+                patch.object(store, 'get_collection', return_value=collection), \
+                patch.object(store, 'load_index_state') as mock_load_index_state, \
+                patch.object(store, 'build_index') as mock_build_index:
+            store.prepare()
+        self.assertEqual(store.collection_id, collection.uuid)
+        mock_load_index_state.assert_called_once()
+        mock_build_index.assert_not_called()
+
+    def test_build_index_leaves_index_being_built(self):
+        store = self.make_store('hnsw')
+        connection = self.pool.engine.connect.return_value.__enter__.return_value
+        connection = connection.execution_options.return_value
+        with patch.object(store, 'embedding_dimensions', return_value=384), \
+                patch.object(PooledPGVector, '_index_build_in_progress', return_value=True):
+            with self.assertRaises(IndexBuildInProgress):
+                store.build_index()
+        connection.execute.assert_not_called()
+
+    @patch('src.scripts.rebuild_vector_index.get_collection_store')
+    @patch('src.scripts.rebuild_vector_index.parse_args')
+    def test_rebuild_script_fails_when_build_in_progress(self, mock_parse_args,
+                                                         mock_get_collection_store):
+        mock_parse_args.return_value = MagicMock(collection='test_collection', index_type='hnsw',
+                                                 create_only=False)
+        store = mock_get_collection_store.return_value
+        store.build_index.side_effect = IndexBuildInProgress('busy')
+        with patch('builtins.print') as mock_print:
+            self.assertEqual(rebuild_vector_index.main(), 1)
+        mock_print.assert_called_once_with(
+            'test_collection: index build in progress in another session')
+        store.bump_collection_version.assert_not_called()
+
+class TestVectorStoreRegistry(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger().setLevel(logging.WARNING)
+
+    @patch('src.vector_store.PooledPGVector')
+    @patch('src.vector_store.EnginePool')
+    def test_get_store_reuses_pool_and_store(self, MockEnginePool, MockPooledPGVector):
+        MockPooledPGVector.return_value.is_prepared = False
+        registry = VectorStoreRegistry()
+        first = registry.get_store('postgresql://test', 'test_collection', None)
+        second = registry.get_store('postgresql://test', 'test_collection', None)
+        registry.get_store('postgresql://test', 'other_collection', None)
+        self.assertIs(first, second)
+        MockEnginePool.assert_called_once_with('postgresql://test')
+        self.assertEqual(MockPooledPGVector.call_count, 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,16 +1,27 @@
+import asyncio
+import json
+import threading
 import unittest
 from unittest.mock import patch
 from fastapi.testclient import TestClient
+from langchain.chains import LLMChain
+from langchain.llms.fake import FakeListLLM
+from langchain.prompts import PromptTemplate
 import logging
 
-from src.v1.endpoints import router, call_language_model, get_bot_response
+from src.v1.endpoints import router, call_language_model, get_bot_response, aget_bot_response
 from src.v1.endpoints import token_cost, calculate_total_spent, spend_limit_exceeded
+from src.v1.endpoints import acall_openai, astream_language_model, answer_cache
+from src.config import Settings
+from src.metrics import language_model_errors
+from src.vector_store import SearchParams
 
 class TestMain(unittest.TestCase):
 
     def setUp(self):
         self.app = TestClient(router)
         logging.getLogger().setLevel(logging.WARNING)
+        answer_cache.clear()
 
     #TODO
     def test_call_vertexai(self):
@@ -36,7 +47,14 @@ class TestMain(unittest.TestCase):
         response = get_bot_response('other_input')
         self.assertEqual(response, 'Language model response')
 
-    @patch('src.v1.endpoints.get_bot_response')
+    @patch('src.v1.endpoints.acall_language_model')
+    def test_aget_bot_response_other(self, mock_acall_language_model):
+        mock_acall_language_model.return_value = 'Language model response'
+        response = asyncio.run(aget_bot_response('other_input'))
+        self.assertEqual(response, 'Language model response')
+        mock_acall_language_model.assert_awaited_once_with('other_input')
+
+    @patch('src.v1.endpoints.aget_bot_response')
     def test_handle_request_post(self, mock_get_bot_response):
         mock_get_bot_response.return_value = 'Bot response'
         response = self.app.post('/', json={'user_input': 'test_input'})
@@ -49,18 +67,131 @@ class TestMain(unittest.TestCase):
         response = self.app.post('/find_sources', json={'query': 'test_query', 'num_results': 5})
         self.assertEqual(response.json(), {'find_sources': 'Test response'})
 
-    @patch('src.v1.endpoints.call_language_model')
+    @patch('src.v1.endpoints.EmbeddingSource')
+    def test_find_sources_batch(self, MockEmbeddingSource):
+        mock_get_source = MockEmbeddingSource.return_value.get_source
+        mock_get_source.return_value = [['First response'], ['Second response']]
+        response = self.app.post('/find_sources', json={'query': ['first', 'second'],
+                                                        'num_results': 1})
+        self.assertEqual(response.json(), {'find_sources': [['First response'],
+                                                            ['Second response']]})
+        mock_get_source.assert_called_once_with(['first', 'second'], 1, SearchParams())
+
+    @patch('src.v1.endpoints.EmbeddingSource')
+    def test_find_sources_search_params(self, MockEmbeddingSource):
+        mock_get_source = MockEmbeddingSource.return_value.get_source
+        mock_get_source.return_value = ['Test response']
+        response = self.app.post('/find_sources', json={'query': 'test_query', 'num_results': 5,
+                                                        'ef_search': 200})
+        self.assertEqual(response.status_code, 200)
+        mock_get_source.assert_called_once_with('test_query', 5, SearchParams(ef_search=200))
+
+    @patch('src.v1.endpoints.acall_language_model')
     @patch('src.v1.endpoints.EmbeddingSource')
     def test_ask(self, MockEmbeddingSource, mock_call_language_model):
+        MockEmbeddingSource.return_value.get_database.return_value.collection_version.return_value = 0
+        MockEmbeddingSource.return_value.embed_query.return_value = [1.0, 0.0]
         mock_get_source = MockEmbeddingSource.return_value.get_source
         mock_get_source.return_value = [{'source': 'test_source', 'content': 'test_content'}]
         mock_call_language_model.return_value = 'Language model response'
         response = self.app.post('/ask', json={'query': 'test_query', 'num_results': 5})
         self.assertEqual(response.json(), {'bot_response': 'Language model response\n\nPossibly Related Sources:\n<a href="#">test_source</a>'})
 
+    @patch('src.v1.endpoints.acall_language_model')
+    @patch('src.v1.endpoints.EmbeddingSource')
+    def test_ask_reuses_answer_to_similar_query(self, MockEmbeddingSource,
+                                                mock_call_language_model):
+        mock_embedding_source = MockEmbeddingSource.return_value
+        mock_embedding_source.get_source.return_value = [
+            {'source': 'test_source', 'content': 'test_content'}]
+        mock_embedding_source.get_database.return_value.collection_name = 'test_collection'
+        mock_embedding_source.get_database.return_value.collection_version.return_value = 1
+        mock_embedding_source.embed_query.side_effect = lambda query: {
+            'install an operator': [1.0, 0.0],
+            'how do I install operators': [0.99, 0.1],
+            'uninstall an operator': [0.0, 1.0],
+        }[query]
+        mock_call_language_model.return_value = 'Language model response'
+        first = self.app.post('/ask', json={'query': 'install an operator', 'num_results': 5})
+        second = self.app.post('/ask', json={'query': 'how do I install operators',
+                                             'num_results': 5})
+        self.assertEqual(first.json(), second.json())
+        mock_call_language_model.assert_called_once()
+        self.app.post('/ask', json={'query': 'uninstall an operator', 'num_results': 5})
+        self.assertEqual(mock_call_language_model.call_count, 2)
+
+    @patch('src.v1.endpoints.astream_language_model')
+    @patch('src.v1.endpoints.EmbeddingSource')
+    def test_ask_stream(self, MockEmbeddingSource, mock_astream_language_model):
+        async def tokens(prompt):
+            yield 'Language '
+            yield 'model response'
+        mock_astream_language_model.side_effect = tokens
+        mock_get_source = MockEmbeddingSource.return_value.get_source
+        mock_get_source.return_value = [{'source': 'test_source', 'content': 'test_content'}]
+        response = self.app.post('/ask/stream', json={'query': 'test_query', 'num_results': 5})
+        self.assertEqual(response.headers['content-type'], 'text/event-stream; charset=utf-8')
+        events = [event.split('\n', 1) for event in response.text.strip().split('\n\n')]
+        self.assertEqual([name for name, _ in events],
+                         ['event: sources', 'event: token', 'event: token', 'event: token',
+                          'event: done'])
+        self.assertEqual(json.loads(events[0][1][len('data: '):]),
+                         [{'source': 'test_source', 'source_link': '#', 'score': None}])
+        text = ''.join(json.loads(data[len('data: '):])['text'] for name, data in events[1:4])
+        self.assertEqual(text, 'Language model response\n\nPossibly Related Sources:\n'
+                               '<a href="#">test_source</a>')
+
+    @patch('src.v1.endpoints.language_model_chain')
+    def test_astream_language_model_falls_back_without_streaming(self, mock_language_model_chain):
+        mock_language_model_chain.return_value = LLMChain(
+            llm=FakeListLLM(responses=['Whole response']),
+            prompt=PromptTemplate(input_variables=['input_val'], template='{input_val}'))
+
+        async def collect():
+            return [chunk async for chunk in astream_language_model('prompt')]
+
+        self.assertEqual(asyncio.run(collect()), ['Whole response'])
+
+    @patch('src.v1.endpoints.token_cost')
+    @patch('src.v1.endpoints.spend_limit_exceeded')
+    @patch('src.v1.endpoints.language_model_chain')
+    def test_acall_openai_uses_spend_ledger_off_event_loop(self, mock_language_model_chain,
+                                                          mock_spend_limit_exceeded,
+                                                          mock_token_cost):
+        mock_language_model_chain.return_value = LLMChain(
+            llm=FakeListLLM(responses=['OpenAI response']),
+            prompt=PromptTemplate(input_variables=['input_val'], template='{input_val}'))
+        threads = []
+        mock_spend_limit_exceeded.side_effect = lambda: threads.append(
+            threading.current_thread()) or False
+        mock_token_cost.side_effect = lambda tokens: threads.append(threading.current_thread())
+        self.assertEqual(asyncio.run(acall_openai('prompt')), 'OpenAI response')
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.main_thread(), threads)
+
+    @patch('src.v1.endpoints.spend_ledger')
+    @patch('src.v1.endpoints.get_settings', return_value=Settings(openai_model_price=0.5))
+    def test_token_cost_records_spend(self, mock_settings, mock_spend_ledger):
+        mock_spend_ledger.record.return_value = 3.0
+        response = token_cost(2)
+        mock_spend_ledger.record.assert_called_once_with(1.0)
+        self.assertEqual(json.loads(response.body)['total_spent'], '$3.00000')
+
+    @patch('src.v1.endpoints.call_openai', side_effect=RuntimeError('boom'))
+    @patch('src.v1.endpoints.get_settings', return_value=Settings(model_provider='openai'))
+    def test_call_language_model_counts_errors(self, mock_settings, mock_call_openai):
+        def errors():
+            return {labels['provider']: value
+                    for _, labels, value in language_model_errors.samples()}.get('openai', 0)
+
+        before = errors()
+        with self.assertRaises(RuntimeError):
+            call_language_model('prompt')
+        self.assertEqual(errors(), before + 1)
+
     @patch('src.v1.endpoints.calculate_total_spent', return_value=0.0005)
-    @patch('src.v1.endpoints.config.get', side_effect=lambda x, y: '0.001' if x == 'SPEND_LIMIT' else y)
-    def test_spend_limit_exceeded(self, mock_config, mock_total_spent):
+    @patch('src.v1.endpoints.get_settings', return_value=Settings(spend_limit=0.001))
+    def test_spend_limit_exceeded(self, mock_settings, mock_total_spent):
         result = spend_limit_exceeded()
         self.assertEqual(result, False)
 